@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Simulate a fleet of machines against the webserver.
+
+Serves a scratch DB with bin/parentopticon-serve, then runs three kinds
+of actors in threads for a fixed time:
+
+	daemons, which run the Client loop with made up snapshots,
+	browsers, which POST the visits the browser extension reports,
+	viewers, which load the dashboard pages.
+
+Each actor waits a jittered interval between rounds. Reports the
+requests per second and p50/p99 latency of each endpoint.
+"""
+import argparse
+import collections
+import random
+import statistics
+import tempfile
+import threading
+import time
+from typing import Callable, List
+
+import requests
+
+from parentopticon import client as client_module
+
+import load
+
+PAGES = ("/", "/config", "/config/program")
+WORDS = ("news", "video", "game", "school", "math", "wiki", "music", "shop", "mail", "docs")
+
+class Recorder:
+	"Collects latencies and errors by endpoint, from many threads."
+	def __init__(self) -> None:
+		self.errors = collections.Counter()
+		self.latencies = collections.defaultdict(list)
+		self.lock = threading.Lock()
+
+	def time(self, endpoint: str, func: Callable[[], bool]) -> None:
+		"Time a call, which returns whether it worked."
+		start = time.perf_counter()
+		try:
+			ok = func()
+		except (client_module.SkipLoop, requests.exceptions.RequestException):
+			ok = False
+		elapsed = time.perf_counter() - start
+		with self.lock:
+			self.latencies[endpoint].append(elapsed)
+			if not ok:
+				self.errors[endpoint] += 1
+
+	def report(self, seconds: float) -> None:
+		print("{:<20} {:>9} {:>9} {:>9} {:>9} {:>7}".format(
+			"endpoint", "requests", "req/s", "p50 ms", "p99 ms", "errors"))
+		for endpoint, latencies in sorted(self.latencies.items()):
+			print("{:<20} {:>9} {:>9.1f} {:>9.2f} {:>9.2f} {:>7}".format(
+				endpoint,
+				len(latencies),
+				len(latencies) / seconds,
+				_percentile(latencies, 50) * 1000,
+				_percentile(latencies, 99) * 1000,
+				self.errors[endpoint],
+			))
+
+def browser(host: str, number: int, recorder: Recorder, interval: float, deadline: float) -> None:
+	"Report visits to made up URLs like the browser extension."
+	session = requests.Session()
+	while _wait(interval, deadline):
+		url = "https://{}.example.com/{}/{}".format(
+			random.choice(WORDS), random.choice(WORDS), random.randrange(1000))
+		recorder.time("/website", lambda: session.post(host + "/website", json={
+			"hostname": "host{}".format(number),
+			"incognito": False,
+			"url": url,
+			"username": "user{}".format(number),
+		}).ok)
+
+def daemon(host: str, number: int, recorder: Recorder, interval: float, deadline: float) -> None:
+	"Run the daemon's loop with made up snapshots."
+	client = client_module.Client(host)
+	client.hostname = "host{}".format(number)
+	client.username = "user{}".format(number)
+	running = {}
+	while _wait(interval, deadline):
+		processes = {}
+		def get_processes():
+			processes.update(client.get_processes_and_programs())
+			return True
+		recorder.time("/program-by-process", get_processes)
+		# Programs start and stop now and then, like they would on a real machine.
+		if processes and random.random() < 0.1:
+			process = random.choice(sorted(processes))
+			pid = random.randrange(1000, 60000)
+			running = {} if running else {pid: processes[process]}
+		def post_programs():
+			client.post_programs(running, int(interval))
+			return True
+		recorder.time("/snapshot", post_programs)
+		recorder.time("/action", lambda: client.get_actions() is not None)
+
+def viewer(host: str, number: int, recorder: Recorder, interval: float, deadline: float) -> None:
+	"Load the dashboard pages."
+	session = requests.Session()
+	while _wait(interval, deadline):
+		page = random.choice(PAGES)
+		recorder.time(page, lambda: session.get(host + page).ok)
+
+def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("-d", "--daemons", type=int, default=50, help="Daemons to simulate")
+	parser.add_argument("-b", "--browsers", type=int, default=20, help="Browsers to simulate")
+	parser.add_argument("-v", "--viewers", type=int, default=2, help="Dashboard viewers to simulate")
+	parser.add_argument("-i", "--interval", type=float, default=1.0, help="Seconds between each actor's rounds")
+	parser.add_argument("-s", "--seconds", type=float, default=20, help="How long to run")
+	parser.add_argument("-w", "--workers", type=int, default=1, help="Webserver worker processes")
+	args = parser.parse_args()
+
+	actors = (
+		(daemon, args.daemons),
+		(browser, args.browsers),
+		(viewer, args.viewers),
+	)
+	recorder = Recorder()
+	with tempfile.TemporaryDirectory() as directory, load.serving(args.workers, directory) as port:
+		host = "http://127.0.0.1:{}".format(port)
+		deadline = time.monotonic() + args.seconds
+		threads = [
+			threading.Thread(target=actor, args=(host, number, recorder, args.interval, deadline))
+			for actor, count in actors
+			for number in range(count)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+	print("{} daemons, {} browsers, {} viewers, {} workers, {} seconds".format(
+		args.daemons, args.browsers, args.viewers, args.workers, args.seconds))
+	recorder.report(args.seconds)
+
+def _percentile(values: List[float], percent: int) -> float:
+	if len(values) < 2:
+		return values[0]
+	return statistics.quantiles(values, n=100)[percent - 1]
+
+def _wait(interval: float, deadline: float) -> bool:
+	"Sleep for about an interval, return whether there is time for another round."
+	time.sleep(interval * random.uniform(0.5, 1.5))
+	return time.monotonic() < deadline
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Benchmark limit evaluation over a year of session history.
+
+Compares the limit evaluator, which reads the usage timeline, against
+scanning every session and filtering it once per period.
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+from typing import Callable
+
+from parentopticon.db import limits, timeline
+from parentopticon.db.connection import Connection
+from parentopticon.db.tables import create_all, Program, ProgramGroup, ProgramSession
+
+SESSIONS_PER_DAY = 4
+SESSION_MINUTES = 30
+
+def populate(connection: Connection, days: int, today: datetime.date) -> ProgramGroup:
+	"Fill the DB with a few sessions every day for a number of days."
+	group_id = ProgramGroup.insert(connection,
+		minutes_monday=60,
+		minutes_tuesday=60,
+		minutes_wednesday=60,
+		minutes_thursday=60,
+		minutes_friday=60,
+		minutes_saturday=120,
+		minutes_sunday=120,
+		minutes_weekly=600,
+		minutes_monthly=2400,
+		name="games",
+	)
+	program_id = Program.insert(connection, name="Minecraft", program_group=group_id)
+	for offset in range(days):
+		day = today - datetime.timedelta(days=offset)
+		for i in range(SESSIONS_PER_DAY):
+			start = datetime.datetime.combine(day, datetime.time(hour=9 + i * 2))
+			end = start + datetime.timedelta(minutes=SESSION_MINUTES)
+			ProgramSession.insert(connection,
+				end=end,
+				hostname="benchhost",
+				last_seen=end,
+				pids="",
+				program=program_id,
+				start=start,
+				username="benchuser",
+			)
+			timeline.record(connection, "benchuser", group_id, start, end)
+	return ProgramGroup.get(connection, group_id)
+
+def scan_sessions(connection: Connection, program_group: ProgramGroup, today: datetime.date) -> float:
+	"Evaluate limits the old way, filtering every session once per period."
+	sessions = list(ProgramSession.list(connection, username="benchuser"))
+	week_start = today - datetime.timedelta(days=today.isoweekday() - 1)
+	month_start = today.replace(day=1)
+	def total(matching):
+		return sum((s.end - s.start).total_seconds() / 60 for s in matching)
+	used_today = total(s for s in sessions if s.start.date() == today)
+	used_week = total(s for s in sessions if week_start <= s.start.date() <= today)
+	used_month = total(s for s in sessions if month_start <= s.start.date() <= today)
+	return min(
+		program_group.minutes_sunday - used_today,
+		program_group.minutes_weekly - used_week,
+		program_group.minutes_monthly - used_month,
+	)
+
+def evaluator(connection: Connection, program_group: ProgramGroup, today: datetime.date) -> float:
+	"Evaluate limits from the usage timeline."
+	return limits.minutes_remaining(limits.evaluate(connection, "benchuser", program_group, today=today))
+
+def measure(name: str, func: Callable[[], float], iterations: int) -> None:
+	start = time.perf_counter()
+	for _ in range(iterations):
+		result = func()
+	elapsed = time.perf_counter() - start
+	print("{:<16} {:>10.3f} ms/call  (result {})".format(
+		name, elapsed * 1000 / iterations, result))
+
+def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("-d", "--days", type=int, default=365, help="Days of history to generate")
+	parser.add_argument("-i", "--iterations", type=int, default=50, help="Evaluations to time")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		connection = Connection()
+		connection.connect(os.path.join(directory, "bench.sqlite"))
+		create_all(connection)
+		# A Sunday, so the week, month and daily limit are all in play.
+		today = datetime.date(2020, 3, 1)
+		program_group = populate(connection, args.days, today)
+		print("{} days, {} sessions".format(args.days, args.days * SESSIONS_PER_DAY))
+		measure("session scan", lambda: scan_sessions(connection, program_group, today), args.iterations)
+		measure("evaluator", lambda: evaluator(connection, program_group, today), args.iterations)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Load test the webserver with different numbers of worker processes.
+
+Starts bin/parentopticon-serve on a scratch DB for each worker count and
+has client processes send the requests a fleet of daemons sends, client
+program lookups, snapshots and action polls, for a fixed time.
+"""
+import argparse
+import contextlib
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Iterator
+
+from parentopticon.db import migrations
+from parentopticon.db.connection import Connection
+from parentopticon.db.tables import Program, ProgramGroup
+
+PROGRAMS = ("minecraft", "steam")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def client(port: int, number: int, seconds: float, results: multiprocessing.Queue) -> None:
+	"Send requests as one user until time is up, put the count in results."
+	connection = http.client.HTTPConnection("127.0.0.1", port)
+	username = "user{}".format(number)
+	snapshot = json.dumps({
+		"hostname": "host{}".format(number),
+		"programs": {str(100 + i): name for i, name in enumerate(PROGRAMS)},
+		"username": username,
+	})
+	requests = (
+		("GET", "/program-by-process", None),
+		("POST", "/snapshot", snapshot),
+		("GET", "/action?hostname=host{}&username={}".format(number, username), None),
+	)
+	count = 0
+	errors = 0
+	deadline = time.monotonic() + seconds
+	while time.monotonic() < deadline:
+		method, path, body = requests[count % len(requests)]
+		connection.request(method, path, body=body)
+		response = connection.getresponse()
+		response.read()
+		count += 1
+		if response.status >= 500:
+			errors += 1
+	results.put((count, errors))
+
+def free_port() -> int:
+	with socket.socket() as sock:
+		sock.bind(("127.0.0.1", 0))
+		return sock.getsockname()[1]
+
+def populate(path: str) -> None:
+	"Create a DB with the programs that clients report."
+	connection = Connection()
+	connection.connect(path)
+	migrations.migrate(connection)
+	group_id = ProgramGroup.insert(connection,
+		minutes_monday=60,
+		minutes_tuesday=60,
+		minutes_wednesday=60,
+		minutes_thursday=60,
+		minutes_friday=60,
+		minutes_saturday=120,
+		minutes_sunday=120,
+		minutes_weekly=600,
+		minutes_monthly=2400,
+		name="games",
+	)
+	for name in PROGRAMS:
+		Program.insert(connection, name=name, program_group=group_id)
+
+def run(workers: int, clients: int, seconds: float, directory: str) -> None:
+	"Serve with a number of workers and print the throughput."
+	with serving(workers, directory) as port:
+		results = multiprocessing.Queue()
+		processes = [
+			multiprocessing.Process(target=client, args=(port, i, seconds, results))
+			for i in range(clients)]
+		for process in processes:
+			process.start()
+		counts = [results.get() for _ in processes]
+		for process in processes:
+			process.join()
+		total = sum(count for count, _ in counts)
+		errors = sum(error for _, error in counts)
+		print("{:>2} workers {:>9.0f} req/s  ({} requests, {} errors)".format(
+			workers, total / seconds, total, errors))
+
+@contextlib.contextmanager
+def serving(workers: int, directory: str) -> Iterator[int]:
+	"Serve a fresh DB in directory while in the context, give the port."
+	config = os.path.join(directory, "config-{}.toml".format(workers))
+	database = os.path.join(directory, "load-{}.sqlite".format(workers))
+	populate(database)
+	with open(config, "w") as output:
+		output.write('database = "{}"\nsecret_key = "load"\n'.format(database))
+	port = free_port()
+	server = subprocess.Popen(
+		[sys.executable, os.path.join(ROOT, "bin", "parentopticon-serve"),
+			"-c", config, "-H", "127.0.0.1", "-p", str(port), "-w", str(workers)],
+		cwd=ROOT,
+		env=dict(os.environ, PYTHONPATH=ROOT),
+		stdout=subprocess.DEVNULL,
+		stderr=subprocess.DEVNULL,
+	)
+	try:
+		_wait_for(port)
+		yield port
+	finally:
+		server.terminate()
+		server.wait()
+
+def _wait_for(port: int, timeout: float = 20) -> None:
+	deadline = time.monotonic() + timeout
+	while time.monotonic() < deadline:
+		try:
+			connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+			connection.request("GET", "/program-by-process")
+			if connection.getresponse().status == 200:
+				return
+		except OSError:
+			pass
+		time.sleep(0.2)
+	raise Exception("Server on port {} never started".format(port))
+
+def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("-c", "--clients", type=int, default=8, help="Client processes to run")
+	parser.add_argument("-s", "--seconds", type=float, default=10, help="How long to send requests")
+	parser.add_argument("-w", "--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to try")
+	args = parser.parse_args()
+
+	print("{} clients for {} seconds on {} CPUs".format(args.clients, args.seconds, os.cpu_count()))
+	with tempfile.TemporaryDirectory() as directory:
+		for workers in args.workers:
+			run(workers, args.clients, args.seconds, directory)
+
+if __name__ == "__main__":
+	main()
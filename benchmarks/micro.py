@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks of the code on the path of every snapshot.
+
+Times snapshot.take, with psutil and with a procfs Snapshotter, queries.snapshot_store, queries.user_to_status and
+Model.list_where against a scratch DB. Each benchmark runs a few rounds
+and keeps the fastest, which is the least disturbed by everything else
+running on the machine.
+
+Results are compared to benchmarks/baselines.json, saved with --save on
+a known good tree. The exit status is 1 when anything got slower than
+the tolerance allows.
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Mapping
+
+from parentopticon import procfs, snapshot
+from parentopticon.db import queries
+from parentopticon.db.connection import Connection
+from parentopticon.db.tables import create_all, Program, ProgramGroup, ProgramSession
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+PROGRAMS = ("chrome", "discord", "minecraft", "roblox", "steam")
+USERS = 20
+
+def measure(func: Callable[[], object], iterations: int, rounds: int) -> float:
+	"Get the fastest seconds per call over a number of rounds."
+	best = None
+	for _ in range(rounds):
+		start = time.perf_counter()
+		for _ in range(iterations):
+			func()
+		elapsed = (time.perf_counter() - start) / iterations
+		best = elapsed if best is None else min(best, elapsed)
+	return best
+
+def populate(connection: Connection, now: datetime.datetime) -> None:
+	"Fill the DB with programs and a week of sessions for each user."
+	group_id = ProgramGroup.insert(connection,
+		minutes_monday=60,
+		minutes_tuesday=60,
+		minutes_wednesday=60,
+		minutes_thursday=60,
+		minutes_friday=60,
+		minutes_saturday=120,
+		minutes_sunday=120,
+		minutes_weekly=600,
+		minutes_monthly=2400,
+		name="games",
+	)
+	for name in PROGRAMS:
+		Program.insert(connection, name=name, program_group=group_id)
+	for user in range(USERS):
+		for day in range(7):
+			start = now - datetime.timedelta(days=day, hours=2)
+			queries.snapshot_store(connection, "host{}".format(user), "user{}".format(user), 0,
+				{"100": PROGRAMS[user % len(PROGRAMS)]}, moment=start)
+			queries.snapshot_store(connection, "host{}".format(user), "user{}".format(user), 60,
+				{}, moment=start + datetime.timedelta(minutes=45))
+
+def run(connection: Connection, iterations: int, rounds: int) -> Mapping[str, float]:
+	"Run every benchmark, get the seconds per call of each."
+	moment = [datetime.datetime.now()]
+	def store():
+		moment[0] += datetime.timedelta(seconds=10)
+		queries.snapshot_store(connection, "host0", "user0", 10, {"100": "minecraft", "101": "steam"}, moment=moment[0])
+	def status_uncached():
+		queries.STATUS_CACHE.clear()
+		return queries.user_to_status(connection)
+	process_to_program = {name: name for name in PROGRAMS}
+	snapshotter = snapshot.Snapshotter(procfs.Scanner())
+	benchmarks = (
+		("list_where", lambda: list(ProgramSession.list_where(connection,
+			where="username = ? AND start >= ?",
+			bindings=("user3", datetime.datetime.now() - datetime.timedelta(days=3))))),
+		("snapshot.take", lambda: snapshot.take(process_to_program)),
+		("snapshot.take procfs", lambda: snapshotter.take(process_to_program)),
+		("snapshot_store", store),
+		("user_to_status", status_uncached),
+		("user_to_status cached", lambda: queries.user_to_status(connection)),
+	)
+	return {name: measure(func, iterations, rounds) for name, func in benchmarks}
+
+def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("-i", "--iterations", type=int, default=50, help="Calls in each round")
+	parser.add_argument("-r", "--rounds", type=int, default=5, help="Rounds to keep the fastest of")
+	parser.add_argument("--save", action="store_true", help="Save the results as the new baselines")
+	parser.add_argument("-t", "--tolerance", type=float, default=2.0,
+		help="How many times slower than the baseline counts as a regression")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		connection = Connection()
+		connection.connect(os.path.join(directory, "micro.sqlite"))
+		create_all(connection)
+		populate(connection, datetime.datetime.now())
+		results = run(connection, args.iterations, args.rounds)
+
+	baselines = {}
+	if os.path.exists(BASELINES):
+		with open(BASELINES) as source:
+			baselines = json.load(source)
+	regressions = []
+	for name, seconds in sorted(results.items()):
+		baseline = baselines.get(name)
+		ratio = seconds / baseline if baseline else None
+		print("{:<24} {:>10.3f} ms/call  {}".format(
+			name, seconds * 1000, "" if ratio is None else "{:.2f}x baseline".format(ratio)))
+		if ratio is not None and ratio > args.tolerance:
+			regressions.append(name)
+	if args.save:
+		with open(BASELINES, "w") as output:
+			json.dump(results, output, indent="\t", sort_keys=True)
+			output.write("\n")
+		print("Saved baselines to {}".format(BASELINES))
+	elif regressions:
+		print("Slower than {}x the baseline: {}".format(args.tolerance, ", ".join(regressions)))
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
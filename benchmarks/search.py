@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Benchmark searching browsing history.
+
+Compares the FTS5 URL index against a LIKE scan over every visit.
+"""
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+from typing import Callable
+
+from parentopticon.db import intern, search
+from parentopticon.db.connection import Connection
+from parentopticon.db.tables import create_all, Hostname, Site, Url, Username
+
+WORDS = ("news", "video", "game", "school", "math", "wiki", "music", "shop", "mail", "docs",
+	"forum", "sports", "weather", "map", "code", "art", "science", "history", "recipe", "chat")
+TERMS = ("minecraft", "history", "recipe chocolate", "math home")
+
+def populate(connection: Connection, visits: int, urls: int) -> None:
+	"Fill the DB with visits spread over a number of distinct URLs."
+	rng = random.Random(0)
+	hostname_id = intern.Interner(Hostname).id(connection, "benchhost")
+	username_id = intern.Interner(Username).id(connection, "benchuser")
+	sites = intern.Interner(Site)
+	rows = []
+	for i in range(urls):
+		site = "{}{}.com".format(rng.choice(WORDS), i % 500)
+		rows.append((sites.id(connection, site), "https://{}/{}/{}-{}".format(
+			site, rng.choice(WORDS), rng.choice(WORDS), i)))
+	rows.append((sites.id(connection, "minecraft.net"), "https://minecraft.net/recipe/chocolate"))
+	connection.executemany("INSERT INTO Url (value) VALUES (?)", [(url,) for _, url in rows])
+	connection.execute("INSERT INTO UrlSearch (UrlSearch) VALUES ('rebuild')")
+	connection.commit()
+	id_by_url = {url: id_ for id_, url in connection.execute("SELECT id, value FROM Url")}
+	url_ids = [(site_id, id_by_url[url]) for site_id, url in rows]
+	start = datetime.datetime(2020, 1, 1)
+	batch = []
+	for i in range(visits):
+		site_id, url_id = rng.choice(url_ids)
+		batch.append((start + datetime.timedelta(seconds=i), hostname_id, False, site_id, url_id, username_id))
+		if len(batch) == 10000:
+			_insert(connection, batch)
+			batch = []
+	_insert(connection, batch)
+
+def _insert(connection: Connection, batch) -> None:
+	connection.executemany(
+		"INSERT INTO WebsiteVisit (at, hostname, incognito, site, url, username) VALUES (?, ?, ?, ?, ?, ?)",
+		batch)
+	connection.commit()
+
+def like_scan(connection: Connection, text: str):
+	"Search the old way, matching every visit's URL with LIKE."
+	where = " AND ".join("Url.value LIKE ?" for _ in text.split())
+	return connection.execute(
+		"SELECT Url.value, COUNT(*), MAX(WebsiteVisit.at) FROM WebsiteVisit "
+		"JOIN Url ON Url.id = WebsiteVisit.url WHERE {} GROUP BY Url.id LIMIT 50".format(where),
+		["%{}%".format(word) for word in text.split()]).fetchall()
+
+def measure(name: str, func: Callable[[], list], iterations: int) -> None:
+	start = time.perf_counter()
+	for _ in range(iterations):
+		result = func()
+	elapsed = time.perf_counter() - start
+	print("{:<24} {:>10.3f} ms/call  ({} results)".format(
+		name, elapsed * 1000 / iterations, len(result)))
+
+def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("-n", "--visits", type=int, default=2000000, help="Visits to generate")
+	parser.add_argument("-u", "--urls", type=int, default=50000, help="Distinct URLs to generate")
+	parser.add_argument("-i", "--iterations", type=int, default=5, help="Searches to time")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		connection = Connection()
+		connection.connect(os.path.join(directory, "bench.sqlite"))
+		create_all(connection)
+		started = time.perf_counter()
+		populate(connection, args.visits, args.urls)
+		print("{} visits over {} URLs in {:.1f}s".format(args.visits, args.urls, time.perf_counter() - started))
+		for term in TERMS:
+			measure("like '{}'".format(term), lambda: like_scan(connection, term), args.iterations)
+			measure("fts '{}'".format(term), lambda: search.search(connection, term), args.iterations)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,120 @@
+"""
+Module for turning client observations into credited program time.
+
+Daemons report what they see along with the moment they looked, on their
+own clock, and how long it has been since their last successful report.
+This module translates those observations onto the server clock and
+decides how much of the time between observations counts as usage.
+"""
+import collections
+import datetime
+import logging
+from typing import Deque, Dict, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+# The longest gap between two observations we will credit as continuous
+# use. Anything longer is treated as downtime (suspend, network outage,
+# a daemon that died) and is not counted.
+MAX_GAP_SECONDS = 120
+# The number of recent clock offsets to remember for each host.
+SKEW_SAMPLES = 20
+
+class ClockSkew:
+	"""Estimates the offset between each client's clock and ours.
+
+	Every report gives us an offset of (received - observed), which is
+	the true clock skew plus however long the request took to arrive.
+	Latency is never negative, so the smallest recent offset is the best
+	estimate of the skew alone.
+	"""
+	def __init__(self,
+		samples: int = SKEW_SAMPLES,
+		reset_seconds: int = MAX_GAP_SECONDS) -> None:
+		self.reset = datetime.timedelta(seconds=reset_seconds)
+		self.samples = samples
+		self._offsets: Dict[str, Deque[datetime.timedelta]] = {}
+
+	def correct(self,
+		hostname: str,
+		observed: Optional[float],
+		received: datetime.datetime) -> datetime.datetime:
+		"""Translate a client observation onto the server clock.
+
+		Args:
+			hostname: The host that made the observation.
+			observed: The client's UNIX timestamp for the observation, if sent.
+			received: The moment we received the observation.
+		Returns:
+			The moment of the observation on our clock. This is never later
+			than the moment we received it.
+		"""
+		if observed is None:
+			return received
+		client_moment = datetime.datetime.fromtimestamp(observed)
+		offset = received - client_moment
+		offsets = self._offsets.get(hostname)
+		if offsets is None:
+			offsets = collections.deque(maxlen=self.samples)
+			self._offsets[hostname] = offsets
+		elif abs(offset - min(offsets)) > self.reset:
+			# The client clock jumped, our history no longer applies.
+			LOGGER.info("Clock on %s jumped by %s, resetting skew estimate",
+				hostname, offset - min(offsets))
+			offsets.clear()
+		offsets.append(offset)
+		return client_moment + min(offsets)
+
+def is_continuous(
+	last_seen: datetime.datetime,
+	moment: datetime.datetime,
+	elapsed_seconds: float,
+	max_gap_seconds: int = MAX_GAP_SECONDS) -> bool:
+	"""Check if an observation continues a session last seen earlier.
+
+	Both our own view (time since the session was last seen) and the
+	client's view (time since its last successful report) must be
+	within the maximum gap.
+	"""
+	gap = (moment - last_seen).total_seconds()
+	return gap <= max_gap_seconds and elapsed_seconds <= max_gap_seconds
+
+def open_until(
+	last_seen: Optional[datetime.datetime],
+	now: datetime.datetime,
+	max_gap_seconds: int = MAX_GAP_SECONDS) -> datetime.datetime:
+	"Get the moment up to which an open session should be counted."
+	if last_seen is None:
+		return now
+	return min(now, last_seen + datetime.timedelta(seconds=max_gap_seconds))
+
+def session_end(
+	last_seen: datetime.datetime,
+	moment: datetime.datetime,
+	elapsed_seconds: float,
+	max_gap_seconds: int = MAX_GAP_SECONDS) -> datetime.datetime:
+	"""Get the end of a session that is no longer observed.
+
+	The program stopped somewhere between when it was last seen and now.
+	If the observations were continuous we split the difference, otherwise
+	we only credit up to when it was last seen.
+	"""
+	if moment <= last_seen:
+		return last_seen
+	if not is_continuous(last_seen, moment, elapsed_seconds, max_gap_seconds):
+		return last_seen
+	return last_seen + (moment - last_seen) / 2
+
+def session_start(
+	moment: datetime.datetime,
+	elapsed_seconds: float,
+	max_gap_seconds: int = MAX_GAP_SECONDS) -> datetime.datetime:
+	"""Get the start of a session first observed at a moment.
+
+	The program started somewhere between the client's previous report
+	and this one. If the client has been reporting continuously we split
+	the difference, otherwise we start counting at the observation.
+	"""
+	if elapsed_seconds <= 0 or elapsed_seconds > max_gap_seconds:
+		return moment
+	return moment - datetime.timedelta(seconds=elapsed_seconds / 2)
@@ -1,22 +1,31 @@
 """
 Module for handling enforcement logic.
 """
+import collections
 import datetime
 from enum import Enum
 import getpass
 import logging
-import os
-import signal
+import queue
 import socket
-from typing import Iterable, Mapping, Optional
+import threading
+import time
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
 import urllib.parse
 
 import requests
 
-from parentopticon import db, snapshot, ui
+from parentopticon import db, procfs, snapshot, ui
 
 LOGGER = logging.getLogger(__name__)
 
+# How long the server's verdict on a site is used before asking again.
+WEBSITE_VERDICT_SECONDS = 60
+# How many visits can wait to be sent before new ones are dropped.
+WEBSITE_QUEUE_SIZE = 1000
+# How many sites to keep verdicts for.
+WEBSITE_VERDICTS_SIZE = 1024
+
 class ActionType(Enum):
 	# Kill a program
 	kill = "kill"
@@ -39,11 +48,31 @@ class Client:
 		self.host = host
 		self.hostname = socket.gethostname()
 		self.username = getpass.getuser()
+		# The last processes and programs we got, and their version.
+		self.processes_and_programs = None
+		self.processes_and_programs_etag = None
+		# The last status we got, and when, on the monotonic clock.
+		self.status = None
+		self.status_at = None
+		# Reads /proc where there is one, which is far cheaper than psutil.
+		self.snapshotter = snapshot.Snapshotter(procfs.Scanner() if procfs.available() else None)
+		# Everything we send the server, including what we send for local
+		# programs, shares the connections kept open here. The daemon loop,
+		# the threads answering local programs and the visit thread all use
+		# it, one at a time.
+		self.session = requests.Session()
+		self._session_lock = threading.Lock()
+		# Each site's verdict, and when we got it, on the monotonic clock,
+		# least recently used first.
+		self.website_verdicts: Dict[str, Tuple[bool, float]] = collections.OrderedDict()
+		self._verdicts_lock = threading.Lock()
+		self._visits = queue.Queue(WEBSITE_QUEUE_SIZE)
+		self._visit_thread = None
 
 	def get_actions(self) -> Iterable[Action]:
 		"Get the enforcement actions to take."
 		url = self.url("/action", {"hostname": self.hostname, "username": self.username})
-		response = requests.get(url)
+		response = self._request("GET", url)
 		if not response.ok:
 			raise SkipLoop("Failed to get actions: %s", response.text)
 		data = response.json()
@@ -56,35 +85,174 @@ class Client:
 	def get_processes_and_programs(self) -> Mapping[str, str]:
 		"Get the processes and programs we care about."
 		url = self.url("/program-by-process", {"hostname": self.hostname, "username": self.username})
-		response = requests.get(url)
+		headers = {}
+		if self.processes_and_programs_etag:
+			headers["If-None-Match"] = self.processes_and_programs_etag
+		response = self._request("GET", url, headers=headers)
+		if response.status_code == 304 and self.processes_and_programs is not None:
+			LOGGER.debug("Processes and programs unchanged")
+			return self.processes_and_programs
 		if not response.ok:
 			raise SkipLoop("Failed to get interesting processes and programs: {}.".format(response.text))
-		return response.json()
+		self.processes_and_programs = response.json()
+		self.processes_and_programs_etag = response.headers.get("ETag")
+		return self.processes_and_programs
+
+	def get_status(self) -> Mapping[str, Any]:
+		"Get our status in each program group, and the group of each program."
+		url = self.url("/status", {"hostname": self.hostname, "username": self.username})
+		response = self._request("GET", url)
+		if not response.ok:
+			raise SkipLoop("Failed to get status: {}".format(response.text))
+		self.status = response.json()
+		self.status_at = time.monotonic()
+		return self.status
+
+	def group_status(self, program: str) -> Optional[Mapping[str, Any]]:
+		"""Get the status of the group a program is in, from the last status we got.
+
+		Returns:
+			The group's status with its name, or None when we don't know
+			anything about the program yet.
+		"""
+		if self.status is None:
+			return None
+		group = self.status["programs"].get(program)
+		if group is None:
+			return None
+		status = dict(self.status["groups"][group], group=group)
+		# The status is up to a loop old, and the lock gets closer all the same.
+		if status["minutes_until_lock"] is not None:
+			status["minutes_until_lock"] -= (time.monotonic() - self.status_at) / 60
+		return status
+
+	def launch_verdict(self, program: str) -> Optional[str]:
+		"""Get why a program may not start now, from the last status we got.
 
-	def post_programs(self, pid_to_program: Mapping[int, str], elapsed_seconds: int) -> None:
+		Returns:
+			The reason, or None when the program may start, including when
+			we don't know anything about it yet.
+		"""
+		status = self.group_status(program)
+		if status is None:
+			return None
+		group = status["group"]
+		if status["minutes_until_lock"] is not None and status["minutes_until_lock"] <= 0:
+			return "{} is locked right now.".format(group)
+		if status["minutes_remaining"] is not None and status["minutes_remaining"] <= 0:
+			return "There's no time left for {}.".format(group)
+		return None
+
+	def post_programs(self,
+		pid_to_program: Mapping[int, str],
+		elapsed_seconds: int,
+		observed: Optional[float] = None) -> None:
 		"Send the programs that have been running."
 		url = self.url("/snapshot")
 		data = {
 			"elapsed_seconds": elapsed_seconds,
 			"hostname": self.hostname,
+			"observed": observed or time.time(),
 			"programs": pid_to_program,
 			"username": self.username,
 		}
-		response = requests.post(url, json=data)
+		response = self._request("POST", url, json=data)
 		if not response.ok:
 			raise SkipLoop("Failed to send snapshot: {}".format(response.text))
 
+	def post_website(self, visit: Mapping[str, Any]) -> bool:
+		"Send a website visit, return whether the server allows it."
+		response = self._request("POST", self.url("/website"), json=visit)
+		allowed = response.status_code == 204
+		with self._verdicts_lock:
+			site = _site(visit["url"])
+			self.website_verdicts[site] = (allowed, time.monotonic())
+			self.website_verdicts.move_to_end(site)
+			while len(self.website_verdicts) > WEBSITE_VERDICTS_SIZE:
+				self.website_verdicts.popitem(last=False)
+		return allowed
+
+	def website_verdict(self, visit: Mapping[str, Any]) -> bool:
+		"""Get whether a website may be visited.
+
+		The server decides for a whole site, so once it has, visits to the
+		same site are answered here and sent to it in the background.
+		Until it has, we ask and wait. If it can't be asked the visit isn't
+		allowed, like the browser extension does.
+
+		Args:
+			visit: What the browser extension sends the server, the url at
+				least. The visit is always sent as ours, whatever hostname
+				and username it has.
+		"""
+		visit = {
+			"hostname": self.hostname,
+			"incognito": bool(visit.get("incognito", False)),
+			"url": str(visit["url"]),
+			"username": self.username,
+		}
+		site = _site(visit["url"])
+		with self._verdicts_lock:
+			cached = self.website_verdicts.get(site)
+			if cached is not None:
+				self.website_verdicts.move_to_end(site)
+		if cached is not None and time.monotonic() - cached[1] < WEBSITE_VERDICT_SECONDS:
+			self._queue_visit(visit)
+			return cached[0]
+		try:
+			return self.post_website(visit)
+		except requests.exceptions.RequestException as ex:
+			LOGGER.warning("Failed to ask about %s: %s", visit["url"], ex)
+			return False
+
+	def _queue_visit(self, visit: Mapping[str, Any]) -> None:
+		with self._verdicts_lock:
+			if self._visit_thread is None:
+				self._visit_thread = threading.Thread(target=self._send_visits, name="visits", daemon=True)
+				self._visit_thread.start()
+		try:
+			self._visits.put_nowait(visit)
+		except queue.Full:
+			LOGGER.warning("Dropping the visit to %s, too many are waiting to be sent", visit["url"])
+
+	def _send_visits(self) -> None:
+		"Send queued visits one after another, which also keeps their verdicts fresh."
+		while True:
+			visit = self._visits.get()
+			try:
+				self.post_website(visit)
+			except requests.exceptions.RequestException as ex:
+				LOGGER.warning("Failed to send the visit to %s: %s", visit["url"], ex)
+
+	def _request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+		"Send a request on the shared session, which can't be used by several threads at once."
+		with self._session_lock:
+			return self.session.request(method, url, **kwargs)
+
 	def snap_and_enforce(self, elapsed_seconds: int) -> None:
 		"Get a snapshot, enforce limits."
 		try:
 			process_to_programs = self.get_processes_and_programs()
-			pid_to_program = snapshot.take(process_to_programs)
-			self.post_programs(pid_to_program, elapsed_seconds)
+			observed = time.time()
+			pid_to_program = self.snapshotter.take(process_to_programs)
+			self.post_programs(pid_to_program, elapsed_seconds, observed)
 			actions = self.get_actions()
+			# Kill every pid at once, so a process group shared by several is signalled once.
+			pids = []
 			for action in actions:
-				do(action)
+				if action.type == ActionType.kill:
+					pids.extend(_pids(action))
+				else:
+					do(action, self.snapshotter)
+			if pids:
+				self.snapshotter.kill(pids)
 		except requests.exceptions.ConnectionError as ex:
 			raise SkipLoop("Looks like the remote host isn't responding: {}".format(ex))
+		# Only local programs use the status, so failing to get it mustn't stop enforcing.
+		try:
+			self.get_status()
+		except (SkipLoop, requests.exceptions.RequestException) as ex:
+			LOGGER.warning("Keeping the last status. %s", ex)
 
 	def url(self, path: str, queryargs: Optional[Mapping[str, str]] = None) -> str:
 		if queryargs:
@@ -98,14 +266,35 @@ class Client:
 		)
 
 
-def do(action: Action) -> None:
-	"Do whatever the action says to do."
+def do(action: Action,
+	snapshotter: Optional[snapshot.Snapshotter] = None,
+	process_to_program: Optional[Mapping[str, str]] = None) -> None:
+	"""Do whatever the action says to do.
+
+	Args:
+		snapshotter: Knows the process tree and the programs in it, so a
+			kill gets the children too, and only of programs.
+		process_to_program: Without a snapshotter, a snapshot of these
+			programs is taken to learn them.
+	"""
 	if action.type == ActionType.kill:
-		try:
-			os.kill(int(action.content), signal.SIGINT)
-		except ProcessLookupError as ex:
-			LOGGER.warning("Failed to kill '%s': %s", action.content, ex)
+		if snapshotter is None:
+			snapshotter = snapshot.Snapshotter(procfs.Scanner() if procfs.available() else None)
+			snapshotter.take(process_to_program or {})
+		snapshotter.kill(_pids(action))
 	elif action.type == ActionType.warn:
 		ui.show_alert("Thus saith dad", action.content)
 	else:
 		raise Exception("This should never happen.")
+
+def _site(url: str) -> str:
+	"Get the site a url is on."
+	return (urllib.parse.urlsplit(url).hostname or "").lower()
+
+def _pids(action: Action) -> Iterable[int]:
+	"Get the pids a kill action is for, which older servers join with commas."
+	try:
+		return [int(pid) for pid in str(action.content).split(",") if pid]
+	except ValueError:
+		LOGGER.warning("Not killing '%s', it isn't a pid", action.content)
+		return []
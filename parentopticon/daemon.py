@@ -8,40 +8,105 @@ tells the user what is going on.
 import argparse
 import asyncio
 import datetime
+import functools
 import logging
 import socket
 import time
-from typing import Iterable
+from typing import Any, Iterable, Mapping
 
-from parentopticon import client, log, snapshot
+from parentopticon import client, ipc, log, metrics, sampler, snapshot
 
 
 LOGGER = logging.getLogger(__name__)
 SNAPSHOT_TIMESPAN_SECONDS = 30
 
+LOOP_SECONDS = metrics.REGISTRY.histogram("parentopticon_daemon_loop_seconds",
+	"Time spent taking a snapshot and enforcing limits.", labels=("result",))
+
 def main() -> None:
 	parser = argparse.ArgumentParser()
 	parser.add_argument("-H", "--host", default="http://odroid.lan", help="The host to talk to, prefixed with the scheme")
 	parser.add_argument("-l", "--loop-time", default=SNAPSHOT_TIMESPAN_SECONDS, type=int, help="The time to use for each loop")
+	parser.add_argument("-s", "--stats-file", default=log.data_path("parentopticon-daemon.prom"),
+		help="The file to write metrics to after each loop")
+	parser.add_argument("-p", "--profile", action="store_true",
+		help="Sample the loop's stacks from the start, SIGUSR2 toggles it too")
+	parser.add_argument("--profile-dir", default=log.data_path("profiles"),
+		help="The directory to write collapsed stack samples to")
+	parser.add_argument("--socket", default=ipc.default_path(),
+		help="The socket to answer local programs, like the launcher, on")
+	parser.add_argument("--http-port", type=int,
+		help="Also answer the browser extension over HTTP on this localhost port")
+	parser.add_argument("--http-origin", action="append", default=[],
+		help="Only answer HTTP requests from this extension origin, like moz-extension://<uuid>, can be repeated")
+	parser.add_argument("-j", "--json-logs", action="store_true", help="Log JSON objects rather than text")
 	parser.add_argument("-v", "--verbose", action="store_true", help="Debug logging")
 	args = parser.parse_args()
 
-	log.setup(logging.DEBUG if args.verbose else logging.INFO)
+	log.setup(logging.DEBUG if args.verbose else logging.INFO, json_lines=args.json_logs)
 	my_client = client.Client(args.host)
+	loop_sampler = sampler.Sampler()
+	sampler.install_toggle(loop_sampler, args.profile_dir)
+	if args.profile:
+		loop_sampler.start()
+	methods = {
+		"launch": functools.partial(_answer_launch, my_client),
+		"minutes": functools.partial(_answer_minutes, my_client),
+		"status": functools.partial(_answer_status, my_client),
+		"website": functools.partial(_answer_website, my_client),
+	}
+	local = ipc.Server(methods, args.socket)
+	local.start()
+	local_http = None
+	if args.http_port is not None:
+		# The browser extension only reports visits, it has no business launching programs.
+		local_http = ipc.HTTPServer({"website": methods["website"]}, args.http_port, args.http_origin)
+		local_http.start()
 	LOGGER.info("Parentopticon daemon starting.")
 	try:
 		last_success = time.time()
 		while True:
 			start = time.time()
+			result = "ok"
 			try:
 				my_client.snap_and_enforce(time.time() - last_success)
 				last_success = time.time()
 			except client.SkipLoop as ex:
 				LOGGER.warning("Skipping the loop. %s", ex)
+				result = "skipped"
 			end = time.time()
+			LOOP_SECONDS.observe(end - start, result=result)
+			try:
+				metrics.REGISTRY.write(args.stats_file)
+			except OSError as ex:
+				LOGGER.warning("Failed to write metrics to %s: %s", args.stats_file, ex)
 			to_sleep = args.loop_time - (end - start)
 			if to_sleep > 0:
 				time.sleep(to_sleep)
 	except KeyboardInterrupt:
 		LOGGER.info("Exiting due to SIGINT")
+	local.stop()
+	if local_http is not None:
+		local_http.stop()
+	if loop_sampler.running:
+		sampler.write(loop_sampler, args.profile_dir)
 	LOGGER.info("Parentopticon daemon closed.")
+
+def _answer_launch(my_client: client.Client, message: Mapping[str, Any]) -> Mapping[str, Any]:
+	"Answer the launcher's preflight check from the last status."
+	reason = my_client.launch_verdict(message["program"])
+	return {"allowed": reason is None, "reason": reason}
+
+def _answer_minutes(my_client: client.Client, message: Mapping[str, Any]) -> Mapping[str, Any]:
+	"Answer how long a program may still run from the last status, nothing when we don't know."
+	return my_client.group_status(message["program"]) or {}
+
+def _answer_status(my_client: client.Client, message: Mapping[str, Any]) -> Mapping[str, Any]:
+	"Answer with the last status and how old it is."
+	if my_client.status is None:
+		return {"age_seconds": None, "status": None}
+	return {"age_seconds": time.monotonic() - my_client.status_at, "status": my_client.status}
+
+def _answer_website(my_client: client.Client, message: Mapping[str, Any]) -> Mapping[str, Any]:
+	"Answer whether a website may be visited, passing the visit on to the server."
+	return {"allowed": my_client.website_verdict(message)}
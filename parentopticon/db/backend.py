@@ -0,0 +1,260 @@
+"""
+Module for the differences between the databases we can store data in.
+
+SQLite is the default and needs nothing but a file. PostgreSQL lets many
+machines share one server. Statements are written for SQLite, with '?'
+placeholders, and each backend adjusts them and the schema to its own
+dialect. A few features, like full-text search and incremental vacuum,
+only exist for SQLite and are skipped elsewhere.
+"""
+import functools
+import importlib
+import logging
+import sqlite3
+from typing import Any, Iterable, List, Mapping, Optional, Tuple
+import urllib.parse
+
+LOGGER = logging.getLogger(__name__)
+
+class Backend:
+	"The SQL dialect and connection details of one kind of database."
+	NAME = "none"
+	# Whether 'UPDATE ... RETURNING' works.
+	SUPPORTS_RETURNING = False
+	# Whether the FTS5 full-text search index works.
+	SUPPORTS_FULL_TEXT = False
+	# Whether 'ALTER TABLE ... DROP COLUMN' works.
+	SUPPORTS_DROP_COLUMN = False
+
+	def begin_write(self, connection: Any) -> None:
+		"Start a transaction that holds the write lock until it commits."
+		connection.commit()
+
+	def column_definition(self, name: str, column: Any) -> str:
+		"Get the definition of a column for a CREATE TABLE statement."
+		attributes = [self.quote(name), self.type_name(column)]
+		if column.primary_key:
+			attributes.append("PRIMARY KEY")
+		if not column.null:
+			attributes.append("NOT NULL")
+		return " ".join(attributes)
+
+	def columns(self, connection: Any, table: str) -> Mapping[str, str]:
+		"Get the names and types of the columns of a table."
+		raise NotImplementedError()
+
+	def connect(self, target: str) -> Any:
+		"Open a DB-API connection."
+		raise NotImplementedError()
+
+	def date_of(self, expression: str) -> str:
+		"Get SQL for the date part of a timestamp expression."
+		return "CAST({} AS DATE)".format(expression)
+
+	def execute_returning_id(self, cursor: Any, statement: str, bindings: Iterable[Any]) -> Optional[int]:
+		"Execute a statement, return the ID of the row it inserted."
+		cursor.execute(self.translate(statement), bindings)
+		return cursor.lastrowid
+
+	def explain(self, connection: Any, statement: str, bindings: Iterable[Any]) -> List[str]:
+		"Get the lines of the plan for a statement in this dialect."
+		return []
+
+	def get_version(self, connection: Any) -> int:
+		"Get the number of migrations applied to the DB."
+		raise NotImplementedError()
+
+	def is_full_scan(self, line: str) -> bool:
+		"Check if a line from explain() reads every row of a table."
+		return False
+
+	def prepare(self, connection: Any) -> None:
+		"Set any options a new DB needs before tables are created."
+
+	def quote(self, name: str) -> str:
+		"Quote an identifier, if the dialect needs it."
+		return '"{}"'.format(name)
+
+	def recover(self, connection: Any) -> None:
+		"Make a connection usable again after a statement in its transaction failed."
+
+	def set_version(self, connection: Any, version: int) -> None:
+		"Set the number of migrations applied to the DB."
+		raise NotImplementedError()
+
+	def share(self, connection: Any) -> None:
+		"Set any options the DB needs to be written by many processes at once."
+
+	def tables(self, connection: Any) -> Iterable[str]:
+		"Get the names of every table."
+		raise NotImplementedError()
+
+	def translate(self, statement: str) -> str:
+		"Turn a statement with '?' placeholders into this dialect."
+		return statement
+
+	def type_name(self, column: Any) -> str:
+		"Get the type of a column in this dialect."
+		return column.TYPENAME
+
+class SQLiteBackend(Backend):
+	"A database in a single SQLite file."
+	NAME = "sqlite"
+	SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+	SUPPORTS_FULL_TEXT = True
+	SUPPORTS_DROP_COLUMN = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+	def begin_write(self, connection: Any) -> None:
+		connection.commit()
+		connection.execute("BEGIN IMMEDIATE")
+
+	def column_definition(self, name: str, column: Any) -> str:
+		return column.create_statement(name)
+
+	def columns(self, connection: Any, table: str) -> Mapping[str, str]:
+		return {row[1]: row[2] for row in connection.execute(
+			"PRAGMA table_info({})".format(table)).fetchall()}
+
+	def connect(self, target: str) -> Any:
+		return sqlite3.connect(
+			target,
+			detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+		)
+
+	def date_of(self, expression: str) -> str:
+		return "date({})".format(expression)
+
+	def explain(self, connection: Any, statement: str, bindings: Iterable[Any]) -> List[str]:
+		return [row[3] for row in connection.execute("EXPLAIN QUERY PLAN " + statement, bindings).fetchall()]
+
+	def get_version(self, connection: Any) -> int:
+		return connection.execute("PRAGMA user_version").fetchone()[0]
+
+	def is_full_scan(self, line: str) -> bool:
+		# 'SCAN Program', where scans that use an index say 'USING ... INDEX'.
+		return line.startswith("SCAN ") and " USING " not in line
+
+	def prepare(self, connection: Any) -> None:
+		# Only takes effect on a new DB, it lets retention return freed pages.
+		connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+	def quote(self, name: str) -> str:
+		return name
+
+	def set_version(self, connection: Any, version: int) -> None:
+		connection.execute("PRAGMA user_version = {:d}".format(version))
+		connection.commit()
+
+	def share(self, connection: Any) -> None:
+		# Readers no longer block the writer, and the mode sticks to the file.
+		connection.execute("PRAGMA journal_mode = WAL")
+
+	def tables(self, connection: Any) -> Iterable[str]:
+		return [row[0] for row in connection.execute(
+			"SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()]
+
+class PostgresBackend(Backend):
+	"A database on a PostgreSQL server."
+	NAME = "postgresql"
+	SUPPORTS_RETURNING = True
+	SUPPORTS_DROP_COLUMN = True
+	TYPES = {
+		"BLOB": "BYTEA",
+		"bool": "BOOLEAN",
+		"date": "DATE",
+		"INTEGER": "INTEGER",
+		"TEXT": "TEXT",
+		"timestamp": "TIMESTAMP",
+	}
+
+	def columns(self, connection: Any, table: str) -> Mapping[str, str]:
+		return {row[0]: row[1] for row in connection.execute(
+			"SELECT column_name, data_type FROM information_schema.columns "
+			"WHERE table_schema = current_schema() AND table_name = ?",
+			# Unquoted names are stored in lower case.
+			(table.lower(),)).fetchall()}
+
+	def connect(self, target: str) -> Any:
+		# Only needed for PostgreSQL, so only imported for it.
+		psycopg2 = importlib.import_module("psycopg2")
+		return psycopg2.connect(target)
+
+	def execute_returning_id(self, cursor: Any, statement: str, bindings: Iterable[Any]) -> Optional[int]:
+		if not statement.lstrip().upper().startswith("INSERT"):
+			cursor.execute(self.translate(statement), bindings)
+			return None
+		cursor.execute(self.translate(statement + " RETURNING id"), bindings)
+		return cursor.fetchone()[0]
+
+	def explain(self, connection: Any, statement: str, bindings: Iterable[Any]) -> List[str]:
+		cursor = connection.cursor()
+		cursor.execute("EXPLAIN " + statement, bindings)
+		return [row[0] for row in cursor.fetchall()]
+
+	def get_version(self, connection: Any) -> int:
+		self._create_version_table(connection)
+		row = connection.execute("SELECT version FROM SchemaVersion").fetchone()
+		return row[0] if row else 0
+
+	def is_full_scan(self, line: str) -> bool:
+		return "Seq Scan" in line
+
+	def recover(self, connection: Any) -> None:
+		# Nothing more runs in a transaction once a statement in it failed.
+		connection.connection.rollback()
+
+	def set_version(self, connection: Any, version: int) -> None:
+		self._create_version_table(connection)
+		connection.execute("DELETE FROM SchemaVersion")
+		connection.execute("INSERT INTO SchemaVersion (version) VALUES (?)", (version,))
+		connection.commit()
+
+	def tables(self, connection: Any) -> Iterable[str]:
+		return [row[0] for row in connection.execute(
+			"SELECT table_name FROM information_schema.tables WHERE table_schema = current_schema()").fetchall()]
+
+	def translate(self, statement: str) -> str:
+		return _translate_placeholders(statement)
+
+	def type_name(self, column: Any) -> str:
+		if column.autoincrement:
+			return "SERIAL"
+		return self.TYPES[column.TYPENAME]
+
+	def _create_version_table(self, connection: Any) -> None:
+		connection.execute("CREATE TABLE IF NOT EXISTS SchemaVersion (version INTEGER NOT NULL)")
+
+SQLITE = SQLiteBackend()
+POSTGRES = PostgresBackend()
+
+def for_uri(uri: str) -> Tuple[Backend, str]:
+	"""Get the backend for a URI and what to connect it to.
+
+	A 'postgresql://' URI is a PostgreSQL server, 'sqlite:///path' or a
+	plain path is a SQLite file.
+	"""
+	scheme = urllib.parse.urlsplit(uri).scheme
+	if scheme in ("postgres", "postgresql"):
+		return POSTGRES, uri
+	if scheme == "sqlite":
+		return SQLITE, uri[len("sqlite://"):]
+	return SQLITE, uri
+
+@functools.lru_cache(maxsize=1024)
+def _translate_placeholders(statement: str) -> str:
+	"Turn '?' placeholders into '%s', escaping '%', outside of string literals."
+	parts = []
+	quoted = False
+	for character in statement:
+		if character == "'":
+			quoted = not quoted
+			parts.append(character)
+		elif quoted:
+			parts.append("%%" if character == "%" else character)
+		elif character == "?":
+			parts.append("%s")
+		elif character == "%":
+			parts.append("%%")
+		else:
+			parts.append(character)
+	return "".join(parts)
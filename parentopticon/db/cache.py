@@ -0,0 +1,180 @@
+"""
+Module for in-process caches of values computed from the DB.
+
+Statuses are computed from the usage timeline, open sessions and window
+weeks. Between snapshots nothing that feeds them changes except the wall
+clock, so a cached status is advanced by the time that has passed rather
+than recomputed. Writes that change the inputs invalidate entries.
+
+Reference data, the programs, program groups and the processes that make
+up each program, only changes when it is configured. It is loaded once
+and kept until a write invalidates it. Pages rendered from nothing but
+reference data are kept for as long as its version stays the same.
+"""
+import collections
+import datetime
+import logging
+import time
+from typing import Any, Callable, Mapping, Optional
+
+from parentopticon import window_week
+
+LOGGER = logging.getLogger(__name__)
+
+Entry = collections.namedtuple("Entry", (
+	# The status as of computed_at.
+	"status",
+	"computed_at",
+	# How long open sessions keep counting, None without open sessions.
+	"open_until",
+	# The window week schedule for the group, if it has one.
+	"schedule",
+))
+
+class StatusCache:
+	"Caches statuses by username and program group ID."
+	def __init__(self) -> None:
+		self._entries = {}
+		self.hits = 0
+		self.invalidations = 0
+		self.misses = 0
+
+	def clear(self) -> None:
+		"Drop every entry."
+		self._entries.clear()
+
+	def get(self, username: str, program_group: int, now: datetime.datetime) -> Optional[Any]:
+		"Get a status advanced to now, or None if it must be computed."
+		entry = self._entries.get((username, program_group))
+		# Past open_until the sessions have either stopped counting or been
+		# seen again, and only the DB knows which.
+		if (entry is None or entry.computed_at.date() != now.date() or now < entry.computed_at
+				or (entry.open_until is not None and now > entry.open_until)):
+			self.misses += 1
+			return None
+		self.hits += 1
+		return _advance(entry, now)
+
+	def invalidate(self,
+		username: Optional[str] = None,
+		program_group: Optional[int] = None) -> None:
+		"Drop the entries for a username, a program group, or everything."
+		self.invalidations += 1
+		if username is None and program_group is None:
+			self._entries.clear()
+			return
+		for key in list(self._entries.keys()):
+			if username is not None and key[0] != username:
+				continue
+			if program_group is not None and key[1] != program_group:
+				continue
+			del self._entries[key]
+
+	def put(self,
+		username: str,
+		program_group: int,
+		status: Any,
+		computed_at: datetime.datetime,
+		open_until: Optional[datetime.datetime],
+		schedule: Optional[window_week.Schedule]) -> None:
+		"Store a freshly computed status."
+		self._entries[(username, program_group)] = Entry(
+			status = status,
+			computed_at = computed_at,
+			open_until = open_until,
+			schedule = schedule,
+		)
+
+	def stats(self) -> Mapping[str, float]:
+		"Get the hit and miss counts."
+		lookups = self.hits + self.misses
+		return {
+			"entries": len(self._entries),
+			"hit_rate": self.hits / lookups if lookups else 0,
+			"hits": self.hits,
+			"invalidations": self.invalidations,
+			"misses": self.misses,
+		}
+
+Reference = collections.namedtuple("Reference", (
+	"program_by_name",
+	"program_by_process",
+	"program_groups",
+	"programs",
+	"version",
+))
+
+class ReferenceCache:
+	"""Caches the reference data and numbers each version of it.
+
+	Versions start from the time the cache was created so that a client
+	holding a version from before a restart never mistakes it for current.
+	"""
+	def __init__(self, load: Callable[[Any], Mapping[str, Any]]) -> None:
+		self._load = load
+		self._reference = None
+		self.hits = 0
+		self.misses = 0
+		self.version = int(time.time() * 1000)
+
+	def get(self, connection: Any) -> Reference:
+		"Get the reference data, loading it if it has been invalidated."
+		reference = self._reference
+		if reference is not None:
+			self.hits += 1
+		else:
+			reference = Reference(version=self.version, **self._load(connection))
+			self._reference = reference
+			self.misses += 1
+			LOGGER.debug("Loaded reference data version %d", self.version)
+		return reference
+
+	def invalidate(self, version: Optional[int] = None) -> None:
+		"Drop the reference data and move on to a new version."
+		self._reference = None
+		self.version = self.version + 1 if version is None else version
+
+class ResponseCache:
+	"Caches response bodies by key and the reference data version they came from."
+	def __init__(self, size: int = 256) -> None:
+		self._bodies = collections.OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.size = size
+
+	def clear(self) -> None:
+		"Drop every body."
+		self._bodies.clear()
+
+	def get(self, key: str, version: int) -> Optional[bytes]:
+		"Get a body, or None if there isn't one for the current version."
+		entry = self._bodies.get(key)
+		if entry is None or entry[0] != version:
+			self.misses += 1
+			return None
+		self.hits += 1
+		self._bodies.move_to_end(key)
+		return entry[1]
+
+	def put(self, key: str, version: int, body: bytes) -> None:
+		"Store a body, forgetting the least recently used one if we are full."
+		self._bodies[key] = (version, body)
+		self._bodies.move_to_end(key)
+		while len(self._bodies) > self.size:
+			self._bodies.popitem(last=False)
+
+def _advance(entry: Entry, now: datetime.datetime) -> Any:
+	"Move a cached status forward to now."
+	status = entry.status
+	changes = {}
+	if entry.open_until is not None:
+		elapsed = (min(now, entry.open_until) - entry.computed_at).total_seconds() / 60
+		if elapsed > 0:
+			for field in ("minutes_used_today", "minutes_used_week", "minutes_used_month"):
+				changes[field] = round(getattr(status, field) + elapsed, 1)
+			for field in ("minutes_remaining", "minutes_remaining_today", "minutes_remaining_week", "minutes_remaining_month"):
+				value = getattr(status, field)
+				changes[field] = None if value is None else round(value - elapsed, 1)
+	if entry.schedule is not None:
+		changes["minutes_until_lock"] = entry.schedule.minutes_until_lock(now)
+	return status._replace(**changes) if changes else status
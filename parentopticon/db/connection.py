@@ -1,36 +1,68 @@
 import logging
-import sqlite3
+import time
 from typing import Any, Iterable, Optional, Tuple
 
 import chryso.connection
-from parentopticon.db import tables
+from parentopticon.db import backend as backends
+from parentopticon.db import profiler as profilers
 
 LOGGER = logging.getLogger(__name__)
 
+DEFAULT_PATH = "/usr/share/parentopticon/db.sqlite"
+
 class Connection:
 	"Class that encapsulates all the interface to the DB."
 	def __init__(self):
+		self.backend = None
 		self.connection = None
 		self.cursor = None
+		# Set to a profiler.Profiler to record every statement.
+		self.profiler: Optional[profilers.Profiler] = None
 
 	def commit(self, *args, **kwargs) -> None:
 		return self.connection.commit(*args, **kwargs)
 
-	def connect(self, path: Optional[str] = "/usr/share/parentopticon/db.sqlite"):
-		self.connection = sqlite3.connect(
-			path,
-			detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
-		)
+	def connect(self, uri: Optional[str] = DEFAULT_PATH):
+		"Connect to a SQLite file path or a URI, see backend.for_uri."
+		self.backend, target = backends.for_uri(uri)
+		self.connection = self.backend.connect(target)
 		self.cursor = self.connection.cursor()
 
-	def execute(self, *args) -> Iterable[Tuple[Any]]:
-		return self.cursor.execute(*args)
+	def execute(self, statement: str, bindings: Iterable[Any] = ()) -> Iterable[Tuple[Any]]:
+		"Execute a statement with '?' placeholders, return the cursor."
+		if self.profiler is not None:
+			return self._execute_profiled(statement, bindings)
+		self.cursor.execute(self.backend.translate(statement), bindings)
+		return self.cursor
 
-	def execute_commit_return(self, *args) -> int:
-		"Execute a statement, commit it, return the rowid."
-		self.cursor.execute(*args)
+	def execute_commit_return(self, statement: str, bindings: Iterable[Any] = ()) -> int:
+		"Execute a statement, commit it, return the ID of any inserted row."
+		rowid = self.execute_return(statement, bindings)
 		self.connection.commit()
-		return self.cursor.lastrowid
+		return rowid
+
+	def execute_return(self, statement: str, bindings: Iterable[Any] = ()) -> int:
+		"Execute a statement without committing it, return the ID of any inserted row."
+		start = time.perf_counter()
+		rowid = self.backend.execute_returning_id(self.cursor, statement, bindings)
+		if self.profiler is not None:
+			self.profiler.record(self, statement, bindings, self.cursor.rowcount, time.perf_counter() - start)
+		return rowid
+
+	def executemany(self, statement: str, bindings: Iterable[Iterable[Any]]) -> None:
+		"Execute a statement once for each set of bindings."
+		start = time.perf_counter()
+		self.cursor.executemany(self.backend.translate(statement), bindings)
+		if self.profiler is not None:
+			self.profiler.record(self, statement, (), self.cursor.rowcount, time.perf_counter() - start)
+
+	def _execute_profiled(self, statement: str, bindings: Iterable[Any]) -> profilers.ProfiledCursor:
+		"Execute a statement and read every row it returns, so both are timed."
+		start = time.perf_counter()
+		self.cursor.execute(self.backend.translate(statement), bindings)
+		cursor = profilers.ProfiledCursor(self.cursor, self.cursor.fetchall())
+		self.profiler.record(self, statement, bindings, cursor.rowcount, time.perf_counter() - start)
+		return cursor
 
 def create(uri: str):
 	"Create a connection to the database."
@@ -0,0 +1,61 @@
+"""
+Module for interning repeated strings as integer IDs.
+
+Website visits repeat the same handful of usernames, client hostnames,
+sites and URLs over and over. Each distinct value is stored once in its
+own table and visits refer to it by ID. The most recently used values are
+kept in memory so that ingesting a visit rarely touches those tables.
+"""
+import collections
+import logging
+from typing import Any, Optional
+import urllib.parse
+
+LOGGER = logging.getLogger(__name__)
+
+class Interner:
+	"""Maps values to the IDs of rows in an interning table.
+
+	Args:
+		model: The interning table, with a unique 'value' column.
+		size: How many values to keep in memory.
+	"""
+	def __init__(self, model: Any, size: int = 1024) -> None:
+		self.hits = 0
+		self.misses = 0
+		self.model = model
+		self.size = size
+		self._ids = collections.OrderedDict()
+
+	def clear(self) -> None:
+		"Forget every cached value."
+		self._ids.clear()
+
+	def id(self, connection: Any, value: str) -> int:
+		"Get the ID of a value, adding the value if it is new."
+		id_ = self._ids.get(value)
+		if id_ is not None:
+			self.hits += 1
+			self._ids.move_to_end(value)
+			return id_
+		self.misses += 1
+		id_ = self._lookup(connection, value)
+		self._ids[value] = id_
+		if len(self._ids) > self.size:
+			self._ids.popitem(last=False)
+		return id_
+
+	def _lookup(self, connection: Any, value: str) -> int:
+		row = self.model.search(connection, value=value)
+		if row is not None:
+			return row.id
+		try:
+			return self.model.insert(connection, value=value)
+		except connection.connection.IntegrityError:
+			# Somebody else added it first.
+			connection.backend.recover(connection)
+			return self.model.search(connection, value=value).id
+
+def site(url: str) -> str:
+	"Get the site a URL is on."
+	return urllib.parse.urlsplit(url).hostname or url
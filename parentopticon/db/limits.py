@@ -0,0 +1,129 @@
+"""
+Module for evaluating program group limits.
+
+A program group limits a user's daily, weekly and monthly minutes. The
+daily limit depends on the day of the week. A negative limit means there
+is no limit for that period. Bonuses add minutes to every period that
+contains their effective date.
+"""
+import collections
+import datetime
+from typing import Iterable, List, Mapping, Optional, Tuple
+
+from parentopticon.db import timeline
+from parentopticon.db.connection import Connection
+from parentopticon.db.tables import ProgramGroup, ProgramGroupBonus
+
+DAILY_LIMIT_COLUMNS = (
+	"minutes_monday",
+	"minutes_tuesday",
+	"minutes_wednesday",
+	"minutes_thursday",
+	"minutes_friday",
+	"minutes_saturday",
+	"minutes_sunday",
+)
+
+Limits = collections.namedtuple("Limits", (
+	"minutes_used_today",
+	"minutes_used_week",
+	"minutes_used_month",
+	"minutes_remaining_today",
+	"minutes_remaining_week",
+	"minutes_remaining_month",
+))
+
+def evaluate(connection: Connection,
+	username: str,
+	program_group: ProgramGroup,
+	today: Optional[datetime.date] = None,
+	extra_minutes: float = 0) -> Limits:
+	"""Get the limits for a user and program group.
+
+	This reads the usage timeline and bonuses once each, for the range of
+	days that covers the current week and month.
+
+	Args:
+		today: The day to evaluate for. Defaults to today.
+		extra_minutes: Usage today that is not yet in the timeline, like
+			the unrecorded tail of open sessions.
+	"""
+	today = today or datetime.date.today()
+	first = period_start(today)
+	usage = {
+		day: timeline.minutes(buckets)
+		for day, buckets in timeline.days(connection, username, program_group.id, first, today).items()
+	}
+	if extra_minutes:
+		usage[today] = usage.get(today, 0) + extra_minutes
+	bonuses = ProgramGroupBonus.list_where(connection,
+		where="program_group = ? AND effective_date BETWEEN ? AND ?",
+		bindings=(program_group.id, first, today),
+	)
+	return evaluate_usage(program_group, usage, bonuses, today)
+
+def evaluate_usage(
+	program_group: ProgramGroup,
+	usage: Mapping[datetime.date, float],
+	bonuses: Iterable[ProgramGroupBonus],
+	today: datetime.date) -> Limits:
+	"""Get the limits for a program group from minutes used per day.
+
+	Usage and bonuses outside of the current week and month are ignored.
+	"""
+	week_start = today - datetime.timedelta(days=today.isoweekday() - 1)
+	month_start = today.replace(day=1)
+	used = _sum_periods(usage.items(), today, week_start, month_start)
+	bonus = _sum_periods(((b.effective_date, b.amount_minutes) for b in bonuses), today, week_start, month_start)
+	allowed = (
+		getattr(program_group, DAILY_LIMIT_COLUMNS[today.isoweekday() - 1]),
+		program_group.minutes_weekly,
+		program_group.minutes_monthly,
+	)
+	remaining = [
+		None if limit < 0 else limit + extra - spent
+		for limit, extra, spent in zip(allowed, bonus, used)
+	]
+	return Limits(
+		minutes_used_today = round(used[0], 1),
+		minutes_used_week = round(used[1], 1),
+		minutes_used_month = round(used[2], 1),
+		minutes_remaining_today = _round(remaining[0]),
+		minutes_remaining_week = _round(remaining[1]),
+		minutes_remaining_month = _round(remaining[2]),
+	)
+
+def minutes_remaining(limits: Limits) -> Optional[float]:
+	"Get the minutes remaining under the tightest limit, None if unlimited."
+	remaining = [r for r in (
+		limits.minutes_remaining_today,
+		limits.minutes_remaining_week,
+		limits.minutes_remaining_month,
+	) if r is not None]
+	return min(remaining) if remaining else None
+
+def period_start(today: datetime.date) -> datetime.date:
+	"Get the earliest day that matters for the limits on a given day."
+	week_start = today - datetime.timedelta(days=today.isoweekday() - 1)
+	return min(week_start, today.replace(day=1))
+
+def _round(minutes: Optional[float]) -> Optional[float]:
+	return None if minutes is None else round(minutes, 1)
+
+def _sum_periods(
+	amounts: Iterable[Tuple[datetime.date, float]],
+	today: datetime.date,
+	week_start: datetime.date,
+	month_start: datetime.date) -> List[float]:
+	"Sum (day, amount) pairs into today, this week and this month in one pass."
+	totals = [0, 0, 0]
+	for day, amount in amounts:
+		if day > today:
+			continue
+		if day == today:
+			totals[0] += amount
+		if day >= week_start:
+			totals[1] += amount
+		if day >= month_start:
+			totals[2] += amount
+	return totals
@@ -0,0 +1,242 @@
+"""
+Module for bringing an existing DB up to date with the models.
+
+Every startup creates missing tables, adds columns that a model has but
+its table lacks, and creates missing indexes. Changes that need more
+than that, like moving data between tables, are numbered migrations. The
+number of the last one applied is kept in PRAGMA user_version, or a
+SchemaVersion table on backends without it.
+
+Migrations that touch many rows work in chunks, committing after each so
+that other writers get the lock in between. They can carry on from where
+they were if the process stops part way through.
+"""
+import argparse
+import collections
+import copy
+import logging
+import time
+from typing import Callable, List, Set
+
+from parentopticon import log
+from parentopticon.db import intern, search, timeline
+from parentopticon.db.connection import Connection, DEFAULT_PATH
+from parentopticon.db.tables import create_all, create_indexes, Hostname, MigrationProgress, MODELS, Program, ProgramSession, ProgramSessionArchive, Site, Url, Username, WebsiteVisit
+
+LOGGER = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+# How long to leave the write lock free between chunks.
+CHUNK_PAUSE_SECONDS = 0.01
+
+Migration = collections.namedtuple("Migration", (
+	"description",
+	"function",
+))
+
+Status = collections.namedtuple("Status", (
+	"latest",
+	"missing_columns",
+	"missing_tables",
+	"pending",
+	"version",
+))
+
+def migrate(connection: Connection, chunk_size: int = CHUNK_SIZE) -> Status:
+	"Bring the DB up to date, return the status from before."
+	before = status(connection)
+	_log_status(before)
+	if before.missing_tables and len(before.missing_tables) == len(MODELS):
+		LOGGER.info("Creating a new DB at version %d.", before.latest)
+		create_all(connection)
+		_set_version(connection, before.latest)
+		return before
+	for model in MODELS:
+		connection.execute(model.create_statement(connection.backend))
+	search.create(connection)
+	_add_columns(connection)
+	for number, migration in enumerate(MIGRATIONS[before.version:], start=before.version + 1):
+		LOGGER.info("Applying migration %d: %s", number, migration.description)
+		started = time.monotonic()
+		migration.function(connection, chunk_size)
+		_set_version(connection, number)
+		LOGGER.info("Applied migration %d in %.1f seconds.", number, time.monotonic() - started)
+	create_indexes(connection)
+	return before
+
+def status(connection: Connection) -> Status:
+	"Get how far the DB is from the models."
+	tables = _tables(connection)
+	missing_tables = [model.__name__ for model in MODELS if model.__name__.lower() not in tables]
+	version = connection.backend.get_version(connection)
+	return Status(
+		latest = len(MIGRATIONS),
+		missing_columns = [
+			"{}.{}".format(model.__name__, name)
+			for model in MODELS if model.__name__.lower() in tables
+			for name in _missing_columns(connection, model)
+		],
+		missing_tables = missing_tables,
+		pending = [migration.description for migration in MIGRATIONS[version:]],
+		version = version,
+	)
+
+def _add_columns(connection: Connection) -> None:
+	"Add the columns that models have and their tables lack."
+	for model in MODELS:
+		for name in _missing_columns(connection, model):
+			column = model.COLUMNS[name]
+			if not column.null:
+				# A NOT NULL column can't be added without a default.
+				LOGGER.warning("Adding %s.%s without its NOT NULL constraint", model.__name__, name)
+				column = copy.copy(column)
+				column.null = True
+			definition = connection.backend.column_definition(name, column)
+			connection.execute("ALTER TABLE {} ADD COLUMN {}".format(model.__name__, definition))
+			LOGGER.info("Added column %s.%s", model.__name__, name)
+	connection.commit()
+
+def _backfill_timeline(connection: Connection, chunk_size: int) -> None:
+	"Record the usage of closed program sessions from before the usage timeline."
+	progress = MigrationProgress.search(connection, name="timeline")
+	if progress is None:
+		if connection.execute("SELECT 1 FROM UsageTimeline LIMIT 1").fetchone():
+			LOGGER.info("The usage timeline already has usage, not backfilling it.")
+			return
+		progress_id = MigrationProgress.insert(connection, name="timeline", position=0)
+		position = 0
+	else:
+		progress_id, position = progress.id, progress.position
+	program_groups = {program.id: program.program_group for program in Program.list(connection)}
+	while True:
+		sessions = list(ProgramSession.list_where(connection,
+			where="id > ? AND \"end\" IS NOT NULL ORDER BY id LIMIT ?",
+			bindings=(position, chunk_size),
+		))
+		if not sessions:
+			break
+		for session in sessions:
+			program_group = program_groups.get(session.program)
+			if program_group is not None:
+				timeline.record(connection, session.username, program_group, session.start, session.end)
+		position = sessions[-1].id
+		MigrationProgress.update(connection, progress_id, position=position)
+		time.sleep(CHUNK_PAUSE_SECONDS)
+
+def _intern_website_visits(connection: Connection, chunk_size: int) -> None:
+	"Intern the text columns of website visits from before interning."
+	columns = connection.backend.columns(connection, "WebsiteVisit")
+	if columns.get("url") == "TEXT":
+		connection.execute("DROP INDEX IF EXISTS WebsiteVisit_at")
+		connection.execute("ALTER TABLE WebsiteVisit RENAME TO WebsiteVisitText")
+		connection.execute(WebsiteVisit.create_statement(connection.backend))
+		connection.commit()
+	elif "websitevisittext" not in _tables(connection):
+		return
+	hostnames = intern.Interner(Hostname)
+	sites = intern.Interner(Site)
+	urls = intern.Interner(Url)
+	usernames = intern.Interner(Username)
+	# Visits keep their IDs, so the copy carries on after the last one copied.
+	last_id = connection.execute("SELECT MAX(id) FROM WebsiteVisit").fetchone()[0] or 0
+	while True:
+		rows = connection.execute(
+			"SELECT id, at, hostname, incognito, url, username FROM WebsiteVisitText "
+			"WHERE id > ? ORDER BY id LIMIT ?", (last_id, chunk_size)).fetchall()
+		if not rows:
+			break
+		connection.executemany(
+			"INSERT INTO WebsiteVisit (id, at, hostname, incognito, site, url, username) "
+			"VALUES (?, ?, ?, ?, ?, ?, ?)", [(
+				id_,
+				at,
+				hostnames.id(connection, hostname),
+				incognito,
+				sites.id(connection, intern.site(url)),
+				urls.id(connection, url),
+				usernames.id(connection, username),
+			) for id_, at, hostname, incognito, url, username in rows])
+		connection.commit()
+		last_id = rows[-1][0]
+		time.sleep(CHUNK_PAUSE_SECONDS)
+	connection.execute("DROP TABLE WebsiteVisitText")
+	connection.commit()
+
+def _log_status(current: Status) -> None:
+	LOGGER.info("DB schema is at version %d of %d.", current.version, current.latest)
+	for description in current.pending:
+		LOGGER.info("Pending migration: %s", description)
+	for name in current.missing_tables:
+		LOGGER.info("Missing table: %s", name)
+	for name in current.missing_columns:
+		LOGGER.info("Missing column: %s", name)
+
+def _missing_columns(connection: Connection, model) -> List[str]:
+	existing = connection.backend.columns(connection, model.__name__)
+	return [name for name, _ in model.columns_sorted() if name not in existing]
+
+def _drop_column(connection: Connection, model, name: str) -> None:
+	"Drop a column, rebuilding the table from its model where the DB can't drop columns."
+	if connection.backend.SUPPORTS_DROP_COLUMN:
+		connection.execute("ALTER TABLE {} DROP COLUMN {}".format(model.__name__, name))
+		connection.commit()
+		return
+	table = model.__name__
+	kept = ", ".join('"{}"'.format(column) for column in connection.backend.columns(connection, table)
+		if column in model.COLUMNS)
+	# In one transaction, so stopping part way leaves the old table.
+	connection.backend.begin_write(connection)
+	connection.execute("ALTER TABLE {0} RENAME TO {0}_rebuild".format(table))
+	connection.execute(model.create_statement(connection.backend))
+	connection.execute("INSERT INTO {0} ({1}) SELECT {1} FROM {0}_rebuild".format(table, kept))
+	connection.execute("DROP TABLE {}_rebuild".format(table))
+	connection.commit()
+	LOGGER.info("Rebuilt %s without %s", table, name)
+
+def _program_session_pids(connection: Connection, chunk_size: int) -> None:
+	"""Move the comma joined pids of open program sessions to ProgramSessionPid.
+
+	The pids column is dropped from ProgramSession and
+	ProgramSessionArchive, so the pids of closed and archived sessions are
+	gone for good. Their processes have exited, so nothing used them.
+	"""
+	for model in (ProgramSession, ProgramSessionArchive):
+		table = model.__name__
+		if "pids" not in connection.backend.columns(connection, table):
+			continue
+		if table == "ProgramSession":
+			rows = connection.execute("SELECT id, pids FROM ProgramSession WHERE \"end\" IS NULL").fetchall()
+			connection.executemany(
+				"INSERT INTO ProgramSessionPid (pid, program_session) VALUES (?, ?)",
+				[(pid, id_) for id_, pids in rows
+					for pid in sorted({int(pid) for pid in pids.split(",") if pid.strip().isdigit()})])
+		_drop_column(connection, model, "pids")
+
+def _set_version(connection: Connection, version: int) -> None:
+	connection.backend.set_version(connection, version)
+
+def _tables(connection: Connection) -> Set[str]:
+	"Get the names of every table, in lower case since PostgreSQL folds them."
+	return {name.lower() for name in connection.backend.tables(connection)}
+
+# Never reorder or remove these, the DB stores how many it has applied.
+MIGRATIONS = (
+	Migration("Intern website visits", _intern_website_visits),
+	Migration("Record past program sessions in the usage timeline", _backfill_timeline),
+	Migration("Move program session pids to their own table", _program_session_pids),
+)
+
+def main() -> None:
+	"Show the migration status of a DB or bring it up to date."
+	parser = argparse.ArgumentParser()
+	parser.add_argument("-d", "--db", default=DEFAULT_PATH, help="The DB to migrate.")
+	parser.add_argument("--status", action="store_true", help="Only show the status.")
+	args = parser.parse_args()
+
+	log.setup(level=logging.INFO)
+	connection = Connection()
+	connection.connect(args.db)
+	if args.status:
+		_log_status(status(connection))
+	else:
+		migrate(connection)
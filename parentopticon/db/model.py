@@ -1,12 +1,40 @@
 import collections
 import datetime
+import functools
 import logging
 import sqlite3
-from typing import Any, Iterable, List, Mapping, Optional, Tuple
+import time
+from typing import Any, Callable, Iterable, List, Mapping, Optional, Tuple
+
+from parentopticon import metrics
+from parentopticon.db import backend as backends
 
 LOGGER = logging.getLogger(__name__)
 
 StatementAndBinding = Tuple[str, Iterable[Any]]
+# Called with the connection, the row ID (None for deletes) and the values written.
+Listener = Callable[["Connection", Optional[int], Mapping[str, Any]], None]
+# Listeners for writes to each model class.
+_LISTENERS = collections.defaultdict(list)
+
+SQL_SECONDS = metrics.REGISTRY.histogram("parentopticon_sql_seconds",
+	"Time spent in Model methods that run SQL.", labels=("model", "method"))
+
+@functools.lru_cache(maxsize=None)
+def _sql_seconds(model: str, method: str) -> metrics.HistogramChild:
+	return SQL_SECONDS.child(model=model, method=method)
+
+def _timed(method: Callable) -> Callable:
+	"Time a Model classmethod by table and method name."
+	name = method.__name__
+	@functools.wraps(method)
+	def wrapper(cls, *args, **kwargs):
+		start = time.perf_counter()
+		try:
+			return method(cls, *args, **kwargs)
+		finally:
+			_sql_seconds(cls.__name__, name).observe(time.perf_counter() - start)
+	return wrapper
 
 class Connection:
 	pass
@@ -52,6 +80,10 @@ class ColumnForeignKey(Column):
 			primary_key=False)
 
 
+class ColumnBlob(Column):
+	"Represents a column of raw bytes."
+	TYPENAME = "BLOB"
+
 class ColumnBoolean(Column):
 	"Represents a boolean column>"
 	TYPENAME = "bool"
@@ -72,14 +104,37 @@ class ColumnInteger(Column):
 	"Represents a single integer column on a table."
 	TYPENAME = "INTEGER"
 
+class Index:
+	"Represents an index over one or more columns of a table."
+	def __init__(self, *columns: str, unique: bool = False) -> None:
+		self.columns = columns
+		self.unique = unique
+
+	def create_statement(self, table: str, name: str, backend: Optional[backends.Backend] = None) -> str:
+		"Get the SQL statement to create this index."
+		backend = backend or backends.SQLITE
+		return "CREATE {}INDEX IF NOT EXISTS {}_{} ON {} ({});".format(
+			"UNIQUE " if self.unique else "",
+			table,
+			name,
+			table,
+			", ".join(backend.quote(column) for column in self.columns),
+		)
+
 class Model:
 	"Represents an object from a database."
 	COLUMNS = {}
+	INDEXES = {}
 
 	def __init__(self, **kwargs) -> None:
 		for k, v in kwargs.items():
 			setattr(self, k, v)
 
+	@classmethod
+	def add_listener(cls, listener: Listener) -> None:
+		"Call a function after every write to this table, in the write's transaction."
+		_LISTENERS[cls].append(listener)
+
 	@classmethod
 	def columns(cls) -> Mapping[str, Column]:
 		return cls.COLUMNS
@@ -93,9 +148,10 @@ class Model:
 			yield (k, cls.COLUMNS[k])
 
 	@classmethod
-	def create_statement(cls):
+	def create_statement(cls, backend: Optional[backends.Backend] = None) -> str:
 		"Get the SQL statement to create the table."
-		column_lines = [column.create_statement(name) for name, column in cls.columns_sorted()]
+		backend = backend or backends.SQLITE
+		column_lines = [backend.column_definition(name, column) for name, column in cls.columns_sorted()]
 		column_content = ",\n".join(column_lines)
 		return "CREATE TABLE IF NOT EXISTS {} (\n{}\n);".format(
 			cls.__name__,
@@ -103,6 +159,36 @@ class Model:
 		)
 
 	@classmethod
+	def create_index_statements(cls, backend: Optional[backends.Backend] = None) -> Iterable[str]:
+		"Get the SQL statements to create the indexes on the table."
+		for name in sorted(cls.INDEXES.keys()):
+			yield cls.INDEXES[name].create_statement(cls.__name__, name, backend)
+
+	@classmethod
+	@_timed
+	def delete_where(cls,
+		connection: Connection,
+		where: str,
+		bindings: Iterable[Any] = (),
+		) -> int:
+		"""Delete rows from this table.
+
+		Args:
+			connection: The DB connection to use.
+			where: A 'WHERE' clause, minus the 'WHERE'.
+			bindings: Bindings for the where clause.
+		Returns:
+			The number of rows deleted.
+		"""
+		statement = "DELETE FROM {} WHERE {}".format(cls.__name__, where)
+		cursor = connection.execute(statement, bindings)
+		rowcount = cursor.rowcount
+		cls._notify(connection, None, {})
+		connection.commit()
+		return rowcount
+
+	@classmethod
+	@_timed
 	def get(cls, connection: Connection, id_: int) -> Optional["Model"]:
 		"Get a single row by its ID"
 		select_statement = cls.select_statement(
@@ -115,10 +201,14 @@ class Model:
 		return cls(**data)
 
 	@classmethod
+	@_timed
 	def insert(cls, connection: Connection, **kwargs) -> int:
 		"Insert a new row into the table. Return rowid."
 		statement, values = cls.insert_statement(**kwargs)
-		return connection.execute_commit_return(statement, values)
+		rowid = connection.execute_return(statement, values)
+		cls._notify(connection, rowid, kwargs)
+		connection.commit()
+		return rowid
 
 	@classmethod
 	def insert_statement(cls, **kwargs) -> StatementAndBinding:
@@ -172,17 +262,21 @@ class Model:
 		"""
 		select_statement = cls.select_statement(where=where)
 		bindings = bindings or ()
+		start = time.perf_counter()
 		try:
 			rows = connection.execute(select_statement, bindings)
 		except sqlite3.OperationalError as ex:
 			LOGGER.error("%s\n\nwhere: %s\nbindings: %s", ex, where, bindings)
 			raise
+		# Rows are read as they are used, so this only times running the query.
+		_sql_seconds(cls.__name__, "list_where").observe(time.perf_counter() - start)
 		column_names = [k for k, _ in cls.columns_sorted()]
 		for row in rows:
 			data = {k: v for k, v in zip(column_names, row)}
 			yield cls(**data)
 
 	@classmethod
+	@_timed
 	def search(cls, connection: Connection, **kwargs) -> Optional["Model"]:
 		"""Search for a single row."""
 		where, bindings = kwargs_to_where_and_bindings(**kwargs)
@@ -205,7 +299,7 @@ class Model:
 		Returns:
 			The SQL statement for getting a single row.
 		"""
-		column_names = [k for k, _ in cls.columns_sorted()]
+		column_names = ['"{}"'.format(k) for k, _ in cls.columns_sorted()]
 		return "SELECT {} FROM {} {}".format(
 			", ".join(column_names),
 			cls.__name__,
@@ -218,6 +312,7 @@ class Model:
 		return "DELETE FROM {}".format(cls.__name__)
 
 	@classmethod
+	@_timed
 	def update(cls, connection: Connection, id_: int, **kwargs) -> int:
 		"Update a single row."
 		if not kwargs:
@@ -228,7 +323,76 @@ class Model:
 			sets,
 		)
 		bindings.append(id_)
-		return connection.execute_commit_return(statement, bindings)
+		result = connection.execute_return(statement, bindings)
+		cls._notify(connection, id_, kwargs)
+		connection.commit()
+		return result
+
+	@classmethod
+	@_timed
+	def update_where(cls,
+		connection: Connection,
+		where: str,
+		bindings: Iterable[Any] = (),
+		**kwargs) -> List["Model"]:
+		"""Update every row matching a where clause in one statement.
+
+		Args:
+			connection: The DB connection to use.
+			where: A 'WHERE' clause, minus the 'WHERE'.
+			bindings: Bindings for the where clause.
+			kwargs: column names to their new values.
+		Returns:
+			The updated rows, as they are after the update. No other
+			caller can update the same rows in between.
+		"""
+		if not kwargs:
+			return []
+		sets, set_bindings = kwargs_to_set_and_bindings(**kwargs)
+		column_names = [k for k, _ in cls.columns_sorted()]
+		if connection.backend.SUPPORTS_RETURNING:
+			statement = "UPDATE {} SET {} WHERE {} RETURNING {}".format(
+				cls.__name__,
+				sets,
+				where,
+				", ".join('"{}"'.format(name) for name in column_names),
+			)
+			rows = connection.execute(statement, set_bindings + list(bindings)).fetchall()
+		else:
+			rows = cls._update_where_emulated(connection, sets, set_bindings, where, list(bindings))
+		updated = [cls(**dict(zip(column_names, row))) for row in rows]
+		if updated:
+			cls._notify(connection, None, kwargs)
+		connection.commit()
+		return updated
+
+	@classmethod
+	def _update_where_emulated(cls,
+		connection: Connection,
+		sets: str,
+		set_bindings: List[Any],
+		where: str,
+		bindings: List[Any]) -> List[Tuple[Any]]:
+		"Do what UPDATE ... RETURNING does on SQLite versions without it."
+		# Take the write lock before reading so nobody claims the rows in between.
+		connection.backend.begin_write(connection)
+		ids = [row[0] for row in connection.execute(
+			"SELECT id FROM {} WHERE {}".format(cls.__name__, where),
+			bindings,
+		).fetchall()]
+		if not ids:
+			return []
+		placeholders = ", ".join("?" * len(ids))
+		connection.execute("UPDATE {} SET {} WHERE id IN ({})".format(
+			cls.__name__, sets, placeholders), set_bindings + ids)
+		return connection.execute(
+			cls.select_statement(where="id IN ({})".format(placeholders)), ids).fetchall()
+
+	@classmethod
+	def _notify(cls, connection: Connection, id_: Optional[int], values: Mapping[str, Any]) -> None:
+		"Tell listeners about a write, before it is committed so their writes commit with it."
+		for listener in _LISTENERS.get(cls, ()):
+			listener(connection, id_, values)
 
 def kwargs_to_set_and_bindings(**kwargs) -> Tuple[str, List[Any]]:
 	"Turn kwargs into a SET update statement and matching bindings."
@@ -236,9 +400,9 @@ def kwargs_to_set_and_bindings(**kwargs) -> Tuple[str, List[Any]]:
 	bindings = []
 	for k, v in kwargs.items():
 		if v is None:
-			set_parts.append("{} = NULL".format(k))
+			set_parts.append("\"{}\" = NULL".format(k))
 		else:
-			set_parts.append("{} = ?".format(k))
+			set_parts.append("\"{}\" = ?".format(k))
 			bindings.append(v)
 	statement = ", ".join(set_parts)
 	return statement, bindings
@@ -251,9 +415,9 @@ def kwargs_to_where_and_bindings(**kwargs) -> Tuple[Optional[str], List[Any]]:
 	bindings = []
 	for k, v in kwargs.items():
 		if v is None:
-			where_parts.append("{} IS NULL".format(k))
+			where_parts.append("\"{}\" IS NULL".format(k))
 		else:
-			where_parts.append("{} = ?".format(k))
+			where_parts.append("\"{}\" = ?".format(k))
 			bindings.append(v)
 	where = " AND ".join(where_parts)
 	return where, bindings
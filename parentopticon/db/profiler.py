@@ -0,0 +1,150 @@
+"""
+Module for profiling the statements a connection runs.
+
+Profiling is off unless a Profiler is set on a connection. Statements
+are grouped by their normalized text, with literals and lists of
+placeholders collapsed, so the same query with different values counts
+as one. Each group keeps how often it ran, how long it took, how many
+rows it touched and the types of its bindings. Statements slower than a
+threshold are logged. The first time a statement is seen its plan can be
+explained, so that full table scans stand out.
+"""
+import collections
+import logging
+import re
+import threading
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+# Sorts for Profiler.top.
+SORTS = ("count", "max_seconds", "rows", "total_seconds")
+
+_IN_LIST = re.compile(r"\bIN \(\?(, \?)+\)", re.IGNORECASE)
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(\.\d+)?\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_VALUES_LIST = re.compile(r"(\(\?(?:, \?)*\))(\s*,\s*\(\?(?:, \?)*\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+class Stat:
+	"What a profiler knows about one normalized statement."
+	def __init__(self, statement: str) -> None:
+		self.count = 0
+		self.full_scan = False
+		self.max_seconds = 0.0
+		self.plan: List[str] = []
+		self.rows = 0
+		self.shapes = set()
+		self.statement = statement
+		self.total_seconds = 0.0
+
+	@property
+	def mean_seconds(self) -> float:
+		return self.total_seconds / self.count if self.count else 0
+
+class Profiler:
+	"""Records the statements run on a connection.
+
+	Args:
+		slow_seconds: Log statements that take longer than this, None to log none.
+		explain: Whether to explain the plan of each new statement.
+		size: How many different statements to keep, the least run are dropped.
+	"""
+	def __init__(self,
+		slow_seconds: Optional[float] = 0.1,
+		explain: bool = False,
+		size: int = 500) -> None:
+		self.explain = explain
+		self.size = size
+		self.slow_seconds = slow_seconds
+		self._lock = threading.Lock()
+		self._stats = collections.OrderedDict()
+
+	def clear(self) -> None:
+		"Forget every statement."
+		with self._lock:
+			self._stats.clear()
+
+	def record(self,
+		connection: Any,
+		statement: str,
+		bindings: Sequence[Any],
+		rows: int,
+		seconds: float) -> None:
+		"Record one run of a statement."
+		normalized = normalize(statement)
+		with self._lock:
+			stat = self._stats.get(normalized)
+			new = stat is None
+			if new:
+				if len(self._stats) >= self.size:
+					self._evict()
+				stat = Stat(normalized)
+				self._stats[normalized] = stat
+			stat.count += 1
+			stat.max_seconds = max(stat.max_seconds, seconds)
+			stat.rows += max(rows, 0)
+			stat.shapes.add(shape(bindings))
+			stat.total_seconds += seconds
+		if self.slow_seconds is not None and seconds > self.slow_seconds:
+			LOGGER.warning("Slow statement took %.1fms and touched %d rows: %s",
+				seconds * 1000, rows, normalized)
+		if new and self.explain:
+			self._explain(connection, stat, statement, bindings)
+
+	def top(self, n: int = 20, sort: str = "total_seconds") -> List[Stat]:
+		"Get the statements that are highest by a sort."
+		if sort not in SORTS:
+			raise ValueError("Can't sort statements by '{}'".format(sort))
+		with self._lock:
+			stats = list(self._stats.values())
+		return sorted(stats, key=lambda stat: getattr(stat, sort), reverse=True)[:n]
+
+	def _evict(self) -> None:
+		"Drop the statement that has run the fewest times."
+		fewest = min(self._stats.values(), key=lambda stat: stat.count)
+		del self._stats[fewest.statement]
+
+	def _explain(self, connection: Any, stat: Stat, statement: str, bindings: Sequence[Any]) -> None:
+		if not statement.lstrip().upper().startswith(("DELETE", "SELECT", "UPDATE", "WITH")):
+			return
+		try:
+			plan = connection.backend.explain(connection.connection, connection.backend.translate(statement), bindings)
+		except Exception as ex:
+			LOGGER.debug("Failed to explain %s: %s", stat.statement, ex)
+			return
+		full_scan = any(connection.backend.is_full_scan(line) for line in plan)
+		with self._lock:
+			stat.plan = plan
+			stat.full_scan = full_scan
+		if full_scan:
+			LOGGER.info("Statement scans a whole table: %s\n\t%s", stat.statement, "\n\t".join(plan))
+
+class ProfiledCursor:
+	"The rows of a profiled statement, read ahead so they can be counted."
+	def __init__(self, cursor: Any, rows: List[Tuple[Any]]) -> None:
+		self.description = cursor.description
+		self.lastrowid = cursor.lastrowid
+		self.rowcount = cursor.rowcount if cursor.rowcount >= 0 else len(rows)
+		self._rows = iter(rows)
+
+	def __iter__(self) -> Iterator[Tuple[Any]]:
+		return self._rows
+
+	def fetchall(self) -> List[Tuple[Any]]:
+		return list(self._rows)
+
+	def fetchone(self) -> Optional[Tuple[Any]]:
+		return next(self._rows, None)
+
+def normalize(statement: str) -> str:
+	"Get the text of a statement with the values that vary between runs taken out."
+	normalized = _STRING.sub("?", statement)
+	normalized = _NUMBER.sub("?", normalized)
+	normalized = _WHITESPACE.sub(" ", normalized).strip()
+	normalized = _VALUES_LIST.sub(r"\1, ...", normalized)
+	return _IN_LIST.sub("IN (?, ...)", normalized)
+
+def shape(bindings: Iterable[Any]) -> str:
+	"Describe bindings by the types of their values."
+	return ",".join(type(value).__name__ for value in bindings)
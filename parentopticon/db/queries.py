@@ -4,10 +4,18 @@ import logging
 import sqlite3
 from typing import Any, Iterable, List, Mapping, Optional, Tuple
 
+from parentopticon import accounting, metrics, window_week
+from parentopticon.db import cache, intern, limits, shared, timeline
 from parentopticon.db.connection import Connection
-from parentopticon.db.tables import OneTimeMessage, Process, Program, ProgramGroup, ProgramProcess, ProgramSession, WindowWeek, WindowWeekDay
+from parentopticon.db.tables import Hostname, OneTimeMessage, Process, Program, ProgramGroup, ProgramGroupBonus, ProgramProcess, ProgramSession, ProgramSessionPid, Site, Url, Username, WebsiteVisit, WindowWeek, WindowWeekDay, WindowWeekDaySpan, WindowWeekDaySpanOverride
 
 LOGGER = logging.getLogger(__name__)
+GENERATIONS = shared.Generations()
+STATUS_CACHE = cache.StatusCache()
+HOSTNAMES = intern.Interner(Hostname)
+SITES = intern.Interner(Site)
+URLS = intern.Interner(Url)
+USERNAMES = intern.Interner(Username)
 
 StatementAndBinding = Tuple[str, Iterable[Any]]
 
@@ -15,40 +23,43 @@ Action = collections.namedtuple("Action", (
 	"content",
 	"type",
 ))
-def actions_for_username(connection: Connection, hostname: str, username: str) -> Iterable[Action]:
-	LOGGER.info("Getting list of actions for %s on '%s'", username, hostname)
+def actions_for_username(connection: Connection, hostname: str, username: str,
+		max_gap_seconds: int = accounting.MAX_GAP_SECONDS) -> Iterable[Action]:
+	LOGGER.debug("Getting list of actions for %s on '%s'", username, hostname)
 	messages = actions_for_username_messages(connection, hostname, username)
-	kills = actions_for_username_kills(connection, hostname, username)
+	kills = actions_for_username_kills(connection, hostname, username, max_gap_seconds)
 	return messages + kills
 
 def actions_for_username_messages(connection: Connection, hostname: str, username: str) -> Iterable[Action]:
-	one_time_messages = list(OneTimeMessage.list(
+	# Claim the unsent messages in one statement so that a concurrent poll
+	# can't deliver them a second time.
+	one_time_messages = OneTimeMessage.update_where(
 		connection,
-		username=username,
-		sent=None,
-	))
-	LOGGER.info("Got %d one-time messages for %s", len(one_time_messages), username)
-	for otm in one_time_messages:
-		OneTimeMessage.update(
-			connection,
-			otm.id,
-			hostname=hostname,
-			sent=datetime.datetime.now(),
-		)
+		where="username = ? AND sent IS NULL",
+		bindings=(username,),
+		hostname=hostname,
+		sent=datetime.datetime.now(),
+	)
+	LOGGER.debug("Got %d one-time messages for %s", len(one_time_messages), username)
 	return [Action(
 		content=otm.content,
 		type="warn",
 	) for otm in one_time_messages]
 
-def actions_for_username_kills(connection: Connection, hostname: str, username: str) -> Iterable[Action]:
-	program_groups = list(ProgramGroup.list(connection))
-	programs = list(Program.list(connection))
-	statuses = _user_to_status_for_program_groups(connection, username, program_groups, programs)
-	pids = set()
+def actions_for_username_kills(connection: Connection, hostname: str, username: str,
+		max_gap_seconds: int = accounting.MAX_GAP_SECONDS) -> Iterable[Action]:
+	"Get the kills for a host, only of its own pids, since the same pid on another host is another process."
+	statuses = status_for_username(connection, username, max_gap_seconds)
+	program_group_ids = set()
 	for status in statuses.values():
-		if status.minutes_remaining_today < 0:
-			pids.update(status.pids)
-	LOGGER.info("Killing pids %s", pids)
+		if status.minutes_remaining is not None and status.minutes_remaining < 0:
+			program_group_ids.add(status.group)
+		elif status.minutes_until_lock == 0:
+			program_group_ids.add(status.group)
+	program_ids = [program.id for program in reference(connection).programs
+		if program.program_group in program_group_ids]
+	pids = program_session_pids_on_host(connection, hostname, username, program_ids)
+	LOGGER.info("Killing pids %s on %s", pids, hostname)
 	return [Action(
 		content = pid,
 		type = "kill",
@@ -56,66 +67,125 @@ def actions_for_username_kills(connection: Connection, hostname: str, username:
 
 def list_program_by_process(connection: Connection) -> Mapping[str, str]:
 	"Get the mapping of processes to their program names."
-	programs = Program.list(connection)
-	program_by_id = {program.id: program.name for program in programs}
-	processes = ProgramProcess.list(connection)
-	return {process.name: program_by_id[process.program] for process in processes}
+	return dict(reference(connection).program_by_process)
 
 def program_session_close_except(
 	connection: Connection,
 	hostname: str,
 	exempt_program_names: Iterable[str],
-	) -> None:
-	"Close all program_sessions, except any for the named programs."
-	now = datetime.datetime.now()
-	programs = Program.list(connection)
-	program_id_to_name = {program.id: program.name for program in programs}
-	open_sessions = ProgramSession.list(connection, hostname=hostname, end=None)
+	moment: Optional[datetime.datetime] = None,
+	elapsed_seconds: float = 0,
+	max_gap_seconds: int = accounting.MAX_GAP_SECONDS,
+	) -> int:
+	"""Close all program_sessions, except any for the named programs.
+
+	Args:
+		moment: The moment, on our clock, the host was observed without
+			the programs running. Defaults to now.
+		elapsed_seconds: The client's time since its last report.
+		max_gap_seconds: The longest gap we will credit as usage.
+	Returns:
+		The number of sessions closed.
+	"""
+	moment = moment or datetime.datetime.now()
+	programs = {program.id: program for program in reference(connection).programs}
+	open_sessions = list(ProgramSession.list(connection, hostname=hostname, end=None))
+	closed = 0
 	for program_session in open_sessions:
-		program_name = program_id_to_name[program_session.program]
-		if program_name in exempt_program_names:
+		program = programs[program_session.program]
+		if program.name in exempt_program_names:
 			continue
+		closed += 1
+		last_seen = program_session.last_seen or moment
+		end = accounting.session_end(
+			last_seen,
+			moment,
+			elapsed_seconds,
+			max_gap_seconds,
+		)
 		ProgramSession.update(
 			connection,
 			program_session.id,
-			end=now,
+			end=end,
 		)
+		_program_session_pids_clear(connection, program_session.id)
+		_record_usage(connection, program_session.username, program.program_group, last_seen, end)
 		LOGGER.info("Ended program session %s", program_session.id)
-	
+	return closed
+
 
 def program_session_create_or_add(
 		connection: Connection,
 		hostname: str,
 		username: str,
 		elapsed_seconds: int,
-		program_name: str, pids: Iterable[int]) -> int:
-	"Either create a new program session or update an existing one."
-	program = Program.search(connection, name=program_name)
+		program_name: str, pids: Iterable[int],
+		moment: Optional[datetime.datetime] = None,
+		max_gap_seconds: int = accounting.MAX_GAP_SECONDS) -> int:
+	"""Either create a new program session or update an existing one.
+
+	An open session that was last seen longer ago than the maximum gap
+	is closed where it was last seen and a new one is started, so that
+	downtime is not credited as usage.
+	"""
+	program_session_id, _ = _program_session_create_or_add(connection, hostname, username, elapsed_seconds,
+		program_name, pids,
+		moment=moment,
+		max_gap_seconds=max_gap_seconds)
+	return program_session_id
+
+def _program_session_create_or_add(
+		connection: Connection,
+		hostname: str,
+		username: str,
+		elapsed_seconds: int,
+		program_name: str, pids: Iterable[int],
+		moment: Optional[datetime.datetime] = None,
+		max_gap_seconds: int = accounting.MAX_GAP_SECONDS) -> Tuple[int, bool]:
+	"See program_session_create_or_add, also return whether more than when it was last seen changed."
+	moment = moment or datetime.datetime.now()
+	program = reference(connection).program_by_name[program_name]
 	program_session = ProgramSession.search(connection,
 		program=program.id,
 		hostname=hostname,
 		username=username,
 		end=None)
+	if program_session is not None:
+		last_seen = program_session.last_seen or moment
+		if not accounting.is_continuous(last_seen, moment, elapsed_seconds, max_gap_seconds):
+			ProgramSession.update(connection,
+				program_session.id,
+				end = last_seen,
+			)
+			_program_session_pids_clear(connection, program_session.id)
+			LOGGER.info("Ended program session %d after a gap since %s",
+				program_session.id, last_seen)
+			program_session = None
 	if program_session is None:
+		start = accounting.session_start(moment, elapsed_seconds, max_gap_seconds)
 		program_session_id = ProgramSession.insert(connection,
 			end = None,
 			hostname = hostname,
-			pids = ",".join(sorted(pids)),
+			last_seen = moment,
 			program = program.id,
-			start = datetime.datetime.now(),
+			start = start,
 			username = username,
 		)
+		_program_session_pids_update(connection, program_session_id, pids, new=True)
+		_record_usage(connection, username, program.program_group, start, moment)
 		LOGGER.debug("Created new program session %s", program_session_id)
+		changed = True
 	else:
 		program_session_id = program_session.id
+		last_seen = program_session.last_seen or moment
 		ProgramSession.update(connection,
 			program_session_id,
-			pids = ",".join(sorted(pids)),
+			last_seen = max(moment, last_seen),
 		)
-		LOGGER.debug("Updated program session %d to have pids %s",
-			program_session_id,
-			sorted(pids))
-	return program_session_id
+		changed = _program_session_pids_update(connection, program_session_id, pids)
+		_record_usage(connection, username, program.program_group, last_seen, moment)
+		LOGGER.debug("Updated program session %d", program_session_id)
+	return program_session_id, changed
 
 
 def program_session_ensure_closed(connection: Connection, program_id: int) -> None:
@@ -137,6 +207,40 @@ def program_session_ensure_exists(connection: Connection, program_name: str, pid
 		program_id=program_id)
 
 
+def program_session_pids(connection: Connection, program_session_ids: Iterable[int]) -> List[int]:
+	"Get the pids of some open program sessions."
+	program_session_ids = list(program_session_ids)
+	if not program_session_ids:
+		return []
+	return [row.pid for row in ProgramSessionPid.list_where(connection,
+		where="program_session IN ({})".format(", ".join("?" * len(program_session_ids))),
+		bindings=program_session_ids,
+	)]
+
+def program_session_pids_on_host(connection: Connection,
+		hostname: str,
+		username: str,
+		program_ids: Iterable[int]) -> List[int]:
+	"Get the pids of a user's open program sessions on one host among some programs."
+	program_ids = list(program_ids)
+	if not program_ids:
+		return []
+	rows = connection.execute(
+		"SELECT DISTINCT ProgramSessionPid.pid FROM ProgramSessionPid "
+		"JOIN ProgramSession ON ProgramSession.id = ProgramSessionPid.program_session "
+		"WHERE ProgramSession.hostname = ? AND ProgramSession.username = ? "
+		"AND ProgramSession.\"end\" IS NULL AND ProgramSession.program IN ({})".format(
+			", ".join("?" * len(program_ids))),
+		[hostname, username] + program_ids).fetchall()
+	return sorted(row[0] for row in rows)
+
+def program_session_pids_by_session(connection: Connection) -> Mapping[int, List[int]]:
+	"Get the pids of every open program session."
+	result = collections.defaultdict(list)
+	for row in ProgramSessionPid.list(connection):
+		result[row.program_session].append(row.pid)
+	return {program_session: sorted(pids) for program_session, pids in result.items()}
+
 def program_session_list_by_program(connection: Connection, program_id: int) -> Iterable[ProgramSession]:
 	"""Get all the program sessions for a particular program."""
 	for data in connection.cursor.execute(
@@ -171,23 +275,80 @@ def program_session_list_since(
 		bindings=bindings,
 	)
 
+def reference(connection: Connection) -> cache.Reference:
+	"""Get the programs, program groups and process mapping.
+
+	These are cached until they are next written. The result is shared,
+	do not modify it.
+	"""
+	return REFERENCE_CACHE.get(connection)
+
+def reference_version() -> int:
+	"Get the version of the reference data, which changes on every write to it."
+	return REFERENCE_CACHE.version
+
+def reset_caches() -> None:
+	"Forget everything cached from the DB."
+	GENERATIONS.clear()
+	REFERENCE_CACHE.invalidate()
+	STATUS_CACHE.clear()
+	for interner in (HOSTNAMES, SITES, URLS, USERNAMES):
+		interner.clear()
+
 def snapshot_store(
 		connection: Connection,
 		hostname: str,
 		username: str,
 		elapsed_seconds: int,
-		pid_to_program: Mapping[int, str]) -> None:
-	"Take a snapshot from a host, store it."
+		pid_to_program: Mapping[int, str],
+		moment: Optional[datetime.datetime] = None,
+		max_gap_seconds: int = accounting.MAX_GAP_SECONDS) -> None:
+	"""Take a snapshot from a host, store it.
+
+	Args:
+		moment: When the snapshot was taken, on our clock. Defaults to now.
+		max_gap_seconds: The longest gap between snapshots we will credit
+			as continuous usage.
+	"""
+	moment = moment or datetime.datetime.now()
 	# create a list of pids for each program
 	program_to_pids = collections.defaultdict(list)
 	for pid, program in pid_to_program.items():
 		program_to_pids[program].append(pid)
 	LOGGER.debug("Program to pids: %s", program_to_pids)
+	changed = False
 	for program, pids in program_to_pids.items():
-		program_session_create_or_add(connection, hostname, username, elapsed_seconds, program, pids)
-	program_session_close_except(connection, hostname, set(program_to_pids.keys()))
+		_, session_changed = _program_session_create_or_add(connection, hostname, username, elapsed_seconds,
+			program, pids,
+			moment=moment,
+			max_gap_seconds=max_gap_seconds)
+		changed = changed or session_changed
+	closed = program_session_close_except(connection, hostname, set(program_to_pids.keys()),
+		moment=moment,
+		elapsed_seconds=elapsed_seconds,
+		max_gap_seconds=max_gap_seconds)
+	STATUS_CACHE.invalidate(username=username)
+	# Other workers' cached statuses stay right while sessions only carry
+	# on, since they expire when the sessions would stop counting. They
+	# only need telling when sessions or their pids change.
+	if changed or closed:
+		GENERATIONS.bump(connection, "status:" + username)
+		connection.commit()
 	
 
+def sync_caches(connection: Connection) -> None:
+	"""Drop cached values that another process has written since we cached them.
+
+	The webserver calls this once at the start of each request.
+	"""
+	for name, generation in GENERATIONS.changed(connection).items():
+		if name == "reference":
+			REFERENCE_CACHE.invalidate(generation)
+		elif name == "status":
+			STATUS_CACHE.invalidate()
+		elif name.startswith("status:"):
+			STATUS_CACHE.invalidate(username=name[len("status:"):])
+
 def today_start() -> datetime.datetime:
 	"Get the starting moment for today."
 	now = datetime.datetime.now()
@@ -200,27 +361,47 @@ def today_start() -> datetime.datetime:
 Status = collections.namedtuple("Status", (
 	"group",
 	"minutes_used_today",
+	"minutes_used_week",
+	"minutes_used_month",
+	"minutes_remaining",
 	"minutes_remaining_today",
+	"minutes_remaining_week",
+	"minutes_remaining_month",
+	"minutes_until_lock",
 	"pids",
 ))
-def user_to_status(connection: Connection) -> Mapping[str, Mapping[str, Status]]:
+def status_for_username(connection: Connection, username: str,
+		max_gap_seconds: int = accounting.MAX_GAP_SECONDS) -> Mapping[str, Status]:
+	"""Get the mapping of group names to status for a user.
+
+	Args:
+		max_gap_seconds: The longest gap between snapshots we will credit
+			as continuous usage, which decides how long open sessions count.
+	"""
+	data = reference(connection)
+	return _user_to_status_for_program_groups(connection, username, data.program_groups, data.programs,
+		max_gap_seconds)
+
+def user_to_status(connection: Connection,
+		max_gap_seconds: int = accounting.MAX_GAP_SECONDS) -> Mapping[str, Mapping[str, Status]]:
 	"""Get a mapping of usernames to their current status.
 
 	The results map from a username to another mapping. That inner mapping maps
 	from a group name to the minutes left.
 	"""
 	results = {}
-	program_groups = list(ProgramGroup.list(connection))
-	programs = list(Program.list(connection))
+	data = reference(connection)
 	for username in usernames(connection):
-		results[username] = _user_to_status_for_program_groups(connection, username, program_groups, programs)
+		results[username] = _user_to_status_for_program_groups(connection, username, data.program_groups, data.programs,
+			max_gap_seconds)
 	return results
 
-def user_to_usage(connection: Connection, program_group: ProgramGroup) -> Mapping[str, Status]:
+def user_to_usage(connection: Connection, program_group: ProgramGroup,
+		max_gap_seconds: int = accounting.MAX_GAP_SECONDS) -> Mapping[str, Status]:
 	"Get a mapping of usernames to their current status."
-	programs = list(Program.list(connection))
+	programs = reference(connection).programs
 	return {
-		username: _user_to_status_for_program_group(connection, username, program_group, programs)
+		username: _user_to_status_for_program_group(connection, username, program_group, programs, max_gap_seconds)
 		for username in usernames(connection)
 	}
 	
@@ -230,24 +411,48 @@ def usernames(connection: Connection) -> Iterable[str]:
 	usernames = [row[0] for row in rows]
 	return usernames
 	
-def _minutes_allowed_today(program_group: ProgramGroup) -> int:
-	"Get the minutes allowed today."
-	today = datetime.datetime.now().isoweekday()
-	prop = [
-		"minutes_monday",
-		"minutes_tuesday",
-		"minutes_wednesday",
-		"minutes_thursday",
-		"minutes_friday",
-		"minutes_saturday",
-		"minutes_sunday",
-	][today - 1]
-	return getattr(program_group, prop)
+def _program_session_pids_clear(connection: Connection, program_session_id: int) -> None:
+	"Forget the pids of a program session that ended."
+	ProgramSessionPid.delete_where(connection, "program_session = ?", (program_session_id,))
+
+def _program_session_pids_update(connection: Connection,
+		program_session_id: int,
+		pids: Iterable[Any],
+		new: bool = False) -> bool:
+	"""Store the pids of an open program session, return whether they changed.
+
+	Only the pids that started or stopped since the last snapshot are
+	written. Clients send pids as strings, since they are JSON keys.
+	"""
+	pids = {int(pid) for pid in pids}
+	current = set() if new else set(program_session_pids(connection, [program_session_id]))
+	gone = sorted(current - pids)
+	if gone:
+		ProgramSessionPid.delete_where(connection,
+			"program_session = ? AND pid IN ({})".format(", ".join("?" * len(gone))),
+			[program_session_id] + gone)
+	started = sorted(pids - current)
+	if started:
+		statement, _ = ProgramSessionPid.insert_statement(pid=None, program_session=None)
+		connection.executemany(statement, [(pid, program_session_id) for pid in started])
+		connection.commit()
+	return bool(gone or started)
+
+def _record_usage(connection: Connection,
+		username: str,
+		program_group: Optional[int],
+		start: datetime.datetime,
+		end: datetime.datetime) -> None:
+	"Add credited usage to the timeline, if the program is in a group."
+	if program_group is None:
+		return
+	timeline.record(connection, username, program_group, start, end)
 
 def _user_to_status_for_program_groups(connection: Connection,
 		username: str, 
 		program_groups: Iterable[ProgramGroup],
 		programs: Iterable[Program],
+		max_gap_seconds: int = accounting.MAX_GAP_SECONDS,
 		) -> Mapping[str, Status]:
 	"""Get the mapping of group names to status for a given user."""
 	return {program_group.name: _user_to_status_for_program_group(
@@ -255,34 +460,235 @@ def _user_to_status_for_program_groups(connection: Connection,
 		username,
 		program_group,
 		programs,
+		max_gap_seconds,
 	) for program_group in program_groups}
 
 def _user_to_status_for_program_group(connection: Connection,
 		username: str,
 		program_group: ProgramGroup,
 		programs: Iterable[Program],
+		max_gap_seconds: int = accounting.MAX_GAP_SECONDS,
 		) -> Status:
-	"Get the status for a particular user and program group."
+	"""Get the status for a particular user and program group.
+
+	Closed usage comes from the usage timeline. Open sessions only add
+	the time since they were last recorded.
+	"""
 	now = datetime.datetime.now()
-	programs_for_group = [program for program in programs if program.program_group == program_group.id]
-	program_ids = [program.id for program in programs_for_group]
-	program_sessions_today = program_session_list_since(connection, today_start(), programs=program_ids)
-	minutes_used_today = 0
-	minutes_allowed_today = _minutes_allowed_today(program_group)
-	pids = set()
-	for program_session in program_sessions_today:
-		if program_session.username != username:
-			continue
-		end = program_session.end or now
-		elapsed = (end - program_session.start)
-		minutes_used_today += elapsed.total_seconds() / 60
-		if program_session.end is None:
-			pids.add(program_session.pids)
-	minutes_used_today = round(minutes_used_today, 1)
-	return Status(
+	status = STATUS_CACHE.get(username, program_group.id, now)
+	if status is not None:
+		return status
+	program_ids = [program.id for program in programs if program.program_group == program_group.id]
+	open_minutes = 0
+	open_until = None
+	program_session_ids = []
+	for program_session in _program_sessions_open(connection, username, program_ids):
+		recorded = program_session.last_seen or program_session.start
+		# The latest moment the session counts up to without another snapshot.
+		session_until = accounting.open_until(program_session.last_seen, datetime.datetime.max, max_gap_seconds)
+		# Programs in a group that run at once only count once.
+		open_minutes = max(open_minutes, (min(now, session_until) - recorded).total_seconds() / 60)
+		open_until = max(open_until or session_until, session_until)
+		program_session_ids.append(program_session.id)
+	group_limits = limits.evaluate(connection, username, program_group,
+		today=now.date(),
+		extra_minutes=open_minutes,
+	)
+	schedule = None
+	if program_group.window_week:
+		schedule = window_week_schedule(connection, program_group.window_week, now.date())
+	status = Status(
 		group = program_group.id,
-		minutes_used_today = minutes_used_today,
-		minutes_remaining_today = minutes_allowed_today - minutes_used_today,
-		pids = sorted(list(pids)),
+		minutes_used_today = group_limits.minutes_used_today,
+		minutes_used_week = group_limits.minutes_used_week,
+		minutes_used_month = group_limits.minutes_used_month,
+		minutes_remaining = limits.minutes_remaining(group_limits),
+		minutes_remaining_today = group_limits.minutes_remaining_today,
+		minutes_remaining_week = group_limits.minutes_remaining_week,
+		minutes_remaining_month = group_limits.minutes_remaining_month,
+		minutes_until_lock = schedule.minutes_until_lock(now) if schedule else None,
+		pids = sorted(program_session_pids(connection, program_session_ids)),
+	)
+	STATUS_CACHE.put(username, program_group.id, status, now, open_until, schedule)
+	return status
+
+def _program_sessions_open(connection: Connection,
+		username: str,
+		program_ids: List[int]) -> Iterable[ProgramSession]:
+	"Get the open program sessions for a user among some programs."
+	if not program_ids:
+		return []
+	return ProgramSession.list_where(
+		connection,
+		where="username = ? AND \"end\" IS NULL AND program IN ({})".format(
+			",".join(["?"] * len(program_ids))),
+		bindings=[username] + program_ids,
+	)
+
+Visit = collections.namedtuple("Visit", (
+	"at",
+	"hostname",
+	"id",
+	"incognito",
+	"site",
+	"url",
+	"username",
+))
+def website_visit_list(connection: Connection, limit: int = 1000) -> List[Visit]:
+	"Get the most recent website visits, newest first."
+	rows = connection.execute(
+		"SELECT WebsiteVisit.at AS \"at [timestamp]\", Hostname.value, WebsiteVisit.id, "
+		"WebsiteVisit.incognito, Site.value, Url.value, Username.value "
+		"FROM WebsiteVisit "
+		"JOIN Hostname ON Hostname.id = WebsiteVisit.hostname "
+		"JOIN Site ON Site.id = WebsiteVisit.site "
+		"JOIN Url ON Url.id = WebsiteVisit.url "
+		"JOIN Username ON Username.id = WebsiteVisit.username "
+		"ORDER BY WebsiteVisit.at DESC LIMIT ?", (limit,)).fetchall()
+	return [Visit(*row) for row in rows]
+
+def website_visit_store(connection: Connection,
+		at: datetime.datetime,
+		hostname: str,
+		incognito: bool,
+		url: str,
+		username: str) -> int:
+	"Store a visit to a website."
+	return WebsiteVisit.insert(connection,
+		at = at,
+		hostname = HOSTNAMES.id(connection, hostname),
+		incognito = incognito,
+		site = SITES.id(connection, intern.site(url)),
+		url = URLS.id(connection, url),
+		username = USERNAMES.id(connection, username),
+	)
+
+def window_week_create(connection: Connection,
+		name: str,
+		days: Mapping[int, Iterable[window_week.Span]]) -> str:
+	"""Create a window week, replacing any existing one with the same name.
+
+	Args:
+		days: The open spans for each weekday, Monday is 0.
+	Returns:
+		The name of the window week.
+	"""
+	WindowWeekDaySpan.delete_where(connection, "window_name = ?", (name,))
+	for day, spans in days.items():
+		for start, end in spans:
+			WindowWeekDaySpan.insert(connection,
+				day = day,
+				end = end,
+				start = start,
+				window_name = name,
+			)
+	return name
+
+def window_week_get(connection: Connection, name: str) -> WindowWeek:
+	"Get a window week with the spans for each day."
+	spans = collections.defaultdict(list)
+	for span in WindowWeekDaySpan.list(connection, window_name=name):
+		spans[span.day].append(span)
+	return WindowWeek(
+		id_ = name,
+		name = name,
+		days = [WindowWeekDay(name, day, spans[day]) for day in range(7)],
 	)
 
+def window_week_override_create(connection: Connection,
+		name: str,
+		effective: datetime.date,
+		spans: Iterable[window_week.Span],
+		creator: str,
+		message: str) -> None:
+	"""Replace the spans of a window week for a single date.
+
+	Passing no spans locks the window week for the whole date.
+	"""
+	WindowWeekDaySpanOverride.delete_where(connection,
+		"window_name = ? AND effective = ?", (name, effective))
+	now = datetime.datetime.now()
+	for start, end in (list(spans) or [(None, None)]):
+		WindowWeekDaySpanOverride.insert(connection,
+			created = now,
+			creator = creator,
+			effective = effective,
+			end = end,
+			message = message,
+			start = start,
+			window_name = name,
+		)
+
+def window_week_schedule(connection: Connection,
+		name: str,
+		today: Optional[datetime.date] = None) -> window_week.Schedule:
+	"Get the schedule for a window week, with overrides from this week on."
+	today = today or datetime.date.today()
+	spans = collections.defaultdict(list)
+	for span in WindowWeekDaySpan.list(connection, window_name=name):
+		spans[span.day].append((span.start, span.end))
+	overrides = collections.defaultdict(list)
+	monday = today - datetime.timedelta(days=today.weekday())
+	for override in WindowWeekDaySpanOverride.list_where(connection,
+		where="window_name = ? AND effective >= ?",
+		bindings=(name, monday)):
+		day_overrides = overrides[override.effective]
+		if override.start is not None and override.end is not None:
+			day_overrides.append((override.start, override.end))
+	return window_week.Schedule(name, spans, overrides)
+
+def _load_reference(connection: Connection) -> Mapping[str, Any]:
+	programs = tuple(Program.list(connection))
+	program_by_id = {program.id: program for program in programs}
+	return {
+		"program_by_name": {program.name: program for program in programs},
+		"program_by_process": {
+			process.name: program_by_id[process.program].name
+			for process in ProgramProcess.list(connection)
+		},
+		"program_groups": tuple(ProgramGroup.list(connection)),
+		"programs": programs,
+	}
+
+REFERENCE_CACHE = cache.ReferenceCache(_load_reference)
+
+def _invalidate_reference(connection: Connection, id_: Optional[int], values: Mapping[str, Any]) -> None:
+	REFERENCE_CACHE.invalidate(GENERATIONS.bump(connection, "reference"))
+
+def _invalidate_status_all(connection: Connection, id_: Optional[int], values: Mapping[str, Any]) -> None:
+	STATUS_CACHE.invalidate()
+	GENERATIONS.bump(connection, "status")
+
+def _invalidate_status_bonus(connection: Connection, id_: Optional[int], values: Mapping[str, Any]) -> None:
+	STATUS_CACHE.invalidate(program_group=values.get("program_group"))
+	GENERATIONS.bump(connection, "status")
+
+def _invalidate_status_group(connection: Connection, id_: Optional[int], values: Mapping[str, Any]) -> None:
+	STATUS_CACHE.invalidate(program_group=id_)
+	GENERATIONS.bump(connection, "status")
+
+Program.add_listener(_invalidate_reference)
+Program.add_listener(_invalidate_status_all)
+ProgramGroup.add_listener(_invalidate_reference)
+ProgramGroup.add_listener(_invalidate_status_group)
+ProgramProcess.add_listener(_invalidate_reference)
+ProgramGroupBonus.add_listener(_invalidate_status_bonus)
+WindowWeekDaySpan.add_listener(_invalidate_status_all)
+WindowWeekDaySpanOverride.add_listener(_invalidate_status_all)
+
+def _cache_lookups() -> Mapping[Tuple[str, str], float]:
+	lookups = {}
+	for name, cache_ in (
+		("hostname", HOSTNAMES),
+		("reference", REFERENCE_CACHE),
+		("site", SITES),
+		("status", STATUS_CACHE),
+		("url", URLS),
+		("username", USERNAMES)):
+		lookups[(name, "hit")] = cache_.hits
+		lookups[(name, "miss")] = cache_.misses
+	return lookups
+
+metrics.REGISTRY.collector("parentopticon_cache_lookups_total",
+	"Lookups in the in-process caches by whether they hit.",
+	_cache_lookups, labels=("cache", "result"), type_="counter")
@@ -0,0 +1,144 @@
+"""
+Module for keeping the hot tables small.
+
+Raw website visits are only interesting for a while, after that the
+number of visits to each site per day is enough. Closed program sessions
+are already accounted for in the usage timeline, so old ones are moved
+to ProgramSessionArchive. Both free pages, which an incremental vacuum
+hands back to the filesystem.
+
+Rows are moved in chunks, each in its own transaction, with a pause
+between them so that other writers get the lock in between, as the
+migrations do.
+"""
+import collections
+import datetime
+import logging
+import time
+from typing import Any, Mapping, Optional, Tuple
+
+from parentopticon.db import backend as backends
+from parentopticon.db.connection import Connection
+from parentopticon.db.tables import ProgramSession, ProgramSessionArchive, WebsiteVisit, WebsiteVisitDaily
+
+LOGGER = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+# How long to leave the write lock free between chunks.
+CHUNK_PAUSE_SECONDS = 0.01
+
+Policy = collections.namedtuple("Policy", (
+	# How often to apply the policy.
+	"interval_seconds",
+	# Closed program sessions older than this are archived.
+	"session_days",
+	# The most pages to free with each incremental vacuum.
+	"vacuum_pages",
+	# Website visits older than this are rolled up into daily counts.
+	"visit_days",
+))
+
+DEFAULT_POLICY = Policy(
+	interval_seconds = 60 * 60,
+	session_days = 180,
+	vacuum_pages = 1000,
+	visit_days = 30,
+)
+
+Result = collections.namedtuple("Result", (
+	"sessions_archived",
+	"visits_rolled_up",
+))
+
+def apply(connection: Connection,
+	policy: Policy = DEFAULT_POLICY,
+	now: Optional[datetime.datetime] = None,
+	chunk_size: int = CHUNK_SIZE) -> Result:
+	"Apply a retention policy to the DB."
+	now = now or datetime.datetime.now()
+	visits = rollup_website_visits(connection, now - datetime.timedelta(days=policy.visit_days), chunk_size)
+	sessions = archive_program_sessions(connection, now - datetime.timedelta(days=policy.session_days), chunk_size)
+	if visits or sessions:
+		incremental_vacuum(connection, policy.vacuum_pages)
+	LOGGER.info("Retention rolled up %d website visits and archived %d program sessions",
+		visits, sessions)
+	return Result(
+		sessions_archived = sessions,
+		visits_rolled_up = visits,
+	)
+
+def archive_program_sessions(connection: Connection,
+	before: datetime.datetime,
+	chunk_size: int = CHUNK_SIZE) -> int:
+	"Move program sessions that ended before a moment to the archive."
+	columns = ", ".join('"{}"'.format(name) for name, _ in ProgramSession.columns_sorted())
+	where = "\"end\" IS NOT NULL AND \"end\" < ?"
+	archived = 0
+	while True:
+		last_id = _chunk_end(connection, ProgramSession.__name__, where, (before,), chunk_size)
+		if last_id is None:
+			return archived
+		# One transaction, so a crash can't leave a session in both tables.
+		connection.backend.begin_write(connection)
+		connection.execute("INSERT INTO {} ({}) SELECT {} FROM {} WHERE {} AND id <= ?".format(
+			ProgramSessionArchive.__name__,
+			columns,
+			columns,
+			ProgramSession.__name__,
+			where,
+		), (before, last_id))
+		cursor = connection.execute("DELETE FROM {} WHERE {} AND id <= ?".format(ProgramSession.__name__, where),
+			(before, last_id))
+		archived += cursor.rowcount
+		connection.commit()
+		time.sleep(CHUNK_PAUSE_SECONDS)
+
+def incremental_vacuum(connection: Connection, pages: int) -> None:
+	"Return up to a number of free pages to the filesystem."
+	if connection.backend is not backends.SQLITE:
+		return
+	mode = connection.execute("PRAGMA auto_vacuum").fetchone()[0]
+	if mode != 2:
+		LOGGER.debug("Skipping incremental vacuum, the DB was not created with auto_vacuum = INCREMENTAL")
+		return
+	connection.execute("PRAGMA incremental_vacuum({:d})".format(pages)).fetchall()
+
+def policy_from_config(config: Optional[Mapping[str, Any]]) -> Policy:
+	"Get a policy from the [retention] section of the configuration."
+	values = {
+		field: (config or {}).get(field, getattr(DEFAULT_POLICY, field))
+		for field in Policy._fields
+	}
+	return Policy(**values)
+
+def rollup_website_visits(connection: Connection,
+	before: datetime.datetime,
+	chunk_size: int = CHUNK_SIZE) -> int:
+	"Roll website visits from before a moment up into daily counts."
+	day = connection.backend.date_of("at")
+	count = 0
+	while True:
+		last_id = _chunk_end(connection, WebsiteVisit.__name__, "at < ?", (before,), chunk_size)
+		if last_id is None:
+			return count
+		# One transaction, so a crash can't count a visit twice.
+		connection.backend.begin_write(connection)
+		connection.execute(
+			"INSERT INTO {daily} (day, hostname, site, username, visits) "
+			"SELECT {day}, hostname, site, username, COUNT(*) FROM {visit} WHERE at < ? AND id <= ? "
+			"GROUP BY {day}, hostname, site, username "
+			"ON CONFLICT (day, hostname, username, site) DO UPDATE SET visits = {daily}.visits + excluded.visits".format(
+				daily = WebsiteVisitDaily.__name__,
+				day = day,
+				visit = WebsiteVisit.__name__,
+			), (before, last_id))
+		cursor = connection.execute("DELETE FROM {} WHERE at < ? AND id <= ?".format(WebsiteVisit.__name__),
+			(before, last_id))
+		count += cursor.rowcount
+		connection.commit()
+		time.sleep(CHUNK_PAUSE_SECONDS)
+
+def _chunk_end(connection: Connection, table: str, where: str, bindings: Tuple[Any, ...], chunk_size: int) -> Optional[int]:
+	"Get the ID of the last row of the next chunk of matching rows, None when there are none."
+	return connection.execute("SELECT MAX(id) FROM (SELECT id FROM {} WHERE {} ORDER BY id LIMIT ?) AS chunk".format(
+		table, where), bindings + (chunk_size,)).fetchone()[0]
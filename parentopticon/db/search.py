@@ -0,0 +1,84 @@
+"""
+Module for full-text search over browsing history.
+
+Visited URLs are interned, so the index holds each distinct URL once in
+an FTS5 table that uses Url as its external content. Searching matches
+URLs first and only then looks up the visits to the matching URLs. URLs
+stay interned and indexed once retention has rolled all their visits
+up, so those are left out of the matches.
+"""
+import collections
+import datetime
+import logging
+import re
+from typing import Any, List, Mapping, Optional
+
+from parentopticon.db.model import Connection
+
+LOGGER = logging.getLogger(__name__)
+
+PER_PAGE = 50
+
+Match = collections.namedtuple("Match", (
+	"last_visit",
+	"url",
+	"visits",
+))
+
+def create(connection: Connection) -> None:
+	"Create the search index, filling it from existing URLs if it is new."
+	if not connection.backend.SUPPORTS_FULL_TEXT or "UrlSearch" in connection.backend.tables(connection):
+		return
+	connection.execute("CREATE VIRTUAL TABLE UrlSearch USING fts5(value, content='Url', content_rowid='id')")
+	connection.execute("INSERT INTO UrlSearch (UrlSearch) VALUES ('rebuild')")
+	LOGGER.info("Built the URL search index.")
+
+def index(connection: Connection, id_: Optional[int], values: Mapping[str, Any]) -> None:
+	"Add a newly interned URL to the search index."
+	if id_ is None or "value" not in values or not connection.backend.SUPPORTS_FULL_TEXT:
+		return
+	connection.execute("INSERT INTO UrlSearch (rowid, value) VALUES (?, ?)", (id_, values["value"]))
+	connection.commit()
+
+def search(connection: Connection, text: str, page: int = 0, per_page: int = PER_PAGE) -> List[Match]:
+	"""Search visited URLs, best matches first.
+
+	Every word of the text must match the start of a word in the URL.
+	"""
+	query = _match_query(text)
+	if not query:
+		return []
+	if not connection.backend.SUPPORTS_FULL_TEXT:
+		return _search_unindexed(connection, text, page, per_page)
+	rows = connection.execute(
+		"WITH matches AS ("
+		"SELECT rowid, rank FROM UrlSearch WHERE UrlSearch MATCH ? "
+		"AND EXISTS (SELECT 1 FROM WebsiteVisit WHERE url = UrlSearch.rowid) "
+		"ORDER BY rank LIMIT ? OFFSET ?"
+		") SELECT "
+		"(SELECT MAX(at) FROM WebsiteVisit WHERE url = Url.id) AS \"last_visit [timestamp]\", "
+		"Url.value, "
+		"(SELECT COUNT(*) FROM WebsiteVisit WHERE url = Url.id) "
+		"FROM matches JOIN Url ON Url.id = matches.rowid ORDER BY matches.rank",
+		(query, per_page, page * per_page)).fetchall()
+	return [Match(*row) for row in rows]
+
+def truncate(connection: Connection) -> None:
+	"Empty the search index."
+	if connection.backend.SUPPORTS_FULL_TEXT:
+		connection.execute("INSERT INTO UrlSearch (UrlSearch) VALUES ('delete-all')")
+
+def _match_query(text: str) -> str:
+	"Turn search text into an FTS5 query of quoted prefix terms."
+	return " ".join('"{}"*'.format(word) for word in re.findall(r"\w+", text))
+
+def _search_unindexed(connection: Connection, text: str, page: int, per_page: int) -> List[Match]:
+	"Search by matching every URL, for backends without the index."
+	words = re.findall(r"\w+", text)
+	rows = connection.execute(
+		"SELECT MAX(WebsiteVisit.at), Url.value, COUNT(WebsiteVisit.id) FROM Url "
+		"JOIN WebsiteVisit ON WebsiteVisit.url = Url.id WHERE {} "
+		"GROUP BY Url.id, Url.value ORDER BY COUNT(WebsiteVisit.id) DESC LIMIT ? OFFSET ?".format(
+			" AND ".join("LOWER(Url.value) LIKE ?" for _ in words)),
+		["%{}%".format(word.lower()) for word in words] + [per_page, page * per_page]).fetchall()
+	return [Match(*row) for row in rows]
@@ -0,0 +1,67 @@
+"""
+Module for state shared between webserver worker processes.
+
+Each worker keeps its own caches of values computed from the DB. Writes
+bump a named generation number in the SharedState table, and workers
+drop their cached values when a generation changes from the one they
+last saw. Generations start from the time they are first bumped, so they
+never repeat across restarts.
+"""
+import logging
+import time
+from typing import Mapping
+
+from parentopticon.db.model import Connection
+from parentopticon.db.tables import SharedState
+
+LOGGER = logging.getLogger(__name__)
+
+class Generations:
+	"The generations one process has seen."
+	def __init__(self) -> None:
+		self._seen = {}
+
+	def bump(self, connection: Connection, name: str) -> int:
+		"""Move a generation on, return the new generation.
+
+		It isn't committed, so it takes effect with the write that caused
+		it and the caller has to commit it.
+		"""
+		statement = ("INSERT INTO SharedState (name, generation) VALUES (?, ?) "
+			"ON CONFLICT (name) DO UPDATE SET generation = SharedState.generation + 1")
+		bindings = (name, int(time.time() * 1000))
+		if connection.backend.SUPPORTS_RETURNING:
+			generation = connection.execute(statement + " RETURNING generation", bindings).fetchone()[0]
+		else:
+			connection.execute(statement, bindings)
+			generation = connection.execute(
+				"SELECT generation FROM SharedState WHERE name = ?", (name,)).fetchone()[0]
+		self._seen[name] = generation
+		return generation
+
+	def changed(self, connection: Connection) -> Mapping[str, int]:
+		"Get the generations that changed since we last looked."
+		result = {}
+		for name, generation in connection.execute("SELECT name, generation FROM SharedState").fetchall():
+			if self._seen.get(name) != generation:
+				result[name] = generation
+				self._seen[name] = generation
+		return result
+
+	def clear(self) -> None:
+		"Forget every generation we have seen."
+		self._seen.clear()
+
+def claim(connection: Connection, name: str, interval_seconds: int) -> bool:
+	"""Claim a periodic job for this process.
+
+	Only one of the processes that call this in an interval gets True.
+	"""
+	now = int(time.time())
+	connection.execute(
+		"INSERT INTO SharedState (name, generation) VALUES (?, 0) ON CONFLICT (name) DO NOTHING", (name,))
+	cursor = connection.execute(
+		"UPDATE SharedState SET generation = ? WHERE name = ? AND generation <= ?",
+		(now, name, now - interval_seconds))
+	connection.commit()
+	return cursor.rowcount == 1
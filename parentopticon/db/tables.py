@@ -3,7 +3,9 @@ import datetime
 import logging
 from typing import Any, Iterable, List, Mapping, Optional, Tuple
 
-from parentopticon.db.model import ColumnBoolean, ColumnDate, ColumnDatetime, ColumnForeignKey, ColumnInteger, ColumnText, Model
+from parentopticon import window_week
+from parentopticon.db import search
+from parentopticon.db.model import ColumnBlob, ColumnBoolean, ColumnDate, ColumnDatetime, ColumnForeignKey, ColumnInteger, ColumnText, Index, Model
 
 LOGGER = logging.getLogger(__name__)
 
@@ -11,6 +13,27 @@ Group = collections.namedtuple("Group", ("id", "name", "limit", "window_week"))
 Process = collections.namedtuple("Process", ("id", "name", "program_id"))
 Program = collections.namedtuple("Program", ("id", "name", "group", "processes"))
 
+class Hostname(Model):
+	"An interned client hostname."
+	COLUMNS = {
+		"id": ColumnInteger(autoincrement=True, primary_key=True),
+		"value": ColumnText(null=False),
+	}
+	INDEXES = {
+		"value": Index("value", unique=True),
+	}
+
+class MigrationProgress(Model):
+	"How far a chunked migration has got, so it can carry on after a restart."
+	COLUMNS = {
+		"id": ColumnInteger(autoincrement=True, primary_key=True),
+		"name": ColumnText(null=False),
+		"position": ColumnInteger(null=False),
+	}
+	INDEXES = {
+		"name": Index("name", unique=True),
+	}
+
 class OneTimeMessage(Model):
 	"A message to send once to a given person."
 	COLUMNS = {
@@ -36,6 +59,7 @@ class ProgramGroup(Model):
 		"minutes_sunday": ColumnInteger(null=False),
 		"minutes_weekly": ColumnInteger(null=False),
 		"minutes_monthly": ColumnInteger(null=False),
+		"window_week": ColumnText(null=True),
 	}
 
 class Program(Model):
@@ -57,6 +81,9 @@ class ProgramGroupBonus(Model):
 		"message": ColumnText(null=False),
 		"program_group": ColumnForeignKey(ProgramGroup),
 	}
+	INDEXES = {
+		"program_group_effective_date": Index("program_group", "effective_date"),
+	}
 
 class ProgramProcess(Model):
 	"A process that a program may run on a system."
@@ -72,11 +99,14 @@ class ProgramSession(Model):
 		"id": ColumnInteger(autoincrement=True, primary_key=True),
 		"hostname": ColumnText(null=False),
 		"end": ColumnDatetime(null=True),
-		"pids": ColumnText(null=False),
+		"last_seen": ColumnDatetime(null=True),
 		"program": ColumnForeignKey(Program),
 		"start": ColumnDatetime(null=False),
 		"username": ColumnText(null=False),
 	}
+	INDEXES = {
+		"username_end": Index("username", "end"),
+	}
 
 	@property
 	def duration(self) -> Optional[datetime.timedelta]:
@@ -84,36 +114,155 @@ class ProgramSession(Model):
 		if self.start and self.end:
 			return self.end - self.start
 
+class ProgramSessionArchive(ProgramSession):
+	"A closed program session old enough to be moved out of ProgramSession."
+	INDEXES = {
+		"username_start": Index("username", "start"),
+	}
+
+class ProgramSessionPid(Model):
+	"A process of an open program session, removed when the session ends."
+	COLUMNS = {
+		"id": ColumnInteger(autoincrement=True, primary_key=True),
+		"pid": ColumnInteger(null=False),
+		"program_session": ColumnForeignKey(ProgramSession),
+	}
+	INDEXES = {
+		"program_session_pid": Index("program_session", "pid", unique=True),
+	}
+
+class SharedState(Model):
+	"A generation number shared between processes, see parentopticon.db.shared."
+	COLUMNS = {
+		"id": ColumnInteger(autoincrement=True, primary_key=True),
+		"generation": ColumnInteger(null=False),
+		"name": ColumnText(null=False),
+	}
+	INDEXES = {
+		"name": Index("name", unique=True),
+	}
+
+class Site(Model):
+	"An interned website host, like 'example.com'."
+	COLUMNS = {
+		"id": ColumnInteger(autoincrement=True, primary_key=True),
+		"value": ColumnText(null=False),
+	}
+	INDEXES = {
+		"value": Index("value", unique=True),
+	}
+
+class Url(Model):
+	"An interned URL."
+	COLUMNS = {
+		"id": ColumnInteger(autoincrement=True, primary_key=True),
+		"value": ColumnText(null=False),
+	}
+	INDEXES = {
+		"value": Index("value", unique=True),
+	}
+
+# Keep the URL search index in sync with the URLs.
+Url.add_listener(search.index)
+
+class UsageTimeline(Model):
+	"""Usage of a program group by a user over a single day.
+
+	The buckets are one byte per slice of the day holding the number of
+	seconds used within that slice. See parentopticon.db.timeline.
+	"""
+	COLUMNS = {
+		"id": ColumnInteger(autoincrement=True, primary_key=True),
+		"buckets": ColumnBlob(null=False),
+		"day": ColumnDate(null=False),
+		"program_group": ColumnForeignKey(ProgramGroup),
+		"username": ColumnText(null=False),
+	}
+	INDEXES = {
+		"user_group_day": Index("username", "program_group", "day", unique=True),
+	}
+
+class Username(Model):
+	"An interned username."
+	COLUMNS = {
+		"id": ColumnInteger(autoincrement=True, primary_key=True),
+		"value": ColumnText(null=False),
+	}
+	INDEXES = {
+		"value": Index("value", unique=True),
+	}
+
 class WebsiteVisit(Model):
-	"A single visit to a website."
+	"""A single visit to a website.
+
+	The hostname, site, URL and username are interned, see
+	parentopticon.db.intern.
+	"""
 	COLUMNS = {
 		"id": ColumnInteger(autoincrement=True, primary_key=True),
 		"at": ColumnDatetime(null=False),
-		"hostname": ColumnText(null=False),
+		"hostname": ColumnForeignKey(Hostname),
 		"incognito": ColumnBoolean(null=False),
-		"url": ColumnText(null=False),
-		"username": ColumnText(null=False),
+		"site": ColumnForeignKey(Site),
+		"url": ColumnForeignKey(Url),
+		"username": ColumnForeignKey(Username),
+	}
+	INDEXES = {
+		"at": Index("at"),
+		"site_at": Index("site", "at"),
+		"url_at": Index("url", "at"),
+	}
+
+class WebsiteVisitDaily(Model):
+	"The number of visits to a site by a user on a host over a single day."
+	COLUMNS = {
+		"id": ColumnInteger(autoincrement=True, primary_key=True),
+		"day": ColumnDate(null=False),
+		"hostname": ColumnForeignKey(Hostname),
+		"site": ColumnForeignKey(Site),
+		"username": ColumnForeignKey(Username),
+		"visits": ColumnInteger(null=False),
+	}
+	INDEXES = {
+		"day_hostname_username_site": Index("day", "hostname", "username", "site", unique=True),
 	}
 
 class WindowWeekDaySpanOverride(Model):
-	"An override for a single day in a window week."
+	"""An override for a single day in a window week.
+
+	All of the overrides for a window on a date replace the spans for that
+	day of the week. An override without a start or end locks the day.
+	"""
 	COLUMNS = {
 		"id": ColumnInteger(autoincrement=True, primary_key=True),
 		"created": ColumnDatetime(null=False),
 		"creator": ColumnText(null=False),
 		"effective": ColumnDate(null=False),
+		"end": ColumnInteger(null=True),
 		"message": ColumnText(null=False),
+		"start": ColumnInteger(null=True),
+		"window_name": ColumnText(null=False),
+	}
+	INDEXES = {
+		"window_name_effective": Index("window_name", "effective"),
 	}
 
 class WindowWeekDaySpan(Model):
-	"A span of time for a day of a week window."
+	"""A span of time for a day of a week window.
+
+	The day is the weekday, with Monday as 0. The start and end are minutes
+	since midnight, start inclusive and end exclusive.
+	"""
 	COLUMNS = {
 		"id": ColumnInteger(autoincrement=True, primary_key=True),
 		"day": ColumnInteger(null=False),
-		"end": ColumnDatetime(null=True),
-		"start": ColumnDatetime(null=False),
+		"end": ColumnInteger(null=False),
+		"start": ColumnInteger(null=False),
 		"window_name": ColumnText(null=False),
 	}
+	INDEXES = {
+		"window_name": Index("window_name"),
+	}
 		
 	def minutes_left(self, moment: datetime.time) -> int:
 		"""Get the minutes left in the span for a moment.
@@ -122,12 +271,14 @@ class WindowWeekDaySpan(Model):
 			or the number of minutes left until the span ends if the
 			current moment is inside the span.
 		"""
-		
-		return max(span.minutes_left(moment) for span in self.spans)
+		minute = moment.hour * 60 + moment.minute
+		if self.start <= minute < self.end:
+			return self.end - minute
+		return 0
 
 	@property
 	def value(self) -> str:
-		return "{}-{}".format(self.start, self.end)
+		return window_week.format_spans([(self.start, self.end)])
 
 class WindowWeekDay:
 	def __init__(self, window_id: int, day: int, spans: List[WindowWeekDaySpan]):
@@ -142,7 +293,7 @@ class WindowWeekDay:
 			or the number of minutes left until the span ends if the
 			current moment is inside a window.
 		"""
-		return max(span.minutes_left(moment) for span in self.spans)
+		return max((span.minutes_left(moment) for span in self.spans), default=0)
 
 	@property
 	def value(self) -> str:
@@ -203,27 +354,51 @@ class WindowWeek:
 class Connection():
 	pass
 
+# Every table, in the order they are created.
+MODELS = (
+	Hostname,
+	MigrationProgress,
+	OneTimeMessage,
+	ProgramGroup,
+	ProgramGroupBonus,
+	Program,
+	ProgramProcess,
+	ProgramSession,
+	ProgramSessionArchive,
+	ProgramSessionPid,
+	SharedState,
+	Site,
+	Url,
+	UsageTimeline,
+	Username,
+	WebsiteVisit,
+	WebsiteVisitDaily,
+	WindowWeekDaySpan,
+	WindowWeekDaySpanOverride,
+)
+
 def truncate_all(connection: Connection) -> None:
-	connection.cursor.execute(ProgramGroup.truncate_statement())
-	connection.cursor.execute(ProgramGroupBonus.truncate_statement())
-	connection.cursor.execute(Program.truncate_statement())
-	connection.cursor.execute(ProgramProcess.truncate_statement())
-	connection.cursor.execute(ProgramSession.truncate_statement())
-	connection.cursor.execute(WebsiteVisit.truncate_statement())
-	connection.cursor.execute(WindowWeekDaySpan.truncate_statement())
-	connection.cursor.execute(WindowWeekDaySpanOverride.truncate_statement())
+	for model in MODELS:
+		connection.execute(model.truncate_statement())
+	search.truncate(connection)
 	connection.commit()
 
 def create_all(connection: Connection):
+	"""Create every table and index that doesn't exist yet.
+
+	This doesn't change existing tables, see parentopticon.db.migrations.
+	"""
 	LOGGER.info("Ensuring DB tables exist.")
-	connection.cursor.execute(OneTimeMessage.create_statement())
-	connection.cursor.execute(ProgramGroup.create_statement())
-	connection.cursor.execute(ProgramGroupBonus.create_statement())
-	connection.cursor.execute(Program.create_statement())
-	connection.cursor.execute(ProgramProcess.create_statement())
-	connection.cursor.execute(ProgramSession.create_statement())
-	connection.cursor.execute(WebsiteVisit.create_statement())
-	connection.cursor.execute(WindowWeekDaySpan.create_statement())
-	connection.cursor.execute(WindowWeekDaySpanOverride.create_statement())
-	connection.commit()
+	connection.backend.prepare(connection)
+	for model in MODELS:
+		connection.execute(model.create_statement(connection.backend))
+	search.create(connection)
+	create_indexes(connection)
 	LOGGER.info("DB tables exist.")
+
+def create_indexes(connection: Connection) -> None:
+	"Create every index that doesn't exist yet."
+	for model in MODELS:
+		for statement in model.create_index_statements(connection.backend):
+			connection.execute(statement)
+	connection.commit()
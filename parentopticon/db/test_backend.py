@@ -0,0 +1,96 @@
+import datetime
+import unittest
+
+from parentopticon.db import backend, test_utilities
+from parentopticon.db.model import ColumnDatetime, ColumnInteger, ColumnText, Index, Model
+from parentopticon.db.tables import OneTimeMessage, ProgramSession
+
+class ForUriTests(unittest.TestCase):
+	"Test backend.for_uri"
+	def test_path(self):
+		"Are plain paths SQLite files?"
+		self.assertEqual(backend.for_uri("/tmp/db.sqlite"), (backend.SQLITE, "/tmp/db.sqlite"))
+
+	def test_sqlite(self):
+		"Can we name SQLite files with a URI?"
+		self.assertEqual(backend.for_uri("sqlite:///tmp/db.sqlite"), (backend.SQLITE, "/tmp/db.sqlite"))
+
+	def test_postgres(self):
+		"Do we use PostgreSQL for its URIs?"
+		uri = "postgresql://parentopticon@db.example.com/parentopticon"
+		self.assertEqual(backend.for_uri(uri), (backend.POSTGRES, uri))
+
+class PostgresDialectTests(unittest.TestCase):
+	"Test the PostgreSQL dialect without a server."
+	class MyTable(Model):
+		COLUMNS = {
+			"id": ColumnInteger(autoincrement=True, primary_key=True),
+			"end": ColumnDatetime(null=True),
+			"name": ColumnText(null=False),
+		}
+		INDEXES = {
+			"name_end": Index("name", "end"),
+		}
+
+	def test_translate(self):
+		"Do we turn placeholders into the psycopg2 style?"
+		self.assertEqual(
+			backend.POSTGRES.translate("SELECT * FROM Url WHERE value LIKE ? AND id = ?"),
+			"SELECT * FROM Url WHERE value LIKE %s AND id = %s")
+
+	def test_translate_literals(self):
+		"Do we leave string literals alone, apart from escaping '%'?"
+		self.assertEqual(
+			backend.POSTGRES.translate("SELECT '?', '100%' FROM Url WHERE id = ?"),
+			"SELECT '?', '100%%' FROM Url WHERE id = %s")
+
+	def test_create_statement(self):
+		"Do we use serial IDs, PostgreSQL types and quoted names?"
+		result = PostgresDialectTests.MyTable.create_statement(backend.POSTGRES)
+		expected = "\n".join((
+			"CREATE TABLE IF NOT EXISTS MyTable (",
+			"\"end\" TIMESTAMP,",
+			"\"id\" SERIAL PRIMARY KEY,",
+			"\"name\" TEXT NOT NULL",
+			");",
+		))
+		self.assertEqual(result, expected)
+
+	def test_create_index_statements(self):
+		"Do we quote indexed columns?"
+		result = list(PostgresDialectTests.MyTable.create_index_statements(backend.POSTGRES))
+		self.assertEqual(result, ["CREATE INDEX IF NOT EXISTS MyTable_name_end ON MyTable (\"name\", \"end\");"])
+
+class ModelBackendTests:
+	"Tests of the Model layer to run against each backend."
+	def test_insert_get(self):
+		"Do we get the ID of inserted rows and their values back?"
+		created = datetime.datetime(2020, 6, 1, 12, 0, 0)
+		id_ = OneTimeMessage.insert(self.db, content="Hi", created=created, username="testuser")
+		message = OneTimeMessage.get(self.db, id_)
+		self.assertEqual((message.content, message.created, message.sent), ("Hi", created, None))
+
+	def test_reserved_column(self):
+		"Can we query a column named after a keyword?"
+		ProgramSession.insert(self.db,
+			end=None,
+			hostname="testhost",
+			program=1,
+			start=datetime.datetime(2020, 6, 1, 12, 0, 0),
+			username="testuser",
+		)
+		self.assertEqual(len(list(ProgramSession.list(self.db, end=None))), 1)
+
+	def test_update_where(self):
+		"Can we claim rows with update_where?"
+		for content in ("a", "b"):
+			OneTimeMessage.insert(self.db, content=content, created=datetime.datetime.now(), username="testuser")
+		claimed = OneTimeMessage.update_where(self.db, where="sent IS NULL", sent=datetime.datetime.now())
+		self.assertEqual(sorted(m.content for m in claimed), ["a", "b"])
+		self.assertEqual(OneTimeMessage.update_where(self.db, where="sent IS NULL", sent=datetime.datetime.now()), [])
+
+class SQLiteModelTests(ModelBackendTests, test_utilities.DBTestCase):
+	"Test the Model layer on SQLite."
+
+class PostgresModelTests(ModelBackendTests, test_utilities.PostgresDBTestCase):
+	"Test the Model layer on PostgreSQL."
@@ -0,0 +1,135 @@
+import datetime
+import unittest
+
+from parentopticon import window_week
+from parentopticon.db import cache, queries
+
+NOW = datetime.datetime(2020, 2, 2, 11, 0, 0)
+
+def make_status(**kwargs) -> queries.Status:
+	values = {
+		"group": 1,
+		"minutes_used_today": 10,
+		"minutes_used_week": 20,
+		"minutes_used_month": 30,
+		"minutes_remaining": 50,
+		"minutes_remaining_today": 50,
+		"minutes_remaining_week": 100,
+		"minutes_remaining_month": None,
+		"minutes_until_lock": None,
+		"pids": [],
+	}
+	values.update(kwargs)
+	return queries.Status(**values)
+
+class StatusCacheTests(unittest.TestCase):
+	"Test cache.StatusCache"
+	def setUp(self):
+		self.cache = cache.StatusCache()
+
+	def test_miss(self):
+		"Do we miss when nothing is cached?"
+		self.assertIs(self.cache.get("testuser", 1, NOW), None)
+		self.assertEqual(self.cache.stats()["misses"], 1)
+
+	def test_hit_closed(self):
+		"Do we return statuses without open sessions unchanged?"
+		status = make_status()
+		self.cache.put("testuser", 1, status, NOW, None, None)
+		result = self.cache.get("testuser", 1, NOW + datetime.timedelta(minutes=5))
+		self.assertEqual(result, status)
+		self.assertEqual(self.cache.stats()["hits"], 1)
+
+	def test_advance_open(self):
+		"Do we advance open sessions by wall clock time?"
+		status = make_status(pids=["123"])
+		self.cache.put("testuser", 1, status, NOW, NOW + datetime.timedelta(minutes=2), None)
+		result = self.cache.get("testuser", 1, NOW + datetime.timedelta(minutes=1))
+		self.assertEqual(result.minutes_used_today, 11)
+		self.assertEqual(result.minutes_used_month, 31)
+		self.assertEqual(result.minutes_remaining, 49)
+		self.assertEqual(result.minutes_remaining_week, 99)
+		self.assertIs(result.minutes_remaining_month, None)
+
+	def test_advance_stops(self):
+		"Do we miss once open sessions would time out, since only the DB knows whether they did?"
+		status = make_status(pids=["123"])
+		self.cache.put("testuser", 1, status, NOW, NOW + datetime.timedelta(minutes=2), None)
+		self.assertEqual(self.cache.get("testuser", 1, NOW + datetime.timedelta(minutes=2)).minutes_used_today, 12)
+		self.assertIsNone(self.cache.get("testuser", 1, NOW + datetime.timedelta(minutes=30)))
+
+	def test_window(self):
+		"Do we recompute the minutes until lock?"
+		schedule = window_week.Schedule("all", {6: [(9 * 60, 12 * 60)]})
+		status = make_status(minutes_until_lock=60)
+		self.cache.put("testuser", 1, status, NOW, None, schedule)
+		result = self.cache.get("testuser", 1, NOW + datetime.timedelta(minutes=45))
+		self.assertEqual(result.minutes_until_lock, 15)
+
+	def test_new_day(self):
+		"Do we miss once the day is over?"
+		self.cache.put("testuser", 1, make_status(), NOW, None, None)
+		self.assertIs(self.cache.get("testuser", 1, NOW + datetime.timedelta(days=1)), None)
+
+	def test_invalidate(self):
+		"Can we invalidate by username and by program group?"
+		self.cache.put("testuser", 1, make_status(), NOW, None, None)
+		self.cache.put("testuser", 2, make_status(), NOW, None, None)
+		self.cache.put("otheruser", 1, make_status(), NOW, None, None)
+		self.cache.invalidate(program_group=1)
+		self.assertIs(self.cache.get("testuser", 1, NOW), None)
+		self.assertIs(self.cache.get("otheruser", 1, NOW), None)
+		self.assertIsNot(self.cache.get("testuser", 2, NOW), None)
+		self.cache.invalidate(username="testuser")
+		self.assertIs(self.cache.get("testuser", 2, NOW), None)
+
+class ReferenceCacheTests(unittest.TestCase):
+	"Test cache.ReferenceCache"
+	def setUp(self):
+		self.loads = 0
+		self.cache = cache.ReferenceCache(self.load)
+
+	def load(self, connection):
+		self.loads += 1
+		return {
+			"program_by_name": {},
+			"program_by_process": {"minecraft-launcher": "Minecraft"},
+			"program_groups": (),
+			"programs": (),
+		}
+
+	def test_loads_once(self):
+		"Do we only load the reference data once?"
+		first = self.cache.get(None)
+		second = self.cache.get(None)
+		self.assertIs(first, second)
+		self.assertEqual(self.loads, 1)
+		self.assertEqual(first.version, self.cache.version)
+
+	def test_invalidate(self):
+		"Do we reload under a new version after invalidating?"
+		first = self.cache.get(None)
+		self.cache.invalidate()
+		second = self.cache.get(None)
+		self.assertEqual(self.loads, 2)
+		self.assertGreater(second.version, first.version)
+
+class ResponseCacheTests(unittest.TestCase):
+	"Test cache.ResponseCache"
+	def test_version(self):
+		"Do we only serve bodies rendered from the current version?"
+		responses = cache.ResponseCache()
+		responses.put("/config/program?", 1, b"programs")
+		self.assertEqual(responses.get("/config/program?", 1), b"programs")
+		self.assertIsNone(responses.get("/config/program?", 2))
+		self.assertIsNone(responses.get("/config/program/1?", 1))
+
+	def test_evicts(self):
+		"Do we forget the least recently used bodies?"
+		responses = cache.ResponseCache(size=2)
+		responses.put("a", 1, b"a")
+		responses.put("b", 1, b"b")
+		responses.get("a", 1)
+		responses.put("c", 1, b"c")
+		self.assertEqual(responses.get("a", 1), b"a")
+		self.assertIsNone(responses.get("b", 1))
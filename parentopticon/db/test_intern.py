@@ -0,0 +1,50 @@
+from parentopticon.db import intern, test_utilities
+from parentopticon.db.tables import Url
+
+class InternerTests(test_utilities.DBTestCase):
+	"Test intern.Interner"
+	def test_same_id(self):
+		"Do we get the same ID for the same value?"
+		interner = intern.Interner(Url)
+		first = interner.id(self.db, "https://example.com/")
+		interner.clear()
+		self.assertEqual(interner.id(self.db, "https://example.com/"), first)
+		self.assertNotEqual(interner.id(self.db, "https://example.com/other"), first)
+		self.assertEqual(len(list(Url.list(self.db))), 2)
+
+	def test_added_first(self):
+		"Do we get the ID of a value somebody else added since we looked?"
+		interner = intern.Interner(Url)
+		id_ = Url.insert(self.db, value="https://example.com/")
+		interner.model = _Unsearched(Url)
+		self.assertEqual(interner.id(self.db, "https://example.com/"), id_)
+
+	def test_evicts(self):
+		"Do we only keep the most recently used values?"
+		interner = intern.Interner(Url, size=2)
+		for url in ("a", "b", "a", "c"):
+			interner.id(self.db, url)
+		self.assertEqual(list(interner._ids.keys()), ["a", "c"])
+
+	def test_site(self):
+		"Can we get the site of a URL?"
+		self.assertEqual(intern.site("https://www.example.com:8080/path?q=1"), "www.example.com")
+		self.assertEqual(intern.site("about:blank"), "about:blank")
+
+class PostgresInternerTests(InternerTests, test_utilities.PostgresDBTestCase):
+	"Test intern.Interner on PostgreSQL."
+
+class _Unsearched:
+	"A model whose first search finds nothing, like a search just before somebody else inserts."
+	def __init__(self, model):
+		self.model = model
+		self.searched = False
+
+	def insert(self, connection, **values):
+		return self.model.insert(connection, **values)
+
+	def search(self, connection, **values):
+		if not self.searched:
+			self.searched = True
+			return None
+		return self.model.search(connection, **values)
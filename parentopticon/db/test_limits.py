@@ -0,0 +1,92 @@
+import datetime
+
+from parentopticon.db import limits, test_utilities, timeline
+from parentopticon.db.tables import ProgramGroup, ProgramGroupBonus
+
+# A Sunday, the last day of an ISO week that starts in the previous month.
+TODAY = datetime.date(2020, 3, 1)
+
+class EvaluateTests(test_utilities.DBTestCase):
+	"Test limits.evaluate"
+	def setUp(self):
+		super().setUp()
+		group_id = ProgramGroup.insert(self.db,
+			minutes_monday=60,
+			minutes_tuesday=60,
+			minutes_wednesday=60,
+			minutes_thursday=60,
+			minutes_friday=60,
+			minutes_saturday=120,
+			minutes_sunday=120,
+			minutes_weekly=300,
+			minutes_monthly=1000,
+			name="games",
+		)
+		self.program_group = ProgramGroup.get(self.db, group_id)
+
+	def use(self, day: datetime.date, minutes: int) -> None:
+		start = datetime.datetime.combine(day, datetime.time(hour=9))
+		timeline.record(self.db, "testuser", self.program_group.id,
+			start, start + datetime.timedelta(minutes=minutes))
+
+	def test_periods(self):
+		"Do we compute today, this week and this month separately?"
+		self.use(datetime.date(2020, 2, 20), 50)
+		self.use(datetime.date(2020, 2, 25), 40)
+		self.use(datetime.date(2020, 2, 29), 30)
+		self.use(TODAY, 20)
+		result = limits.evaluate(self.db, "testuser", self.program_group, today=TODAY)
+		self.assertEqual(result.minutes_used_today, 20)
+		self.assertEqual(result.minutes_used_week, 90)
+		self.assertEqual(result.minutes_used_month, 20)
+		self.assertEqual(result.minutes_remaining_today, 100)
+		self.assertEqual(result.minutes_remaining_week, 210)
+		self.assertEqual(result.minutes_remaining_month, 980)
+		self.assertEqual(limits.minutes_remaining(result), 100)
+
+	def test_weekly_limit_binds(self):
+		"Do we run out of time when the weekly limit is used up?"
+		for day in range(24, 30):
+			self.use(datetime.date(2020, 2, day), 50)
+		result = limits.evaluate(self.db, "testuser", self.program_group, today=TODAY)
+		self.assertEqual(result.minutes_remaining_week, 0)
+		self.assertEqual(limits.minutes_remaining(result), 0)
+
+	def test_extra_minutes(self):
+		"Do we count usage not yet in the timeline?"
+		result = limits.evaluate(self.db, "testuser", self.program_group, today=TODAY, extra_minutes=5)
+		self.assertEqual(result.minutes_used_today, 5)
+		self.assertEqual(result.minutes_used_week, 5)
+
+	def test_bonus(self):
+		"Do bonuses add time to every period they fall in?"
+		ProgramGroupBonus.insert(self.db,
+			amount_minutes=30,
+			created=datetime.datetime(2020, 2, 29, 10, 0, 0),
+			creator="dad",
+			effective_date=datetime.date(2020, 2, 29),
+			message="Good job on the chores",
+			program_group=self.program_group.id,
+		)
+		ProgramGroupBonus.insert(self.db,
+			amount_minutes=15,
+			created=datetime.datetime(2020, 3, 1, 10, 0, 0),
+			creator="dad",
+			effective_date=TODAY,
+			message="Rainy day",
+			program_group=self.program_group.id,
+		)
+		result = limits.evaluate(self.db, "testuser", self.program_group, today=TODAY)
+		self.assertEqual(result.minutes_remaining_today, 135)
+		self.assertEqual(result.minutes_remaining_week, 345)
+		self.assertEqual(result.minutes_remaining_month, 1015)
+
+	def test_unlimited(self):
+		"Do negative limits mean no limit?"
+		ProgramGroup.update(self.db, self.program_group.id, minutes_weekly=-1, minutes_monthly=-1)
+		program_group = ProgramGroup.get(self.db, self.program_group.id)
+		self.use(TODAY, 20)
+		result = limits.evaluate(self.db, "testuser", program_group, today=TODAY)
+		self.assertIs(result.minutes_remaining_week, None)
+		self.assertIs(result.minutes_remaining_month, None)
+		self.assertEqual(limits.minutes_remaining(result), 100)
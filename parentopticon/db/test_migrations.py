@@ -0,0 +1,113 @@
+import datetime
+import os
+
+from parentopticon.db import backend, migrations, queries, timeline
+from parentopticon.db.connection import Connection
+from parentopticon.db.tables import create_all, ProgramGroup, ProgramSession, ProgramSessionPid, UsageTimeline, WebsiteVisit
+from parentopticon.db import test_utilities
+
+TEST_DB_PATH = "/tmp/parentopticon-test-migrations.sqlite"
+AT = datetime.datetime(2020, 6, 1, 12, 0, 0)
+
+class _OldSQLiteBackend(backend.SQLiteBackend):
+	"SQLite from before 3.35, which can't drop columns."
+	SUPPORTS_DROP_COLUMN = False
+
+class MigrateTests(test_utilities.DBTestCase):
+	"Test migrations.migrate on a DB from before interning and the usage timeline."
+	def setUp(self):
+		super().setUp()
+		if os.path.exists(TEST_DB_PATH):
+			os.unlink(TEST_DB_PATH)
+		self.old = Connection()
+		self.old.connect(TEST_DB_PATH)
+		for statement in (
+			"CREATE TABLE Program (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, program_group INTEGER)",
+			"CREATE TABLE ProgramSession (id INTEGER PRIMARY KEY AUTOINCREMENT, end timestamp, "
+				"hostname TEXT NOT NULL, pids TEXT NOT NULL, program INTEGER, start timestamp NOT NULL, "
+				"username TEXT NOT NULL)",
+			"CREATE TABLE WebsiteVisit (id INTEGER PRIMARY KEY AUTOINCREMENT, at timestamp NOT NULL, "
+				"hostname TEXT NOT NULL, incognito bool NOT NULL, url TEXT NOT NULL, username TEXT NOT NULL)",
+			"CREATE INDEX WebsiteVisit_at ON WebsiteVisit (at)",
+		):
+			self.old.execute(statement)
+		self.old.execute("INSERT INTO Program (name, program_group) VALUES ('Minecraft', 1)")
+		self.old.execute("INSERT INTO ProgramSession (end, hostname, pids, program, start, username) "
+			"VALUES (?, 'testhost', '123', 1, ?, 'testuser')", (AT + datetime.timedelta(minutes=30), AT))
+		for url in ("https://example.com/a", "https://example.com/b", "https://example.com/a"):
+			self.old.execute("INSERT INTO WebsiteVisit (at, hostname, incognito, url, username) "
+				"VALUES (?, ?, ?, ?, ?)", (AT, "testhost", False, url, "testuser"))
+		self.old.commit()
+
+	def tearDown(self):
+		super().tearDown()
+		self.old.connection.close()
+		os.unlink(TEST_DB_PATH)
+
+	def test_status(self):
+		"Do we report what is out of date?"
+		status = migrations.status(self.old)
+		self.assertEqual(status.version, 0)
+		self.assertEqual(status.latest, len(migrations.MIGRATIONS))
+		self.assertEqual(len(status.pending), len(migrations.MIGRATIONS))
+		self.assertIn("ProgramSession.last_seen", status.missing_columns)
+		self.assertIn("UsageTimeline", status.missing_tables)
+
+	def test_migrate(self):
+		"Do we bring the DB up to date?"
+		migrations.migrate(self.old, chunk_size=2)
+		status = migrations.status(self.old)
+		self.assertEqual((status.version, status.pending, status.missing_columns, status.missing_tables),
+			(status.latest, [], [], []))
+		visits = queries.website_visit_list(self.old)
+		self.assertEqual(sorted(v.url for v in visits), [
+			"https://example.com/a", "https://example.com/a", "https://example.com/b"])
+		self.assertEqual({(v.at, v.hostname, v.site, v.username) for v in visits},
+			{(AT, "testhost", "example.com", "testuser")})
+		self.assertEqual(len({v.url for v in WebsiteVisit.list(self.old)}), 2)
+		self.assertEqual(timeline.total_minutes(self.old, "testuser", 1, AT.date(), AT.date()), 30)
+
+	def test_migrate_pids(self):
+		"Do open sessions keep their pids in the new table?"
+		self.old.execute("INSERT INTO ProgramSession (end, hostname, pids, program, start, username) "
+			"VALUES (NULL, 'testhost', '456,123,456', 1, ?, 'testuser')", (AT,))
+		self.old.commit()
+		migrations.migrate(self.old)
+		open_id = ProgramSession.search(self.old, end=None).id
+		self.assertEqual(sorted((row.program_session, row.pid) for row in ProgramSessionPid.list(self.old)),
+			[(open_id, 123), (open_id, 456)])
+		self.assertNotIn("pids", self.old.backend.columns(self.old, "ProgramSession"))
+
+	def test_migrate_pids_rebuild(self):
+		"Do we drop the pids column where SQLite is too old to drop columns?"
+		self.old.backend = _OldSQLiteBackend()
+		migrations.migrate(self.old)
+		self.assertNotIn("pids", self.old.backend.columns(self.old, "ProgramSession"))
+		session = ProgramSession.search(self.old, hostname="testhost")
+		self.assertEqual((session.start, session.end), (AT, AT + datetime.timedelta(minutes=30)))
+		ProgramSession.insert(self.old, end=None, hostname="testhost", program=1, start=AT, username="testuser")
+		self.assertEqual(migrations.status(self.old).missing_tables, [])
+
+	def test_migrate_twice(self):
+		"Is migrating an up to date DB a no-op?"
+		migrations.migrate(self.old)
+		migrations.migrate(self.old)
+		self.assertEqual(timeline.total_minutes(self.old, "testuser", 1, AT.date(), AT.date()), 30)
+
+	def test_new_db(self):
+		"Do we create new DBs at the latest version?"
+		self.old.connection.close()
+		os.unlink(TEST_DB_PATH)
+		self.old.connect(TEST_DB_PATH)
+		migrations.migrate(self.old)
+		status = migrations.status(self.old)
+		self.assertEqual(status.version, status.latest)
+
+class PostgresMigrateTests(test_utilities.PostgresDBTestCase):
+	"Test migrations.migrate on PostgreSQL."
+	def test_migrate_twice(self):
+		"Is migrating an up to date DB a no-op?"
+		migrations.migrate(self.db)
+		migrations.migrate(self.db)
+		status = migrations.status(self.db)
+		self.assertEqual((status.missing_columns, status.missing_tables), ([], []))
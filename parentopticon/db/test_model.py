@@ -4,7 +4,7 @@ from typing import List, Optional
 import unittest
 
 from parentopticon.db import test_utilities
-from parentopticon.db.model import ColumnInteger, ColumnText, Model
+from parentopticon.db.model import ColumnInteger, ColumnText, Index, Model
 
 class ModelTests(test_utilities.DBTestCase):
 	"Test all of our logic around the model class."
@@ -14,6 +14,9 @@ class ModelTests(test_utilities.DBTestCase):
 			"count": ColumnInteger(),
 			"name": ColumnText(null=True),
 		}
+		INDEXES = {
+			"name_count": Index("name", "count", unique=True),
+		}
 
 	def _makerows(self, names: Optional[List[str]] = None):
 		"Make a few rows. Useful for many tests."
@@ -40,6 +43,12 @@ class ModelTests(test_utilities.DBTestCase):
 		))
 		self.assertEqual(result, expected)
 
+	def test_create_index_statements(self):
+		"Can we get proper create index clauses?"
+		result = list(ModelTests.MyTable.create_index_statements())
+		expected = ["CREATE UNIQUE INDEX IF NOT EXISTS MyTable_name_count ON MyTable (name, count);"]
+		self.assertEqual(result, expected)
+
 	def test_insert(self):
 		"Can we insert a row into a table?"
 		rowid = ModelTests.MyTable.insert(self.db, count=3, name="foobar")
@@ -118,3 +127,31 @@ class ModelTests(test_utilities.DBTestCase):
 		results = ModelTests.MyTable.get(self.db, row_id)
 		self.assertEqual(results.count, 100)
 		self.assertEqual(results.name, "biff")
+
+	def test_update_where(self):
+		"Can we update matching rows and get them back?"
+		self._makerows()
+		results = ModelTests.MyTable.update_where(self.db,
+			where="count > ?",
+			bindings=(2,),
+			name="biff",
+		)
+		self.assertEqual(sorted(r.count for r in results), [4, 6])
+		self.assertEqual({r.name for r in results}, {"biff"})
+		self.assertEqual(ModelTests.MyTable.search(self.db, count=2).name, "foo")
+
+	def test_update_where_claims_once(self):
+		"Do rows updated out of a where clause stop matching it?"
+		self._makerows()
+		first = ModelTests.MyTable.update_where(self.db, where="name IS NOT NULL", name=None)
+		second = ModelTests.MyTable.update_where(self.db, where="name IS NOT NULL", name=None)
+		self.assertEqual(len(first), 3)
+		self.assertEqual(second, [])
+
+	def test_update_where_emulated(self):
+		"Can we update matching rows without RETURNING support?"
+		self._makerows()
+		rows = ModelTests.MyTable._update_where_emulated(self.db, "name = ?", ["biff"], "count > ?", [2])
+		self.db.commit()
+		self.assertEqual(sorted(row[0] for row in rows), [4, 6])
+		self.assertEqual({r.count for r in ModelTests.MyTable.list(self.db, name="biff")}, {4, 6})
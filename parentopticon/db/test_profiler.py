@@ -0,0 +1,78 @@
+import unittest
+
+from parentopticon.db import profiler, test_utilities
+from parentopticon.db.tables import Program
+
+class NormalizeTests(unittest.TestCase):
+	"Test profiler.normalize"
+	def test_literals(self):
+		"Do we take out literals and extra whitespace?"
+		self.assertEqual(
+			profiler.normalize("SELECT id FROM Program\n\tWHERE name = 'it''s' AND id > 12"),
+			"SELECT id FROM Program WHERE name = ? AND id > ?")
+
+	def test_lists(self):
+		"Do we collapse lists of placeholders and rows?"
+		self.assertEqual(
+			profiler.normalize("SELECT id FROM Url WHERE id IN (?, ?, ?)"),
+			"SELECT id FROM Url WHERE id IN (?, ...)")
+		self.assertEqual(
+			profiler.normalize("INSERT INTO Url (value, id) VALUES (?, ?), (?, ?)"),
+			"INSERT INTO Url (value, id) VALUES (?, ?), ...")
+
+class ProfilerTests(test_utilities.DBTestCase):
+	"Test profiling a connection."
+	def setUp(self):
+		super().setUp()
+		self.profiler = profiler.Profiler(explain=True, slow_seconds=None)
+		self.db.profiler = self.profiler
+
+	def tearDown(self):
+		self.db.profiler = None
+		super().tearDown()
+
+	def test_record(self):
+		"Do we group runs of the same statement and count their rows?"
+		group_id = test_utilities.make_group(self.db)
+		for name in ("Minecraft", "Steam"):
+			Program.insert(self.db, name=name, program_group=group_id)
+		for name in ("Minecraft", "Steam", "Roblox"):
+			self.db.execute("SELECT id FROM Program WHERE name = ?", (name,)).fetchall()
+		stats = {stat.statement: stat for stat in self.profiler.top(sort="count")}
+		stat = stats["SELECT id FROM Program WHERE name = ?"]
+		self.assertEqual(stat.count, 3)
+		self.assertEqual(stat.rows, 2)
+		self.assertEqual(stat.shapes, {"str"})
+
+	def test_rows(self):
+		"Do profiled statements return the same rows?"
+		group_id = test_utilities.make_group(self.db)
+		Program.insert(self.db, name="Minecraft", program_group=group_id)
+		self.assertEqual([p.name for p in Program.list(self.db)], ["Minecraft"])
+		self.assertEqual(Program.get(self.db, 1000), None)
+
+	def test_full_scan(self):
+		"Do we point out statements that read a whole table?"
+		self.db.execute("SELECT id FROM Program WHERE name = ?", ("Minecraft",)).fetchall()
+		self.db.execute("SELECT id FROM Program WHERE id = ?", (1,)).fetchall()
+		stats = {stat.statement: stat for stat in self.profiler.top()}
+		self.assertTrue(stats["SELECT id FROM Program WHERE name = ?"].full_scan)
+		self.assertFalse(stats["SELECT id FROM Program WHERE id = ?"].full_scan)
+
+	def test_slow(self):
+		"Do we log slow statements?"
+		self.profiler.slow_seconds = 0
+		with self.assertLogs("parentopticon.db.profiler", level="WARNING"):
+			self.db.execute("SELECT id FROM Program").fetchall()
+
+	def test_evicts(self):
+		"Do we drop the statements that ran the least?"
+		self.profiler.size = 2
+		for _ in range(2):
+			self.db.execute("SELECT id FROM Program").fetchall()
+		self.db.execute("SELECT name FROM Program").fetchall()
+		self.db.execute("SELECT program_group FROM Program").fetchall()
+		self.assertEqual(sorted(stat.statement for stat in self.profiler.top()), [
+			"SELECT id FROM Program",
+			"SELECT program_group FROM Program",
+		])
@@ -3,10 +3,12 @@ import os
 import unittest
 from typing import Optional
 
+import freezegun
+
 from parentopticon.db import test_utilities
-from parentopticon.db import queries
+from parentopticon.db import queries, timeline
 from parentopticon.db.model import ColumnInteger, ColumnText, Model
-from parentopticon.db.tables import Program, ProgramGroup, ProgramProcess, ProgramSession
+from parentopticon.db.tables import OneTimeMessage, Program, ProgramGroup, ProgramGroupBonus, ProgramProcess, ProgramSession, ProgramSessionPid
 
 class ProgramProcessTests(test_utilities.DBTestCase):
 	"Test interactions between programs and processes."
@@ -45,6 +47,24 @@ class ProgramProcessTests(test_utilities.DBTestCase):
 		}
 		self.assertEqual(result, expected)
 
+	def test_reference_cached(self):
+		"Do we reuse the reference data until it is written?"
+		first = queries.reference(self.db)
+		self.assertIs(queries.reference(self.db), first)
+		self.assertEqual(first.version, queries.reference_version())
+
+	def test_reference_invalidated(self):
+		"Do new processes show up, under a new version?"
+		version = queries.reference_version()
+		queries.list_program_by_process(self.db)
+		ProgramProcess.insert(self.db,
+			name = "terraria-server",
+			program = self.programs[1],
+		)
+		self.assertGreater(queries.reference_version(), version)
+		result = queries.list_program_by_process(self.db)
+		self.assertEqual(result["terraria-server"], "Terraria")
+
 class ProgramSessionTests(test_utilities.DBTestCase):
 	def setUp(self):
 		super().setUp()
@@ -61,7 +81,6 @@ class ProgramSessionTests(test_utilities.DBTestCase):
 		return ProgramSession.insert(self.db,
 			end = end,
 			hostname = "testhost",
-			pids = "",
 			program = self.program_id,
 			start = start or datetime.datetime.now(),
 			username = "testuser",
@@ -99,3 +118,261 @@ class ProgramSessionTests(test_utilities.DBTestCase):
 		)
 		results = ProgramSession.get(self.db, program_session_id)
 		self.assertEqual(results.program, self.program_id)
+
+class SnapshotStoreTests(test_utilities.DBTestCase):
+	"Test queries.snapshot_store and session accounting."
+	def setUp(self):
+		super().setUp()
+		self.group_id = test_utilities.make_group(self.db)
+		self.program_id = Program.insert(
+			self.db,
+			name="Minecraft",
+			program_group=self.group_id)
+		self.moment = datetime.datetime(2020, 2, 2, 11, 0, 0)
+
+	def store(self, seconds: int, programs: dict, elapsed_seconds: int = 30, hostname: str = "testhost") -> None:
+		queries.snapshot_store(self.db,
+			elapsed_seconds = elapsed_seconds,
+			hostname = hostname,
+			moment = self.moment + datetime.timedelta(seconds=seconds),
+			pid_to_program = programs,
+			username = "testuser",
+		)
+
+	def test_uses_observation_moment(self):
+		"Do we use the observation moment rather than now?"
+		self.store(0, {"123": "Minecraft"}, elapsed_seconds=0)
+		self.store(30, {"123": "Minecraft"})
+		self.store(60, {})
+		sessions = list(ProgramSession.list(self.db))
+		self.assertEqual(len(sessions), 1)
+		self.assertEqual(sessions[0].start, self.moment)
+		self.assertEqual(sessions[0].end, self.moment + datetime.timedelta(seconds=45))
+
+	def test_gap_splits_session(self):
+		"Do we avoid crediting time across a long gap?"
+		self.store(0, {"123": "Minecraft"}, elapsed_seconds=0)
+		self.store(30, {"123": "Minecraft"})
+		self.store(3630, {"123": "Minecraft"}, elapsed_seconds=3600)
+		sessions = sorted(ProgramSession.list(self.db), key=lambda s: s.start)
+		self.assertEqual(len(sessions), 2)
+		self.assertEqual(sessions[0].end, self.moment + datetime.timedelta(seconds=30))
+		self.assertEqual(sessions[1].start, self.moment + datetime.timedelta(seconds=3630))
+		self.assertEqual(sessions[1].end, None)
+
+	def test_gap_before_close(self):
+		"Do we end sessions where they were last seen after a gap?"
+		self.store(0, {"123": "Minecraft"}, elapsed_seconds=0)
+		self.store(7200, {}, elapsed_seconds=7200)
+		session = ProgramSession.search(self.db, program=self.program_id)
+		self.assertEqual(session.end, self.moment)
+
+	def _add_programs(self, *names: str) -> None:
+		for name in names:
+			Program.insert(self.db, name=name, program_group=self.group_id)
+
+	def test_close_several(self):
+		"Do we close every program's session in one snapshot?"
+		self._add_programs("Factorio", "Terraria")
+		self.store(0, {"1": "Minecraft", "2": "Factorio", "3": "Terraria"}, elapsed_seconds=0)
+		self.store(30, {})
+		sessions = list(ProgramSession.list(self.db))
+		self.assertEqual(len(sessions), 3)
+		self.assertEqual([session.end for session in sessions], [self.moment + datetime.timedelta(seconds=15)] * 3)
+
+	def test_close_several_pids(self):
+		"Do we forget the pids of every session closed in one snapshot?"
+		self._add_programs("Factorio", "Terraria")
+		self.store(0, {"1": "Minecraft", "2": "Factorio", "3": "Terraria"}, elapsed_seconds=0)
+		self.store(30, {})
+		self.assertEqual(list(ProgramSessionPid.list(self.db)), [])
+
+	def test_pids(self):
+		"Do we keep the pids of open sessions as they come and go?"
+		session_pids = lambda: [(row.program_session, row.pid) for row in ProgramSessionPid.list(self.db)]
+		self.store(0, {"123": "Minecraft", "124": "Minecraft"}, elapsed_seconds=0)
+		session_id = ProgramSession.search(self.db, program=self.program_id).id
+		self.assertEqual(sorted(session_pids()), [(session_id, 123), (session_id, 124)])
+		self.store(30, {"124": "Minecraft", "125": "Minecraft"})
+		self.assertEqual(sorted(session_pids()), [(session_id, 124), (session_id, 125)])
+		self.store(60, {})
+		self.assertEqual(session_pids(), [])
+
+	def test_records_timeline(self):
+		"Do we record credited usage in the timeline as snapshots arrive?"
+		self.store(0, {"123": "Minecraft"}, elapsed_seconds=0)
+		self.store(30, {"123": "Minecraft"})
+		self.store(60, {"123": "Minecraft"})
+		self.store(90, {})
+		used = timeline.total_minutes(self.db, "testuser", self.group_id, self.moment.date(), self.moment.date())
+		self.assertEqual(used, 1.25)
+
+	def test_status_includes_open_session(self):
+		"Do we count recorded usage plus the open tail of a session?"
+		self.store(0, {"123": "Minecraft"}, elapsed_seconds=0)
+		self.store(30, {"123": "Minecraft"})
+		self.store(60, {"123": "Minecraft"})
+		with freezegun.freeze_time(self.moment + datetime.timedelta(seconds=90)):
+			result = queries.user_to_status(self.db)
+		status = result["testuser"]["games"]
+		self.assertEqual(status.minutes_used_today, 1.5)
+		self.assertEqual(status.minutes_remaining, -1.5)
+		self.assertEqual(status.pids, [123])
+
+	def test_status_configured_gap(self):
+		"Do open sessions count for as long as the configured gap?"
+		self.store(0, {"123": "Minecraft"}, elapsed_seconds=0)
+		with freezegun.freeze_time(self.moment + datetime.timedelta(seconds=300)):
+			status = queries.status_for_username(self.db, "testuser", max_gap_seconds=600)["games"]
+		self.assertEqual(status.minutes_used_today, 5)
+
+	def test_kill_over_limit(self):
+		"Do we kill programs once the limit is used up?"
+		self.store(0, {"123": "Minecraft"}, elapsed_seconds=0)
+		self.store(30, {"123": "Minecraft"})
+		with freezegun.freeze_time(self.moment + datetime.timedelta(seconds=40)):
+			actions = queries.actions_for_username_kills(self.db, "testhost", "testuser")
+		self.assertEqual([(a.type, a.content) for a in actions], [("kill", 123)])
+
+	def test_kill_own_host(self):
+		"Does each host only get the pids of its own sessions?"
+		for hostname, pid in (("testhost", "123"), ("otherhost", "456")):
+			self.store(0, {pid: "Minecraft"}, elapsed_seconds=0, hostname=hostname)
+			self.store(30, {pid: "Minecraft"}, hostname=hostname)
+		with freezegun.freeze_time(self.moment + datetime.timedelta(seconds=40)):
+			actions = {hostname: [a.content for a in queries.actions_for_username_kills(self.db, hostname, "testuser")]
+				for hostname in ("testhost", "otherhost", "thirdhost")}
+		self.assertEqual(actions, {"testhost": [123], "otherhost": [456], "thirdhost": []})
+
+class WindowWeekTests(test_utilities.DBTestCase):
+	"Test storing window weeks and enforcing them."
+	def setUp(self):
+		super().setUp()
+		self.group_id = test_utilities.make_group(self.db)
+		ProgramGroup.update(self.db, self.group_id,
+			minutes_sunday=-1,
+			minutes_weekly=-1,
+			minutes_monthly=-1,
+			window_week="weekend",
+		)
+		self.program_id = Program.insert(self.db, name="Minecraft", program_group=self.group_id)
+		queries.window_week_create(self.db, "weekend", {
+			5: [(8 * 60, 20 * 60)],
+			6: [(8 * 60, 12 * 60), (13 * 60, 20 * 60)],
+		})
+		# A Sunday
+		self.moment = datetime.datetime(2020, 2, 2, 11, 0, 0)
+
+	def test_get(self):
+		"Can we get a window week back for display?"
+		result = queries.window_week_get(self.db, "weekend")
+		self.assertEqual(result.sunday.value, "0800-1200,1300-2000")
+		self.assertEqual(result.monday.value, "")
+		self.assertEqual(result.sunday.minutes_left(datetime.time(11, 30)), 30)
+
+	def test_replace(self):
+		"Does creating a window week again replace its spans?"
+		queries.window_week_create(self.db, "weekend", {6: [(9 * 60, 10 * 60)]})
+		result = queries.window_week_get(self.db, "weekend")
+		self.assertEqual(result.sunday.value, "0900-1000")
+		self.assertEqual(result.saturday.value, "")
+
+	def test_override(self):
+		"Do overrides apply to their date?"
+		queries.window_week_override_create(self.db, "weekend",
+			effective = self.moment.date(),
+			spans = [],
+			creator = "dad",
+			message = "Grounded",
+		)
+		schedule = queries.window_week_schedule(self.db, "weekend", self.moment.date())
+		self.assertTrue(schedule.is_locked(self.moment))
+
+	def test_kill_when_locked(self):
+		"Do we kill programs outside of the window?"
+		queries.snapshot_store(self.db, "testhost", "testuser", 0, {"123": "Minecraft"},
+			moment=self.moment.replace(hour=12, minute=10))
+		with freezegun.freeze_time(self.moment.replace(hour=12, minute=10, second=30)):
+			actions = queries.actions_for_username_kills(self.db, "testhost", "testuser")
+		self.assertEqual([(a.type, a.content) for a in actions], [("kill", 123)])
+
+	def test_no_kill_when_open(self):
+		"Do we leave programs alone inside of the window?"
+		queries.snapshot_store(self.db, "testhost", "testuser", 0, {"123": "Minecraft"},
+			moment=self.moment)
+		with freezegun.freeze_time(self.moment + datetime.timedelta(seconds=30)):
+			status = queries.user_to_status(self.db)["testuser"]["games"]
+			actions = queries.actions_for_username_kills(self.db, "testhost", "testuser")
+		self.assertEqual(status.minutes_until_lock, 60)
+		self.assertEqual(actions, [])
+
+class StatusCacheTests(test_utilities.DBTestCase):
+	"Test that writes invalidate cached statuses."
+	def setUp(self):
+		super().setUp()
+		self.group_id = test_utilities.make_group(self.db)
+		Program.insert(self.db, name="Minecraft", program_group=self.group_id)
+		self.moment = datetime.datetime(2020, 2, 2, 11, 0, 0)
+
+	def status(self, seconds: int = 0) -> queries.Status:
+		with freezegun.freeze_time(self.moment + datetime.timedelta(seconds=seconds)):
+			return queries.user_to_status(self.db)["testuser"]["games"]
+
+	def test_cached(self):
+		"Do we serve repeated requests from the cache?"
+		queries.snapshot_store(self.db, "testhost", "testuser", 0, {"123": "Minecraft"}, moment=self.moment)
+		first = self.status(30)
+		hits = queries.STATUS_CACHE.stats()["hits"]
+		second = self.status(60)
+		self.assertEqual(queries.STATUS_CACHE.stats()["hits"], hits + 1)
+		self.assertEqual(second.minutes_used_today, first.minutes_used_today + 0.5)
+
+	def test_snapshot_invalidates(self):
+		"Do snapshots invalidate the user's statuses?"
+		queries.snapshot_store(self.db, "testhost", "testuser", 0, {"123": "Minecraft"}, moment=self.moment)
+		self.status(10)
+		queries.snapshot_store(self.db, "testhost", "testuser", 30, {}, moment=self.moment + datetime.timedelta(seconds=30))
+		result = self.status(60)
+		self.assertEqual(result.pids, [])
+		self.assertEqual(result.minutes_used_today, 0.2)
+
+	def test_program_group_update_invalidates(self):
+		"Do changes to the program group invalidate statuses?"
+		queries.snapshot_store(self.db, "testhost", "testuser", 0, {"123": "Minecraft"}, moment=self.moment)
+		self.status(10)
+		ProgramGroup.update(self.db, self.group_id, minutes_sunday=60)
+		self.assertEqual(self.status(10).minutes_remaining_today, 59.8)
+
+	def test_bonus_invalidates(self):
+		"Do new bonuses invalidate statuses?"
+		queries.snapshot_store(self.db, "testhost", "testuser", 0, {"123": "Minecraft"}, moment=self.moment)
+		self.status(10)
+		ProgramGroupBonus.insert(self.db,
+			amount_minutes=30,
+			created=self.moment,
+			creator="dad",
+			effective_date=self.moment.date(),
+			message="Homework done",
+			program_group=self.group_id,
+		)
+		self.assertEqual(self.status(10).minutes_remaining_today, 29.8)
+
+class OneTimeMessageTests(test_utilities.DBTestCase):
+	"Test sending one-time messages."
+	def setUp(self):
+		super().setUp()
+		for content in ("Dinner time", "Homework first"):
+			OneTimeMessage.insert(self.db,
+				content=content,
+				created=datetime.datetime.now(),
+				username="testuser",
+			)
+
+	def test_messages_sent_once(self):
+		"Do we only send each message once?"
+		actions = queries.actions_for_username_messages(self.db, "testhost", "testuser")
+		self.assertEqual(sorted(a.content for a in actions), ["Dinner time", "Homework first"])
+		self.assertEqual(queries.actions_for_username_messages(self.db, "testhost", "testuser"), [])
+		sent = list(OneTimeMessage.list(self.db, username="testuser"))
+		self.assertEqual({m.hostname for m in sent}, {"testhost"})
+		self.assertNotIn(None, [m.sent for m in sent])
@@ -0,0 +1,103 @@
+import datetime
+
+from parentopticon.db import queries, retention, test_utilities
+from parentopticon.db.tables import ProgramSession, ProgramSessionArchive, WebsiteVisit, WebsiteVisitDaily
+
+NOW = datetime.datetime(2020, 6, 1, 12, 0, 0)
+
+class RollupWebsiteVisitsTests(test_utilities.DBTestCase):
+	"Test retention.rollup_website_visits"
+	def visit(self, at: datetime.datetime, url: str, hostname: str = "testhost") -> None:
+		queries.website_visit_store(self.db,
+			at=at,
+			hostname=hostname,
+			incognito=False,
+			url=url,
+			username="testuser",
+		)
+
+	def test_rollup(self):
+		"Do we count old visits per day, host and site?"
+		old = NOW - datetime.timedelta(days=40)
+		self.visit(old, "https://example.com/a")
+		self.visit(old, "https://example.com/b")
+		self.visit(old, "https://example.com/a", hostname="otherhost")
+		self.visit(old + datetime.timedelta(days=1), "https://example.com/a")
+		self.visit(NOW, "https://example.com/a")
+		rolled_up = retention.rollup_website_visits(self.db, NOW - datetime.timedelta(days=30))
+		self.assertEqual(rolled_up, 4)
+		self.assertEqual(len(list(WebsiteVisit.list(self.db))), 1)
+		daily = WebsiteVisitDaily.search(self.db,
+			day=old.date(),
+			hostname=queries.HOSTNAMES.id(self.db, "testhost"),
+		)
+		self.assertEqual(daily.site, queries.SITES.id(self.db, "example.com"))
+		self.assertEqual(daily.visits, 2)
+		self.assertEqual(len(list(WebsiteVisitDaily.list(self.db))), 3)
+
+	def test_rollup_adds(self):
+		"Do we add to existing counts for a day?"
+		old = NOW - datetime.timedelta(days=40)
+		self.visit(old, "https://example.com/a")
+		retention.rollup_website_visits(self.db, NOW)
+		self.visit(old, "https://example.com/b")
+		retention.rollup_website_visits(self.db, NOW)
+		daily = WebsiteVisitDaily.search(self.db, day=old.date())
+		self.assertEqual(daily.visits, 2)
+
+	def test_rollup_chunks(self):
+		"Do chunks add up to the same counts as one go?"
+		old = NOW - datetime.timedelta(days=40)
+		for url in ("https://example.com/a", "https://example.com/b", "https://example.org/", "https://example.com/c"):
+			self.visit(old, url)
+		self.visit(NOW, "https://example.com/a")
+		self.assertEqual(retention.rollup_website_visits(self.db, NOW - datetime.timedelta(days=30), chunk_size=3), 4)
+		self.assertEqual(len(list(WebsiteVisit.list(self.db))), 1)
+		self.assertEqual(sorted(daily.visits for daily in WebsiteVisitDaily.list(self.db)), [1, 3])
+
+class ArchiveProgramSessionsTests(test_utilities.DBTestCase):
+	"Test retention.archive_program_sessions"
+	def session(self, start: datetime.datetime, end: datetime.datetime = None) -> int:
+		return ProgramSession.insert(self.db,
+			end=end,
+			hostname="testhost",
+			last_seen=end or start,
+			program=1,
+			start=start,
+			username="testuser",
+		)
+
+	def test_archive(self):
+		"Do we only archive closed sessions that ended long enough ago?"
+		old = NOW - datetime.timedelta(days=200)
+		archived_id = self.session(old, old + datetime.timedelta(hours=1))
+		open_id = self.session(old)
+		recent_id = self.session(NOW - datetime.timedelta(hours=2), NOW - datetime.timedelta(hours=1))
+		count = retention.archive_program_sessions(self.db, NOW - datetime.timedelta(days=180))
+		self.assertEqual(count, 1)
+		self.assertEqual({s.id for s in ProgramSession.list(self.db)}, {open_id, recent_id})
+		archived = ProgramSessionArchive.get(self.db, archived_id)
+		self.assertEqual(archived.start, old)
+		self.assertEqual(archived.last_seen, old + datetime.timedelta(hours=1))
+
+	def test_archive_chunks(self):
+		"Do we archive every session when there are more than a chunk?"
+		old = NOW - datetime.timedelta(days=200)
+		ids = {self.session(old, old + datetime.timedelta(hours=1)) for _ in range(5)}
+		count = retention.archive_program_sessions(self.db, NOW - datetime.timedelta(days=180), chunk_size=2)
+		self.assertEqual(count, 5)
+		self.assertEqual(list(ProgramSession.list(self.db)), [])
+		self.assertEqual({s.id for s in ProgramSessionArchive.list(self.db)}, ids)
+
+class ApplyTests(test_utilities.DBTestCase):
+	"Test retention.apply"
+	def test_policy_from_config(self):
+		"Do we fill in a policy from partial configuration?"
+		policy = retention.policy_from_config({"visit_days": 7})
+		self.assertEqual(policy.visit_days, 7)
+		self.assertEqual(policy.session_days, retention.DEFAULT_POLICY.session_days)
+
+	def test_apply(self):
+		"Can we apply a policy to an empty DB?"
+		result = retention.apply(self.db, now=NOW)
+		self.assertEqual(result, retention.Result(sessions_archived=0, visits_rolled_up=0))
@@ -0,0 +1,58 @@
+import datetime
+
+from parentopticon.db import queries, retention, search, test_utilities
+
+NOW = datetime.datetime(2020, 6, 1, 12, 0, 0)
+
+class SearchTests(test_utilities.DBTestCase):
+	"Test search.search"
+	def visit(self, url: str, minutes_ago: int = 0) -> None:
+		queries.website_visit_store(self.db,
+			at=NOW - datetime.timedelta(minutes=minutes_ago),
+			hostname="testhost",
+			incognito=False,
+			url=url,
+			username="testuser",
+		)
+
+	def test_search(self):
+		"Can we find visits by words in the URL?"
+		self.visit("https://minecraft.net/download", minutes_ago=10)
+		self.visit("https://minecraft.net/download")
+		self.visit("https://example.com/")
+		matches = search.search(self.db, "minecraft")
+		self.assertEqual(matches, [search.Match(
+			last_visit=NOW,
+			url="https://minecraft.net/download",
+			visits=2,
+		)])
+
+	def test_prefix(self):
+		"Do words match the start of words in the URL?"
+		self.visit("https://minecraft.net/download")
+		self.assertEqual(len(search.search(self.db, "mine down")), 1)
+		self.assertEqual(search.search(self.db, "craft"), [])
+
+	def test_page(self):
+		"Can we page through results?"
+		for i in range(5):
+			self.visit("https://example.com/{}".format(i))
+		first = search.search(self.db, "example", page=0, per_page=3)
+		second = search.search(self.db, "example", page=1, per_page=3)
+		self.assertEqual(len(first), 3)
+		self.assertEqual(len(second), 2)
+		self.assertFalse({m.url for m in first} & {m.url for m in second})
+
+	def test_punctuation(self):
+		"Do we ignore search text that isn't words?"
+		self.visit("https://example.com/")
+		self.assertEqual(search.search(self.db, '"*:'), [])
+		self.assertEqual(len(search.search(self.db, 'example.com"')), 1)
+
+	def test_rolled_up(self):
+		"Are URLs whose visits were all rolled up left out?"
+		self.visit("https://example.com/old", minutes_ago=60 * 24 * 40)
+		self.visit("https://example.com/new")
+		retention.rollup_website_visits(self.db, NOW - datetime.timedelta(days=30))
+		self.assertEqual([match.url for match in search.search(self.db, "example")], ["https://example.com/new"])
+		self.assertEqual(search.search(self.db, "old"), [])
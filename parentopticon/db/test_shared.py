@@ -0,0 +1,79 @@
+import datetime
+
+from parentopticon.db import queries, shared, test_utilities
+from parentopticon.db.tables import Program, SharedState
+
+class GenerationsTests(test_utilities.DBTestCase):
+	"Test shared.Generations"
+	def test_bump(self):
+		"Does bumping a generation move it on by one?"
+		generations = shared.Generations()
+		first = generations.bump(self.db, "reference")
+		self.assertEqual(generations.bump(self.db, "reference"), first + 1)
+		self.assertEqual(len(list(SharedState.list(self.db))), 1)
+
+	def test_bump_in_transaction(self):
+		"Does a bump only take effect with the write that caused it?"
+		generations = shared.Generations()
+		generations.bump(self.db, "reference")
+		self.db.connection.rollback()
+		self.assertEqual(list(SharedState.list(self.db)), [])
+
+	def test_changed(self):
+		"Do we see generations bumped by other processes, once?"
+		ours = shared.Generations()
+		theirs = shared.Generations()
+		ours.bump(self.db, "status")
+		self.assertEqual(ours.changed(self.db), {})
+		generation = theirs.bump(self.db, "status")
+		self.assertEqual(ours.changed(self.db), {"status": generation})
+		self.assertEqual(ours.changed(self.db), {})
+
+	def test_other_process_invalidates(self):
+		"Do writes from other processes invalidate our reference data?"
+		group_id = test_utilities.make_group(self.db)
+		queries.reference(self.db)
+		# Another worker writes a program without our listeners seeing it.
+		self.db.execute("INSERT INTO Program (name, program_group) VALUES (?, ?)", ("Minecraft", group_id))
+		self.db.commit()
+		generation = shared.Generations().bump(self.db, "reference")
+		self.db.commit()
+		queries.sync_caches(self.db)
+		data = queries.reference(self.db)
+		self.assertEqual(data.version, generation)
+		self.assertIn("Minecraft", data.program_by_name)
+
+class ClaimTests(test_utilities.DBTestCase):
+	"Test shared.claim"
+	def test_claim(self):
+		"Does only one caller get each interval?"
+		self.assertTrue(shared.claim(self.db, "retention", 60))
+		self.assertFalse(shared.claim(self.db, "retention", 60))
+		self.assertTrue(shared.claim(self.db, "retention", 0))
+
+class SnapshotGenerationTests(test_utilities.DBTestCase):
+	"Test which snapshots tell other workers about status changes."
+	def setUp(self):
+		super().setUp()
+		Program.insert(self.db, name="Minecraft", program_group=test_utilities.make_group(self.db))
+		self.moment = datetime.datetime(2020, 2, 2, 11, 0, 0)
+
+	def generation(self):
+		row = SharedState.search(self.db, name="status:testuser")
+		return row and row.generation
+
+	def store(self, seconds, programs):
+		queries.snapshot_store(self.db, "testhost", "testuser", 30, programs,
+			moment=self.moment + datetime.timedelta(seconds=seconds))
+
+	def test_only_changes(self):
+		"Do only snapshots that start, stop or change sessions bump the status generation?"
+		self.store(0, {"123": "Minecraft"})
+		started = self.generation()
+		self.assertIsNotNone(started)
+		self.store(30, {"123": "Minecraft"})
+		self.assertEqual(self.generation(), started)
+		self.store(60, {"123": "Minecraft", "124": "Minecraft"})
+		self.assertEqual(self.generation(), started + 1)
+		self.store(90, {})
+		self.assertEqual(self.generation(), started + 2)
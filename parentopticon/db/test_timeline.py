@@ -0,0 +1,72 @@
+import datetime
+
+from parentopticon.db import test_utilities
+from parentopticon.db import timeline
+from parentopticon.db.tables import UsageTimeline
+
+class TimelineTests(test_utilities.DBTestCase):
+	"Test the usage timeline."
+	def setUp(self):
+		super().setUp()
+		self.group_id = test_utilities.make_group(self.db)
+		self.day = datetime.date(2020, 2, 2)
+
+	def record(self, start: datetime.datetime, end: datetime.datetime) -> None:
+		timeline.record(self.db, "testuser", self.group_id, start, end)
+
+	def test_record_minutes(self):
+		"Can we record usage and get it back?"
+		self.record(
+			datetime.datetime(2020, 2, 2, 9, 0, 30),
+			datetime.datetime(2020, 2, 2, 9, 10, 30))
+		buckets = timeline.day_buckets(self.db, "testuser", self.group_id, self.day)
+		self.assertEqual(len(buckets), timeline.BUCKETS_PER_DAY)
+		self.assertEqual(timeline.minutes(buckets), 10)
+		self.assertEqual(buckets[9 * 60], 30)
+		self.assertEqual(buckets[9 * 60 + 1], 60)
+
+	def test_record_updates_row(self):
+		"Do we keep a single row per day as usage accumulates?"
+		start = datetime.datetime(2020, 2, 2, 9, 0, 0)
+		for i in range(4):
+			self.record(
+				start + datetime.timedelta(seconds=30 * i),
+				start + datetime.timedelta(seconds=30 * (i + 1)))
+		self.assertEqual(len(list(UsageTimeline.list(self.db))), 1)
+		buckets = timeline.day_buckets(self.db, "testuser", self.group_id, self.day)
+		self.assertEqual(timeline.minutes(buckets), 2)
+
+	def test_overlap_capped(self):
+		"Do we avoid counting more than the bucket length?"
+		start = datetime.datetime(2020, 2, 2, 9, 0, 0)
+		end = datetime.datetime(2020, 2, 2, 9, 5, 0)
+		self.record(start, end)
+		self.record(start, end)
+		self.assertEqual(timeline.total_minutes(self.db, "testuser", self.group_id, self.day, self.day), 5)
+
+	def test_across_midnight(self):
+		"Do we split usage across days?"
+		self.record(
+			datetime.datetime(2020, 2, 1, 23, 30, 0),
+			datetime.datetime(2020, 2, 2, 0, 15, 0))
+		by_day = timeline.days(self.db, "testuser", self.group_id, datetime.date(2020, 2, 1), self.day)
+		self.assertEqual(timeline.minutes(by_day[datetime.date(2020, 2, 1)]), 30)
+		self.assertEqual(timeline.minutes(by_day[self.day]), 15)
+
+	def test_heatmap(self):
+		"Can we get usage by hour for a range of days?"
+		self.record(
+			datetime.datetime(2020, 2, 2, 9, 30, 0),
+			datetime.datetime(2020, 2, 2, 10, 15, 0))
+		result = timeline.heatmap(self.db, "testuser", self.group_id, datetime.date(2020, 2, 1), self.day)
+		self.assertEqual(sorted(result.keys()), [datetime.date(2020, 2, 1), self.day])
+		self.assertEqual(sum(result[datetime.date(2020, 2, 1)]), 0)
+		self.assertEqual(result[self.day][9], 30)
+		self.assertEqual(result[self.day][10], 15)
+
+	def test_other_users_excluded(self):
+		"Do we keep each user's usage separate?"
+		timeline.record(self.db, "otheruser", self.group_id,
+			datetime.datetime(2020, 2, 2, 9, 0, 0),
+			datetime.datetime(2020, 2, 2, 10, 0, 0))
+		self.assertEqual(timeline.total_minutes(self.db, "testuser", self.group_id, self.day, self.day), 0)
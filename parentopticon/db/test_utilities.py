@@ -1,7 +1,13 @@
 "Utilities for testing against the DB."
+import importlib
 import os
+import shutil
+import subprocess
+import tempfile
+from typing import Optional
 import unittest
 
+from parentopticon.db import queries
 from parentopticon.db.connection import Connection
 from parentopticon.db.tables import create_all, truncate_all, ProgramGroup
 
@@ -20,11 +26,71 @@ class DBTestCase(unittest.TestCase):
 		self.db = Connection()
 		self.db.connect(TEST_DB_PATH)
 		create_all(self.db)
+		queries.reset_caches()
 
 	def tearDown(self):
 		"Clean up the test case, clean the database."
 		truncate_all(self.db)
 
+class PostgresServer:
+	"A throwaway PostgreSQL server in a temporary directory."
+	def __init__(self) -> None:
+		self.directory = tempfile.mkdtemp(prefix="parentopticon-postgres-")
+		bindir = _postgres_bindir()
+		self.pg_ctl = os.path.join(bindir, "pg_ctl")
+		data = os.path.join(self.directory, "data")
+		subprocess.run([os.path.join(bindir, "initdb"), "-D", data, "-A", "trust", "-U", "postgres"],
+			check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+		subprocess.run([self.pg_ctl, "start", "-w", "-D", data, "-l", os.path.join(self.directory, "log"),
+			"-o", "-k {} -c listen_addresses=''".format(self.directory)],
+			check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+		self.data = data
+		self.uri = "postgresql://postgres@/postgres?host={}".format(self.directory)
+
+	def stop(self) -> None:
+		subprocess.run([self.pg_ctl, "stop", "-w", "-m", "immediate", "-D", self.data],
+			stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+class PostgresDBTestCase(DBTestCase):
+	"Class that includes a database on a PostgreSQL server started for the tests."
+	server = None
+
+	@classmethod
+	def setUpClass(cls):
+		try:
+			importlib.import_module("psycopg2")
+		except ImportError:
+			raise unittest.SkipTest("psycopg2 is not installed")
+		if not _postgres_bindir():
+			raise unittest.SkipTest("PostgreSQL is not installed")
+		cls.server = PostgresServer()
+
+	@classmethod
+	def tearDownClass(cls):
+		if cls.server:
+			cls.server.stop()
+
+	def setUp(self):
+		self.db = Connection()
+		self.db.connect(self.server.uri)
+		create_all(self.db)
+		queries.reset_caches()
+
+	def tearDown(self):
+		truncate_all(self.db)
+		self.db.connection.close()
+
+def _postgres_bindir() -> Optional[str]:
+	"Find the directory with initdb and pg_ctl, if PostgreSQL is installed."
+	initdb = shutil.which("initdb")
+	if initdb:
+		return os.path.dirname(initdb)
+	if not shutil.which("pg_config"):
+		return None
+	bindir = subprocess.run(["pg_config", "--bindir"], capture_output=True, text=True).stdout.strip()
+	return bindir if os.path.exists(os.path.join(bindir, "initdb")) else None
+
 def make_group(connection: Connection, name: str = "games") -> int:
 	return ProgramGroup.insert(connection,
 		minutes_monday=0,
@@ -0,0 +1,130 @@
+"""
+Module for the per-day usage timeline of each user and program group.
+
+Each day of usage is a fixed size array of buckets, one byte per bucket,
+holding how many seconds of the bucket the user spent in the program
+group. A bucket never holds more than BUCKET_SECONDS, no matter how many
+programs in the group were running at once. Totals and per-hour
+breakdowns are sums over slices of the arrays rather than interval
+arithmetic over sessions.
+"""
+import datetime
+import logging
+import math
+from typing import Iterable, List, Mapping, Tuple
+
+from parentopticon.db.connection import Connection
+from parentopticon.db.tables import UsageTimeline
+
+LOGGER = logging.getLogger(__name__)
+
+BUCKET_SECONDS = 60
+BUCKETS_PER_DAY = 24 * 60 * 60 // BUCKET_SECONDS
+BUCKETS_PER_HOUR = 60 * 60 // BUCKET_SECONDS
+
+def day_buckets(connection: Connection, username: str, program_group: int, day: datetime.date) -> bytes:
+	"Get the buckets for a single day, which may be empty."
+	row = UsageTimeline.search(connection,
+		day=day,
+		program_group=program_group,
+		username=username,
+	)
+	return row.buckets if row else bytes(BUCKETS_PER_DAY)
+
+def days(connection: Connection,
+	username: str,
+	program_group: int,
+	first: datetime.date,
+	last: datetime.date) -> Mapping[datetime.date, bytes]:
+	"Get the buckets for every day with usage between first and last, inclusive."
+	rows = UsageTimeline.list_where(connection,
+		where="username = ? AND program_group = ? AND day BETWEEN ? AND ?",
+		bindings=(username, program_group, first, last),
+	)
+	return {row.day: row.buckets for row in rows}
+
+def heatmap(connection: Connection,
+	username: str,
+	program_group: int,
+	first: datetime.date,
+	last: datetime.date) -> Mapping[datetime.date, List[float]]:
+	"Get the minutes used in each hour of each day between first and last."
+	by_day = days(connection, username, program_group, first, last)
+	empty = [0.0] * 24
+	result = {}
+	day = first
+	while day <= last:
+		buckets = by_day.get(day)
+		result[day] = hourly_minutes(buckets) if buckets else list(empty)
+		day += datetime.timedelta(days=1)
+	return result
+
+def hourly_minutes(buckets: bytes) -> List[float]:
+	"Get the minutes used in each hour of a day."
+	return [
+		sum(buckets[hour * BUCKETS_PER_HOUR:(hour + 1) * BUCKETS_PER_HOUR]) / 60
+		for hour in range(24)
+	]
+
+def minutes(buckets: bytes) -> float:
+	"Get the total minutes used in a day."
+	return sum(buckets) / 60
+
+def record(connection: Connection,
+	username: str,
+	program_group: int,
+	start: datetime.datetime,
+	end: datetime.datetime) -> None:
+	"Record usage of a program group from start to end."
+	if end <= start:
+		return
+	for day, seconds_start, seconds_end in _split_days(start, end):
+		row = UsageTimeline.search(connection,
+			day=day,
+			program_group=program_group,
+			username=username,
+		)
+		buckets = bytearray(row.buckets if row else bytes(BUCKETS_PER_DAY))
+		_fill(buckets, seconds_start, seconds_end)
+		if row:
+			UsageTimeline.update(connection, row.id, buckets=bytes(buckets))
+		else:
+			UsageTimeline.insert(connection,
+				buckets=bytes(buckets),
+				day=day,
+				program_group=program_group,
+				username=username,
+			)
+
+def total_minutes(connection: Connection,
+	username: str,
+	program_group: int,
+	first: datetime.date,
+	last: datetime.date) -> float:
+	"Get the minutes used between first and last, inclusive."
+	return sum(minutes(buckets) for buckets in days(
+		connection, username, program_group, first, last).values())
+
+def _fill(buckets: bytearray, seconds_start: float, seconds_end: float) -> None:
+	"Add the seconds between start and end, measured from midnight, to the buckets."
+	first = int(seconds_start // BUCKET_SECONDS)
+	last = min(BUCKETS_PER_DAY, math.ceil(seconds_end / BUCKET_SECONDS))
+	for i in range(first, last):
+		bucket_start = i * BUCKET_SECONDS
+		overlap = min(seconds_end, bucket_start + BUCKET_SECONDS) - max(seconds_start, bucket_start)
+		buckets[i] = min(BUCKET_SECONDS, buckets[i] + round(overlap))
+
+def _split_days(
+	start: datetime.datetime,
+	end: datetime.datetime) -> Iterable[Tuple[datetime.date, float, float]]:
+	"Split a span into (day, seconds from midnight start, seconds from midnight end)."
+	while start < end:
+		midnight = datetime.datetime.combine(start.date(), datetime.time())
+		next_midnight = midnight + datetime.timedelta(days=1)
+		stop = min(end, next_midnight)
+		yield (
+			start.date(),
+			(start - midnight).total_seconds(),
+			(stop - midnight).total_seconds(),
+		)
+		start = stop
@@ -3,12 +3,12 @@ Module for handling enforcement logic.
 """
 import datetime
 from enum import Enum
-from typing import Iterable
+from typing import Iterable, Optional
 
 from parentopticon import ui
-from parentopticon.db import queries
+from parentopticon.db import limits, queries
 from parentopticon.db.connection import Connection
-from parentopticon.db.tables import Program, ProgramSession
+from parentopticon.db.tables import Program, ProgramGroup, ProgramSession
 
 class ActionType(Enum):
 	# Kill a program
@@ -31,42 +31,20 @@ def do(action: Action) -> None:
 		raise Exception("This should never happen.")
 
 	
-def get_minutes_left(program_sessions: Iterable[ProgramSession], program: Program) -> int:
-	"Get the minutes left for a given program, rounded up."
-	# Get all the restrictions that apply to this program
-	window_week = program.group.window_week
-	window_minutes = window_week.minutes_left(datetime.datetime.now())
-	if window_minutes == 0:
-		return 0
-	limit_minutes = get_limit_minutes_left(program_sessions, program)
+def get_minutes_left(connection: Connection, username: str, program_group: ProgramGroup) -> Optional[float]:
+	"Get the minutes left for a given program group, None if unlimited."
+	minutes_left = get_limit_minutes_left(connection, username, program_group)
+	if program_group.window_week:
+		schedule = queries.window_week_schedule(connection, program_group.window_week)
+		window_minutes = schedule.minutes_until_lock(datetime.datetime.now())
+		if minutes_left is None or window_minutes < minutes_left:
+			return window_minutes
+	return minutes_left
 
 
-def get_limit_minutes_left(program_sessions: Iterable[ProgramSession], program: Program) -> int:
-	"Get the minutes left for a program limit."
-	now = datetime.datetime.now()
-	limit = program.group.limit
-	sessions_today = (
-		ps for ps in program_sessions \
-		if ps.program_id == program.id and \
-		ps.start.isocalendar()[2] == now.isocalendar()[2])
-	sessions_this_week = (
-		ps for ps in program_sessions \
-		if ps.program_id == program.id and \
-		ps.start.isocalendar()[1] == now.isocalendar()[1])
-	sessions_this_month = (
-		ps for ps in program_sessions \
-		if ps.program_id == program.id and \
-		ps.start.month == now.month)
-
-	minutes_today = _total_minutes(sessions_today)
-	minutes_this_week = _total_minutes(sessions_this_week)
-	minutes_this_month = _total_minutes(sessions_this_month)
-
-	left_today = limit.daily - minutes_today
-	left_this_week = limit.weekly - minutes_this_week
-	left_this_month = limit.monthly - minutes_this_month
-	
-	return min((left_today, left_this_week, left_this_month))
+def get_limit_minutes_left(connection: Connection, username: str, program_group: ProgramGroup) -> Optional[float]:
+	"Get the minutes left under the daily, weekly and monthly limits."
+	return limits.minutes_remaining(limits.evaluate(connection, username, program_group))
 
 
 def get_program_sessions_current(connection: Connection) -> Iterable[ProgramSession]:
@@ -103,10 +81,11 @@ def go(db_connection: Connection) -> None:
 	"Check enforcement, give warnings, shutdown programs."
 	# Get all of the open sessions - if there are no
 	# open sessions there's nothing to enforce.
-	program_sessions = get_program_sessions_current()
+	program_sessions = get_program_sessions_current(db_connection)
 	for ops in (ps for ps in program_sessions if ps.end is None):
-		program = db_connection.program_get(ops.program_id)
-		minutes_left = get_minutes_left(program_sessions, program)
+		program = Program.get(db_connection, ops.program)
+		program_group = ProgramGroup.get(db_connection, program.program_group)
+		minutes_left = get_minutes_left(db_connection, ops.username, program_group)
 		if minutes_left == 15:
 			ui.show_alert("Finish up!",
 				"You have {} minutes left to play {}.\n"
@@ -130,7 +109,3 @@ def go(db_connection: Connection) -> None:
 
 def kill(program: Program) -> None:
 	"Forcefully kill the program."
-	
-			
-def _total_minutes(program_sessions: Iterable[ProgramSession]) -> int:
-	"Get total minutes consumed by the given program sessions."
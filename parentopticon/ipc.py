@@ -0,0 +1,264 @@
+"""
+Module for talking to the daemon over a Unix domain socket.
+
+Local programs, like the launcher, ask the daemon questions it can
+answer from what it already has, instead of asking the server. Each
+request and each response is one JSON object on one line, and a
+connection can carry any number of them. A request names a method, and
+the daemon runs the function registered for it with the rest of the
+request.
+
+The socket is made only readable and writable by the daemon's user.
+
+The browser extension can't use a Unix domain socket, so methods can be
+answered over HTTP on localhost too. Any web page could send requests
+there, so only JSON from a browser extension's origin is answered.
+"""
+import http.server
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from typing import Any, Callable, Iterable, Mapping, Optional
+
+from parentopticon import log
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT_SECONDS = 1.0
+# The origins browser extensions send requests from.
+EXTENSION_SCHEMES = ("chrome-extension://", "moz-extension://")
+
+Method = Callable[[Mapping[str, Any]], Mapping[str, Any]]
+
+class Error(Exception):
+	"The daemon couldn't be asked, or couldn't answer."
+
+def default_path() -> str:
+	"Get where the daemon's socket is, in the user's runtime directory when there is one."
+	runtime = os.environ.get("XDG_RUNTIME_DIR")
+	if runtime:
+		return os.path.join(runtime, "parentopticon.sock")
+	return log.data_path("parentopticon.sock")
+
+def request(method: str,
+	path: Optional[str] = None,
+	timeout: float = DEFAULT_TIMEOUT_SECONDS,
+	**arguments: Any) -> Mapping[str, Any]:
+	"Ask the daemon something, get its answer."
+	message = dict(arguments, method=method)
+	try:
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+			connection.settimeout(timeout)
+			connection.connect(path or default_path())
+			connection.sendall(json.dumps(message).encode("utf-8") + b"\n")
+			with connection.makefile("rb") as stream:
+				line = stream.readline()
+	except OSError as ex:
+		raise Error("Failed to ask the daemon: {}".format(ex))
+	if not line:
+		raise Error("The daemon closed the connection without answering")
+	try:
+		response = json.loads(line)
+	except ValueError:
+		response = None
+	if not isinstance(response, dict):
+		raise Error("The daemon answered with garbage: {!r}".format(line[:100]))
+	if "error" in response:
+		raise Error(response["error"])
+	return response
+
+class Server:
+	"""Answers requests on a Unix domain socket from a background thread.
+
+	Args:
+		methods: Method names to the functions that answer them.
+		path: Where to make the socket.
+		poll_interval: The longest stop() waits for the server to notice.
+	"""
+	def __init__(self,
+		methods: Mapping[str, Method],
+		path: Optional[str] = None,
+		poll_interval: float = 0.5) -> None:
+		self.methods = dict(methods)
+		self.path = path or default_path()
+		self.poll_interval = poll_interval
+		self._server = None
+		self._thread = None
+
+	def start(self) -> bool:
+		"Start answering requests, return whether we could."
+		if os.path.exists(self.path):
+			try:
+				request("ping", self.path)
+			except Error:
+				# Nothing is answering, it was left by a daemon that didn't stop cleanly.
+				os.unlink(self.path)
+			else:
+				LOGGER.warning("Another daemon is answering on %s", self.path)
+				return False
+		os.makedirs(os.path.dirname(self.path), exist_ok=True)
+		server = _UnixServer(self.path, _Handler)
+		server.methods = self.methods
+		os.chmod(self.path, 0o600)
+		self._server = server
+		self._thread = threading.Thread(target=server.serve_forever, args=(self.poll_interval,), name="ipc", daemon=True)
+		self._thread.start()
+		LOGGER.info("Answering local requests on %s", self.path)
+		return True
+
+	def stop(self) -> None:
+		"Stop answering requests and remove the socket."
+		if self._server is None:
+			return
+		self._server.shutdown()
+		self._server.server_close()
+		self._thread.join()
+		self._server = None
+		self._thread = None
+		try:
+			os.unlink(self.path)
+		except FileNotFoundError:
+			pass
+
+class HTTPServer:
+	"""Answers requests over HTTP on localhost from a background thread.
+
+	POST /website takes the visit the server's /website does and answers
+	the same way, 204 when it's allowed and 499 when it isn't, so the
+	browser extension only needs its report URL pointed here. Any other
+	POST /<method> is answered with the method's JSON.
+
+	Requests must be application/json and come from a browser extension,
+	so web pages can't send them. Browsers always send the Origin of
+	requests from extensions, and web pages can't change it.
+
+	Args:
+		methods: Method names to the functions that answer them.
+		port: The port to listen on, any free one when 0.
+		origins: The only origins to answer, like
+			"moz-extension://<uuid>". Any extension's when empty.
+		poll_interval: The longest stop() waits for the server to notice.
+	"""
+	def __init__(self,
+		methods: Mapping[str, Method],
+		port: int,
+		origins: Iterable[str] = (),
+		poll_interval: float = 0.5) -> None:
+		self.methods = dict(methods)
+		self.port = port
+		self.origins = frozenset(origin.rstrip("/") for origin in origins)
+		self.poll_interval = poll_interval
+		self._server = None
+		self._thread = None
+
+	def start(self) -> bool:
+		"Start answering requests, return whether we could."
+		try:
+			server = _HTTPServer(("127.0.0.1", self.port), _HTTPHandler)
+		except OSError as ex:
+			LOGGER.warning("Failed to listen on port %d: %s", self.port, ex)
+			return False
+		server.methods = self.methods
+		server.origins = self.origins
+		self.port = server.server_address[1]
+		self._server = server
+		self._thread = threading.Thread(target=server.serve_forever, args=(self.poll_interval,), name="ipc-http", daemon=True)
+		self._thread.start()
+		LOGGER.info("Answering local requests on http://127.0.0.1:%d", self.port)
+		return True
+
+	def stop(self) -> None:
+		"Stop answering requests."
+		if self._server is None:
+			return
+		self._server.shutdown()
+		self._server.server_close()
+		self._thread.join()
+		self._server = None
+		self._thread = None
+
+def _call(methods: Mapping[str, Method], name: str, message: Mapping[str, Any]) -> Mapping[str, Any]:
+	"Answer a request with the method registered for it."
+	if name == "ping":
+		return {}
+	method = methods.get(name)
+	if method is None:
+		return {"error": "No method '{}'".format(name)}
+	try:
+		return method(message)
+	except Exception as ex:
+		LOGGER.exception("Failed to answer %s", name)
+		return {"error": str(ex)}
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+	daemon_threads = True
+
+class _Handler(socketserver.StreamRequestHandler):
+	"Answers each line of a connection."
+	def handle(self) -> None:
+		for line in self.rfile:
+			self.wfile.write(json.dumps(self._answer(line), default=str).encode("utf-8") + b"\n")
+			self.wfile.flush()
+
+	def _answer(self, line: bytes) -> Mapping[str, Any]:
+		try:
+			message = json.loads(line)
+			name = message.pop("method")
+		except (KeyError, TypeError, ValueError, AttributeError):
+			return {"error": "Not a request: {!r}".format(line[:100])}
+		return _call(self.server.methods, name, message)
+
+class _HTTPServer(http.server.ThreadingHTTPServer):
+	daemon_threads = True
+
+class _HTTPHandler(http.server.BaseHTTPRequestHandler):
+	"Answers each POST of a connection, which is kept open between them."
+	protocol_version = "HTTP/1.1"
+
+	def do_POST(self) -> None:
+		name = self.path.split("?", 1)[0].strip("/")
+		body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+		if not self._allowed_origin():
+			self._send(403, {"error": "Origin not allowed: {!r}".format(self.headers.get("Origin"))})
+			return
+		content_type = self.headers.get("Content-Type", "").split(";", 1)[0].strip().lower()
+		if content_type != "application/json":
+			self._send(415, {"error": "Not application/json: {!r}".format(content_type)})
+			return
+		try:
+			message = json.loads(body or b"{}")
+		except ValueError:
+			message = None
+		if not isinstance(message, dict):
+			self._send(400, {"error": "Not a request: {!r}".format(body[:100])})
+			return
+		answer = _call(self.server.methods, name, message)
+		if "error" in answer:
+			self._send(404 if answer["error"].startswith("No method") else 500, answer)
+		elif name == "website":
+			self._send(204 if answer["allowed"] else 499)
+		else:
+			self._send(200, answer)
+
+	def log_message(self, format: str, *args: Any) -> None:
+		LOGGER.debug(format, *args)
+
+	def _allowed_origin(self) -> bool:
+		"Get whether the request comes from an extension we answer."
+		origin = self.headers.get("Origin", "").rstrip("/")
+		if self.server.origins:
+			return origin in self.server.origins
+		return any(origin.startswith(scheme) and len(origin) > len(scheme) for scheme in EXTENSION_SCHEMES)
+
+	def _send(self, status: int, answer: Optional[Mapping[str, Any]] = None) -> None:
+		data = b"" if answer is None else json.dumps(answer, default=str).encode("utf-8")
+		self.send_response(status)
+		if data:
+			self.send_header("Content-Type", "application/json")
+		if status != 204:
+			self.send_header("Content-Length", str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
@@ -1,6 +1,9 @@
+import argparse
 import datetime
 import logging
+import os
 import sys
+import typing
 
 import arrow
 import jinja2
@@ -24,6 +27,10 @@ def _nicetime(t: datetime.datetime) -> str:
 	else:
 		return t.isoformat()
 
+def _unlimited(minutes: typing.Optional[float]) -> str:
+	"Display minutes remaining, which are None when there is no limit."
+	return "unlimited" if minutes is None else str(minutes)
+
 def _timespan(t: datetime.timedelta) -> str:
 	s = t.total_seconds()
 	if s < 10:
@@ -52,12 +59,57 @@ class JinjaEnvironmentSanic(jinja2.Environment):
 			exc_value = source
 		LOGGER.error("Jinja exception: %s %s", exc_type, exc_value)
 		
-def create() -> jinja2.Environment:
+def create(
+	bytecode_cache: typing.Optional[str] = None,
+	precompiled: typing.Optional[str] = None,
+	auto_reload: bool = True) -> jinja2.Environment:
+	"""Create the environment for the webserver's templates.
+
+	Args:
+		bytecode_cache: A directory to cache compiled templates in between
+			runs. Defaults to a directory for the user under /tmp.
+		precompiled: A directory written by precompile() to load templates
+			from before falling back to the template sources.
+		auto_reload: Whether to check if template sources changed each time
+			they are used.
+	"""
+	loader = _source_loader()
+	if precompiled and os.path.isdir(precompiled):
+		loader = jinja2.ChoiceLoader([jinja2.ModuleLoader(precompiled), loader])
 	env = JinjaEnvironmentSanic(
-		loader=jinja2.PackageLoader("parentopticon", "templates"),
+		auto_reload=auto_reload,
 		autoescape=jinja2.select_autoescape(["html", "xml"]),
+		bytecode_cache=jinja2.FileSystemBytecodeCache(bytecode_cache),
+		loader=loader,
 	)
 	env.filters["humanize"] = _humanize
 	env.filters["nicetime"] = _nicetime
 	env.filters["timespan"] = _timespan
+	env.filters["unlimited"] = _unlimited
+	env.globals["now"] = datetime.datetime.now
 	return env
+
+def main() -> None:
+	"Precompile the templates."
+	parser = argparse.ArgumentParser()
+	parser.add_argument("target", help="The directory to write compiled templates to.")
+	args = parser.parse_args()
+	count = precompile(args.target)
+	print("Compiled {} templates into {}".format(count, args.target))
+
+def precompile(target: str) -> int:
+	"Compile every template to a Python module in target, return how many."
+	env = create()
+	names = _source_loader().list_templates()
+	env.compile_templates(target, zip=None, ignore_errors=False)
+	return len(names)
+
+def preload(env: jinja2.Environment) -> int:
+	"Load every template so that the first requests don't compile them, return how many."
+	names = _source_loader().list_templates()
+	for name in names:
+		env.get_template(name)
+	return len(names)
+
+def _source_loader() -> jinja2.BaseLoader:
+	return jinja2.PackageLoader("parentopticon", "templates")
@@ -1,8 +1,11 @@
 import argparse
 import logging
 import subprocess
+import sys
+from typing import Optional
 
 import parentopticon.log
+from parentopticon import ipc, ui
 
 LOGGER = logging.getLogger(__name__)
 
@@ -11,12 +14,33 @@ def main():
 	parser.add_argument("name", help="The friendly name of the program.")
 	parser.add_argument("target", help="The program to ultimately launch if the kids are good.")
 	parser.add_argument("arguments", nargs="*", help="Additional arguments for the target")
+	parser.add_argument("-p", "--preflight", action="store_true",
+		help="Ask the daemon whether the program may start before starting it.")
+	parser.add_argument("-s", "--socket", default=None, help="The daemon's socket.")
 	args = parser.parse_args()
 	parentopticon.log.setup()
 
+	if args.preflight:
+		reason = preflight(args.name, args.socket)
+		if reason is not None:
+			LOGGER.info("Not launching %s: %s", args.name, reason)
+			ui.show_denied(args.name, reason)
+			sys.exit(1)
 	LOGGER.info("Launching %s using '%s%s'",
 		args.name,
 		args.target,
 		" " + " ".join(args.arguments) if args.arguments else "")
 	subprocess.call([args.target] + args.arguments)
 	LOGGER.info("%s Complete.", args.name)
+
+def preflight(name: str, path: Optional[str] = None) -> Optional[str]:
+	"Get why the daemon won't let a program start, None when it will or can't be asked."
+	try:
+		answer = ipc.request("launch", path, program=name)
+	except ipc.Error as ex:
+		# The daemon still kills the program later if it shouldn't be running.
+		LOGGER.warning("Launching %s without a preflight check: %s", name, ex)
+		return None
+	if answer["allowed"]:
+		return None
+	return answer["reason"]
@@ -1,26 +1,184 @@
 """
 Module for logging functions.
+
+Records are put on a queue by the thread that logs them and written to
+the console and the log file by a listener thread, so slow disks don't
+slow down whatever is logging. Before a record is queued it can be
+dropped by per-module sampling of debug records and by a per-module
+limit on how many records below WARNING are logged each second.
 """
+import atexit
+import copy
+import json
 import logging
 import logging.handlers
 import os
+import queue
+import random
+import threading
+import time
+import traceback
 import typing
 
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# The queue handler and listener set up by setup(), restarted in forked children.
+_PIPELINE: typing.Dict[str, typing.Any] = {}
+
+class JSONFormatter(logging.Formatter):
+	"Formats records as one JSON object per line."
+	def format(self, record: logging.LogRecord) -> str:
+		data = {
+			"level": record.levelname,
+			"logger": record.name,
+			"message": record.getMessage(),
+			"process": record.process,
+			"time": self.formatTime(record),
+		}
+		if record.exc_info:
+			data["exception"] = "".join(traceback.format_exception(*record.exc_info))
+		elif record.exc_text:
+			data["exception"] = record.exc_text
+		return json.dumps(data, default=str)
+
+class QueueHandler(logging.handlers.QueueHandler):
+	"Queues records with their message and traceback worked out, but not formatted."
+	def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+		record = copy.copy(record)
+		record.msg = record.getMessage()
+		record.args = None
+		if record.exc_info:
+			record.exc_text = logging.Formatter().formatException(record.exc_info)
+			record.exc_info = None
+		return record
+
+class RateLimitFilter(logging.Filter):
+	"""Drops records below WARNING once a module logs too many each second.
+
+	Each logger gets a bucket of tokens that refills at per_second and
+	holds up to burst. The next record after some are dropped says how
+	many were.
+	"""
+	def __init__(self, per_second: float, burst: typing.Optional[float] = None) -> None:
+		super().__init__()
+		self.burst = burst or per_second
+		self.per_second = per_second
+		self._buckets: typing.Dict[str, typing.List[float]] = {}
+		self._lock = threading.Lock()
+
+	def filter(self, record: logging.LogRecord) -> bool:
+		if record.levelno >= logging.WARNING:
+			return True
+		now = time.monotonic()
+		with self._lock:
+			# Tokens, when they were last counted and how many records were dropped.
+			bucket = self._buckets.setdefault(record.name, [self.burst, now, 0])
+			bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.per_second)
+			bucket[1] = now
+			if bucket[0] < 1:
+				bucket[2] += 1
+				return False
+			bucket[0] -= 1
+			dropped, bucket[2] = bucket[2], 0
+		if dropped:
+			record.msg = "{} [{} earlier messages dropped]".format(record.getMessage(), dropped)
+			record.args = None
+		return True
+
+class SampleFilter(logging.Filter):
+	"""Keeps a fraction of the debug records of some modules.
+
+	Args:
+		rates: Logger names to the fraction of their debug records to keep.
+			A name covers the loggers below it too.
+	"""
+	def __init__(self, rates: typing.Mapping[str, float]) -> None:
+		super().__init__()
+		self.rates = dict(rates)
+		self._cache: typing.Dict[str, float] = {}
+
+	def filter(self, record: logging.LogRecord) -> bool:
+		if record.levelno > logging.DEBUG:
+			return True
+		rate = self._cache.get(record.name)
+		if rate is None:
+			rate = self._rate(record.name)
+			self._cache[record.name] = rate
+		return rate >= 1 or random.random() < rate
+
+	def _rate(self, name: str) -> float:
+		while name:
+			if name in self.rates:
+				return self.rates[name]
+			name = name.rpartition(".")[0]
+		return 1
+
 def _xdg_data_home() -> typing.Text:
 	return os.environ.get("XDG_DATA_HOME", os.path.expanduser("~/.local/share"))
 
-def setup(level: int = logging.INFO) -> None:
+def data_path(filename: str) -> typing.Text:
+	"Get the path of a file in the user's data directory."
+	return os.path.join(_xdg_data_home(), filename)
+
+def setup(level: int = logging.INFO,
+	json_lines: bool = False,
+	sample: typing.Optional[typing.Mapping[str, float]] = None,
+	rate_limit: typing.Optional[float] = None) -> None:
+	"""Send logs to the console and the log file through a queue.
+
+	Args:
+		level: The lowest level to log.
+		json_lines: Whether to write JSON objects rather than text.
+		sample: Logger names to the fraction of debug records to keep.
+		rate_limit: The most records below WARNING a logger may log each second.
+	"""
 	logger = logging.getLogger()
 	logger.setLevel(level)
-	formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+	if "handler" in _PIPELINE:
+		_stop_listener()
+		logger.removeHandler(_PIPELINE["handler"])
+	formatter = JSONFormatter() if json_lines else logging.Formatter(TEXT_FORMAT)
 	stream_handler = logging.StreamHandler()
 	stream_handler.setFormatter(formatter)
 	file_handler = logging.handlers.RotatingFileHandler(
-		filename=os.path.join(_xdg_data_home(), "parentopticon.log"),
+		filename=data_path("parentopticon.log"),
 		mode="a",
 		maxBytes=1024*1024*10,
 		backupCount=10,
 	)
 	file_handler.setFormatter(formatter)
-	logger.addHandler(stream_handler)
-	logger.addHandler(file_handler)
+	queue_handler = QueueHandler(queue.SimpleQueue())
+	if sample:
+		queue_handler.addFilter(SampleFilter(sample))
+	if rate_limit:
+		queue_handler.addFilter(RateLimitFilter(rate_limit))
+	logger.addHandler(queue_handler)
+	_PIPELINE["handler"] = queue_handler
+	_PIPELINE["handlers"] = (stream_handler, file_handler)
+	_start_listener()
+	if not _PIPELINE.get("registered"):
+		atexit.register(_stop_listener)
+		# The listener thread doesn't survive a fork, like the webserver's workers.
+		os.register_at_fork(after_in_child=_restart_listener)
+		_PIPELINE["registered"] = True
+
+def _restart_listener() -> None:
+	if "handler" not in _PIPELINE:
+		return
+	_PIPELINE["handler"].queue = queue.SimpleQueue()
+	_start_listener()
+
+def _start_listener() -> None:
+	listener = logging.handlers.QueueListener(
+		_PIPELINE["handler"].queue,
+		*_PIPELINE["handlers"],
+		respect_handler_level=True,
+	)
+	listener.start()
+	_PIPELINE["listener"] = listener
+
+def _stop_listener() -> None:
+	"Write out every queued record."
+	listener = _PIPELINE.pop("listener", None)
+	if listener is not None:
+		listener.stop()
@@ -0,0 +1,208 @@
+"""
+Module for counting and timing what parentopticon does.
+
+Metrics live in memory in each process. They are rendered in the
+Prometheus text format, by the webserver at /metrics and by the daemon
+into a stats file. Values that something else already keeps, like cache
+hit counts, are read by collector functions at render time instead of
+being counted twice.
+"""
+import bisect
+import contextlib
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Sequence, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from a fast SQL statement to a slow page.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# A sample is a metric name suffix, its labels and its value.
+Sample = Tuple[str, Mapping[str, str], float]
+
+class Metric:
+	"A named metric with a fixed set of label names."
+	TYPE = "untyped"
+
+	def __init__(self, name: str, help_: str, labels: Sequence[str] = ()) -> None:
+		self.help = help_
+		self.labels = tuple(labels)
+		self.name = name
+		self._lock = threading.Lock()
+
+	def samples(self) -> Iterable[Sample]:
+		raise NotImplementedError()
+
+	def _key(self, labels: Mapping[str, str]) -> Tuple[str, ...]:
+		try:
+			if len(labels) == len(self.labels):
+				return tuple([str(labels[label]) for label in self.labels])
+		except KeyError:
+			pass
+		raise ValueError("{} takes labels {}, not {}".format(self.name, self.labels, sorted(labels)))
+
+class Collector(Metric):
+	"A metric whose values are read from a function when rendered."
+	def __init__(self,
+		name: str,
+		help_: str,
+		collect: Callable[[], Mapping[Tuple[str, ...], float]],
+		labels: Sequence[str] = (),
+		type_: str = "gauge") -> None:
+		super().__init__(name, help_, labels)
+		self.TYPE = type_
+		self._collect = collect
+
+	def samples(self) -> Iterable[Sample]:
+		for key, value in sorted(self._collect().items()):
+			yield "", dict(zip(self.labels, key)), value
+
+class Counter(Metric):
+	"A count that only goes up."
+	TYPE = "counter"
+
+	def __init__(self, name: str, help_: str, labels: Sequence[str] = ()) -> None:
+		super().__init__(name, help_, labels)
+		self._values: Dict[Tuple[str, ...], float] = {}
+
+	def inc(self, amount: float = 1, **labels: str) -> None:
+		"Add to the count for a set of labels."
+		key = self._key(labels)
+		with self._lock:
+			self._values[key] = self._values.get(key, 0) + amount
+
+	def samples(self) -> Iterable[Sample]:
+		with self._lock:
+			values = sorted(self._values.items())
+		for key, value in values:
+			yield "", dict(zip(self.labels, key)), value
+
+class Histogram(Metric):
+	"Counts of observations in buckets, with their sum."
+	TYPE = "histogram"
+
+	def __init__(self,
+		name: str,
+		help_: str,
+		labels: Sequence[str] = (),
+		buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+		super().__init__(name, help_, labels)
+		self.buckets = tuple(sorted(buckets))
+		# For each set of labels, the count in each bucket and past the last one, then the sum and count.
+		self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+	def child(self, **labels: str) -> "HistogramChild":
+		"Get the histogram for one set of labels, to observe without looking them up."
+		key = self._key(labels)
+		with self._lock:
+			values = self._values.get(key)
+			if values is None:
+				values = [0] * (len(self.buckets) + 3)
+				self._values[key] = values
+		return HistogramChild(self, values)
+
+	def observe(self, value: float, **labels: str) -> None:
+		"Record one observation for a set of labels."
+		self.child(**labels).observe(value)
+
+	def samples(self) -> Iterable[Sample]:
+		with self._lock:
+			items = sorted((key, list(values)) for key, values in self._values.items())
+		for key, values in items:
+			labels = dict(zip(self.labels, key))
+			cumulative = 0
+			for bound, count in zip(self.buckets, values):
+				cumulative += count
+				yield "_bucket", dict(labels, le=_format_value(bound)), cumulative
+			yield "_bucket", dict(labels, le="+Inf"), values[-1]
+			yield "_sum", labels, values[-2]
+			yield "_count", labels, values[-1]
+
+	@contextlib.contextmanager
+	def time(self, **labels: str) -> Iterator[None]:
+		"Observe how many seconds the context takes."
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.observe(time.perf_counter() - start, **labels)
+
+class HistogramChild:
+	"The part of a histogram for one set of labels."
+	def __init__(self, histogram: Histogram, values: List[float]) -> None:
+		self._buckets = histogram.buckets
+		self._lock = histogram._lock
+		self._values = values
+
+	def observe(self, value: float) -> None:
+		"Record one observation."
+		values = self._values
+		with self._lock:
+			# Past the last bucket only counts towards +Inf, which is the count.
+			values[bisect.bisect_left(self._buckets, value)] += 1
+			values[-2] += value
+			values[-1] += 1
+
+class Registry:
+	"The metrics of one process."
+	def __init__(self) -> None:
+		self._metrics: Dict[str, Metric] = {}
+
+	def collector(self, name: str, help_: str, collect: Callable[[], Mapping[Tuple[str, ...], float]],
+		labels: Sequence[str] = (), type_: str = "gauge") -> Collector:
+		"Add a metric read from a function when rendered."
+		return self._add(Collector(name, help_, collect, labels, type_))
+
+	def counter(self, name: str, help_: str, labels: Sequence[str] = ()) -> Counter:
+		"Add a counter."
+		return self._add(Counter(name, help_, labels))
+
+	def histogram(self, name: str, help_: str, labels: Sequence[str] = (),
+		buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+		"Add a histogram."
+		return self._add(Histogram(name, help_, labels, buckets))
+
+	def render(self) -> str:
+		"Get every metric in the Prometheus text format."
+		lines = []
+		for name, metric in sorted(self._metrics.items()):
+			lines.append("# HELP {} {}".format(name, metric.help))
+			lines.append("# TYPE {} {}".format(name, metric.TYPE))
+			try:
+				samples = list(metric.samples())
+			except Exception:
+				LOGGER.exception("Failed to collect %s", name)
+				continue
+			for suffix, labels, value in samples:
+				lines.append("{}{}{} {}".format(name, suffix, _format_labels(labels), _format_value(value)))
+		return "\n".join(lines) + "\n"
+
+	def write(self, path: str) -> None:
+		"Write every metric to a file, replacing it all at once."
+		temporary = path + ".tmp"
+		with open(temporary, "w") as output:
+			output.write(self.render())
+		os.replace(temporary, path)
+
+	def _add(self, metric: Metric) -> Metric:
+		if metric.name in self._metrics:
+			raise ValueError("There is already a metric called {}".format(metric.name))
+		self._metrics[metric.name] = metric
+		return metric
+
+REGISTRY = Registry()
+
+def _format_labels(labels: Mapping[str, str]) -> str:
+	if not labels:
+		return ""
+	return "{" + ",".join('{}="{}"'.format(
+		name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+		for name, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+	if isinstance(value, float) and value.is_integer():
+		return str(int(value))
+	return repr(value) if isinstance(value, float) else str(value)
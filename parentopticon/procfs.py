@@ -0,0 +1,155 @@
+"""
+Module for listing processes by reading /proc directly.
+
+This is much cheaper than psutil for what a snapshot needs. Only the
+processes of one user are looked at, which is decided from the owner of
+/proc/<pid> before anything is opened. A process's start time and
+command line are only read the first time it is seen. After that, the
+inode and change time of /proc/<pid>, which the stat call for the owner
+already got, show it is the same process. When the inode changes, as it
+does when the pid is reused, the start time decides whether the command
+line has to be read again.
+
+Neither the inode nor the start time changes when a process execs
+another program, so the comm, which does, is read each scan too, and
+the command line is read again whenever it changed. A process that
+execs a program with the same comm is caught by reading its command
+line again every CMDLINE_REFRESH_SCANS scans anyway. A steady scan is a
+directory listing, a stat and a read of the comm per process.
+"""
+import collections
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+# The parent is the one the process had when it was first seen, since a
+# process whose parent exits is given to init and would otherwise lose
+# the program it was started by.
+Process = collections.namedtuple("Process", (
+	"cmdline",
+	"pgid",
+	"pid",
+	"ppid",
+	"start_time",
+))
+
+# The inode and change time of /proc/<pid>, its comm, and the process.
+_Known = Tuple[Tuple[int, int], bytes, Process]
+
+# Most /proc files we read fit in this many bytes.
+BUFFER_SIZE = 4096
+
+# How many scans a command line is kept without reading it again.
+CMDLINE_REFRESH_SCANS = 10
+
+# Fields of /proc/<pid>/stat, counted from the one after the comm.
+_PPID_FIELD = 1
+_PGID_FIELD = 2
+_START_TIME_FIELD = 19
+
+def available(root: str = "/proc") -> bool:
+	"Whether there is a procfs to scan."
+	return os.path.exists(os.path.join(root, "self", "stat"))
+
+class Scanner:
+	"""Lists the processes of one user.
+
+	Args:
+		uid: The user to list the processes of, the current user by default.
+		root: Where procfs is mounted.
+	"""
+	def __init__(self, uid: Optional[int] = None, root: str = "/proc") -> None:
+		self.root = root
+		self.uid = os.getuid() if uid is None else uid
+		self._buffer = bytearray(BUFFER_SIZE)
+		self._scans = 0
+		# The inode and change time of /proc/<pid> and the process of each pid in the last scan.
+		self._known: Dict[int, _Known] = {}
+
+	def scan(self) -> List[Process]:
+		"Get the processes running now."
+		self._scans += 1
+		known = {}
+		processes = []
+		with os.scandir(self.root) as entries:
+			for entry in entries:
+				if entry.name.isdigit():
+					process = self._process(entry, known)
+					if process is not None:
+						processes.append(process)
+		# Only keep the processes still running, so exited ones fall out.
+		self._known = known
+		return processes
+
+	def _process(self, entry: os.DirEntry, known: Dict[int, _Known]) -> Optional[Process]:
+		try:
+			stat = entry.stat()
+			if stat.st_uid != self.uid:
+				return None
+			pid = int(entry.name)
+			identity = (stat.st_ino, stat.st_ctime_ns)
+			comm = _comm(entry.path)
+			cached = self._known.get(pid)
+			fields = None
+			if cached is not None and cached[0] != identity:
+				fields = self._stat(entry.path)
+				if cached[2].start_time != fields[2]:
+					cached = None
+			if cached is None:
+				ppid, pgid, start_time = fields or self._stat(entry.path)
+				process = Process(
+					cmdline=self._cmdline(entry.path, comm),
+					pgid=pgid,
+					pid=pid,
+					ppid=ppid,
+					start_time=start_time,
+				)
+			elif cached[1] != comm or (self._scans + pid) % CMDLINE_REFRESH_SCANS == 0:
+				# It may have exec'd, which keeps the pid and start time.
+				process = cached[2]._replace(cmdline=self._cmdline(entry.path, comm))
+			else:
+				process = cached[2]
+		except (FileNotFoundError, ProcessLookupError):
+			# It exited while we looked at it.
+			return None
+		except PermissionError:
+			return None
+		known[pid] = (identity, comm, process)
+		return process
+
+	def _cmdline(self, path: str, comm: bytes) -> Tuple[str, ...]:
+		data = self._read(os.path.join(path, "cmdline"))
+		if not data:
+			# Zombies and some daemons that rewrite their arguments have none.
+			return (comm.decode("utf-8", "replace").rstrip("\n"),)
+		return tuple(argument.decode("utf-8", "replace") for argument in data.rstrip(b"\0").split(b"\0"))
+
+	def _read(self, path: str) -> bytes:
+		"Read a whole file through the reusable buffer."
+		fd = os.open(path, os.O_RDONLY)
+		try:
+			chunks: List[bytes] = []
+			while True:
+				count = os.readv(fd, [self._buffer])
+				if not count:
+					return b"".join(chunks)
+				chunks.append(bytes(self._buffer[:count]))
+		finally:
+			os.close(fd)
+
+	def _stat(self, path: str) -> Tuple[int, int, int]:
+		"Get the parent pid, process group and start time of a process."
+		data = self._read(os.path.join(path, "stat"))
+		# The comm can hold spaces and parentheses, the fields after it can't.
+		fields = data[data.rindex(b")") + 2:].split()
+		return int(fields[_PPID_FIELD]), int(fields[_PGID_FIELD]), int(fields[_START_TIME_FIELD])
+
+def _comm(path: str) -> bytes:
+	"Read the comm of a process, which is short enough for one read."
+	fd = os.open(os.path.join(path, "comm"), os.O_RDONLY)
+	try:
+		return os.read(fd, 64)
+	finally:
+		os.close(fd)
@@ -1,4 +1,5 @@
 """This module contains functions for reading in configured restrictoins."""
+import bisect
 import datetime
 import enum
 import typing
@@ -16,12 +17,20 @@ class WindowSet:
 	"""A group of window sets to apply together."""
 	def __init__(self, windows: typing.Iterable[Window]):
 		self.windows = sorted(windows, key=lambda w: w.start)
+		# Merge overlapping windows so a binary search finds the only
+		# window that could contain a given time.
+		self._starts = []
+		self._ends = []
+		for window in self.windows:
+			if self._ends and window.start <= self._ends[-1]:
+				self._ends[-1] = max(self._ends[-1], window.end)
+			else:
+				self._starts.append(window.start)
+				self._ends.append(window.end)
 
 	def is_locked(self, when: datetime.time):
-		for window in self.windows:
-			if not window.is_locked(when):
-				return False
-		return True
+		i = bisect.bisect_right(self._starts, when) - 1
+		return i < 0 or self._ends[i] <= when
 
 
 class WindowWeek:
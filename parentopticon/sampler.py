@@ -0,0 +1,108 @@
+"""
+Module for a sampling profiler that can run in production.
+
+A background thread looks at the stack of one thread, usually the main
+thread that runs the daemon loop or the event loop, every interval and
+counts each stack it sees. The counts are written as collapsed stacks,
+one 'root;caller;callee count' line per stack, which flamegraph.pl,
+speedscope and inferno all read.
+
+Sending SIGUSR2 to a process that installed the toggle starts sampling,
+and sending it again stops sampling and writes the file.
+"""
+import collections
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from typing import Optional
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL_SECONDS = 0.01
+
+class Sampler:
+	"""Samples the stack of a thread.
+
+	Args:
+		thread_id: The ident of the thread to sample, the main thread by default.
+		interval: Seconds between samples.
+	"""
+	def __init__(self,
+		thread_id: Optional[int] = None,
+		interval: float = DEFAULT_INTERVAL_SECONDS) -> None:
+		self.interval = interval
+		self.samples = collections.Counter()
+		self.thread_id = thread_id or threading.main_thread().ident
+		self._stop = threading.Event()
+		self._thread = None
+
+	@property
+	def running(self) -> bool:
+		return self._thread is not None
+
+	def clear(self) -> None:
+		"Forget every sample."
+		self.samples.clear()
+
+	def sample(self) -> None:
+		"Take one sample of the thread's stack."
+		frame = sys._current_frames().get(self.thread_id)
+		if frame is None:
+			return
+		names = []
+		while frame is not None:
+			code = frame.f_code
+			names.append("{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+			frame = frame.f_back
+		self.samples[";".join(reversed(names))] += 1
+
+	def start(self) -> None:
+		"Start sampling in a background thread."
+		if self.running:
+			return
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+		self._thread.start()
+
+	def stop(self) -> None:
+		"Stop sampling, keeping the samples taken so far."
+		if not self.running:
+			return
+		self._stop.set()
+		self._thread.join()
+		self._thread = None
+
+	def write(self, path: str) -> int:
+		"Write the samples as collapsed stacks, return how many samples there were."
+		with open(path, "w") as output:
+			for stack, count in sorted(self.samples.items()):
+				output.write("{} {}\n".format(stack, count))
+		return sum(self.samples.values())
+
+	def _run(self) -> None:
+		while not self._stop.wait(self.interval):
+			self.sample()
+
+def install_toggle(sampler: Sampler, directory: str, signum: int = signal.SIGUSR2) -> None:
+	"Start and stop a sampler, writing its samples to directory, each time a signal arrives."
+	def toggle(received: int, frame) -> None:
+		if sampler.running:
+			write(sampler, directory)
+		else:
+			LOGGER.info("Started sampling, send signal %d again to stop.", signum)
+			sampler.start()
+	signal.signal(signum, toggle)
+
+def write(sampler: Sampler, directory: str) -> str:
+	"Stop a sampler and write its samples to a new file in directory, return the path."
+	sampler.stop()
+	os.makedirs(directory, exist_ok=True)
+	path = os.path.join(directory, "parentopticon-{}-{}.folded".format(
+		os.getpid(), time.strftime("%Y%m%d-%H%M%S")))
+	count = sampler.write(path)
+	sampler.clear()
+	LOGGER.info("Wrote %d stack samples to %s", count, path)
+	return path
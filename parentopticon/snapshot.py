@@ -1,15 +1,124 @@
 """
 Module for logic around getting a snapshot of what the system is doing.
 """
+import collections
 import logging
+import os
 import pprint
+import signal
 import psutil
-from typing import Iterable, Mapping
+from typing import Callable, Dict, Iterable, Mapping, Optional, Sequence, Set
+
+from parentopticon import procfs
 
 
 LOGGER = logging.getLogger(__name__)
 
 
+Node = collections.namedtuple("Node", (
+	"cmdline",
+	"pgid",
+	"ppid",
+	"program",
+	"start_time",
+))
+
+class Snapshotter:
+	"""Takes snapshots, remembering which program each process is.
+
+	The processes are kept as a tree, by the pid of their parent. A
+	process whose arguments don't match a program belongs to the program
+	of its parent, so the children of a launcher or a Java wrapper count
+	too. Each process is only attributed the first time its pid and start
+	time are seen, or when its command line changes because it exec'd.
+	Pids that exited are forgotten each snapshot, and everything is
+	forgotten when the process names to look for change.
+
+	Only processes the last snapshot attributed to a program are killed,
+	so a pid that exited and was reused by something else is left alone.
+
+	Args:
+		scanner: Lists processes from /proc, psutil is used without one.
+	"""
+	def __init__(self, scanner: Optional[procfs.Scanner] = None) -> None:
+		self.scanner = scanner
+		self._nodes: Dict[int, Node] = {}
+		self._process_to_program: Optional[Mapping[str, str]] = None
+		self._pid_to_program: Mapping[int, str] = {}
+
+	def family(self, pid: int) -> Set[int]:
+		"Get a pid and the pids of every process under it."
+		children = collections.defaultdict(list)
+		for child, node in self._nodes.items():
+			children[node.ppid].append(child)
+		family = set()
+		pending = [pid]
+		while pending:
+			parent = pending.pop()
+			if parent in family:
+				continue
+			family.add(parent)
+			pending.extend(children.get(parent, ()))
+		return family
+
+	def kill(self, pids: Iterable[int], signum: int = signal.SIGINT) -> None:
+		"""Signal processes and every process under them.
+
+		A process group is signalled in one call when all of it is in the
+		families being signalled, including its leader. Otherwise, as for a
+		group shared with the daemon, each process is signalled on its own.
+		"""
+		family = set()
+		for pid in pids:
+			if pid not in self._pid_to_program:
+				LOGGER.warning("Not killing %d, it isn't a program in the last snapshot", pid)
+				continue
+			family.update(self.family(pid))
+		groups = collections.defaultdict(set)
+		for pid, node in self._nodes.items():
+			groups[node.pgid].add(pid)
+		own = os.getpgrp()
+		for pgid, members in sorted(groups.items()):
+			if pgid != own and pgid in family and members <= family:
+				_signal(os.killpg, pgid, signum)
+				family -= members
+		for pid in sorted(family):
+			_signal(os.kill, pid, signum)
+
+	def take(self, process_to_program: Mapping[str, str]) -> Mapping[int, str]:
+		"Take a snapshot of the running programs, see take()."
+		if self.scanner is None:
+			self._pid_to_program = take(process_to_program)
+			return self._pid_to_program
+		if process_to_program != self._process_to_program:
+			self._process_to_program = dict(process_to_program)
+			self._nodes = {}
+		nodes = {}
+		new = []
+		for process in self.scanner.scan():
+			node = self._nodes.get(process.pid)
+			if node is not None and node.start_time == process.start_time and node.cmdline == process.cmdline:
+				nodes[process.pid] = node
+			else:
+				new.append(process)
+		# Parents start before their children, so in this order a parent is always attributed first.
+		for process in sorted(new, key=lambda process: (process.start_time, process.pid)):
+			program = _match(process.cmdline, process_to_program)
+			if program is None:
+				parent = nodes.get(process.ppid)
+				if parent is not None and parent.start_time <= process.start_time:
+					program = parent.program
+			nodes[process.pid] = Node(
+				cmdline=process.cmdline,
+				pgid=process.pgid,
+				ppid=process.ppid,
+				program=program,
+				start_time=process.start_time,
+			)
+		self._nodes = nodes
+		self._pid_to_program = {pid: node.program for pid, node in nodes.items() if node.program is not None}
+		return self._pid_to_program
+
 def take(process_to_program: Mapping[str, str]) -> Mapping[int, str]:
 	"""Take a snapshot of the running programs.
 
@@ -20,7 +129,22 @@ def take(process_to_program: Mapping[str, str]) -> Mapping[int, str]:
 	"""
 	pid_to_program = {}
 	for process in psutil.process_iter(attrs=["cmdline", "exe", "name", "username", "pid"]):
-		for k, v in process_to_program.items():
-			if k in process.cmdline():
-				pid_to_program[process.pid] = v
+		# The prefetched command line is None for zombies and processes we can't read.
+		program = _match(process.info["cmdline"] or (), process_to_program)
+		if program is not None:
+			pid_to_program[process.pid] = program
 	return pid_to_program
+
+def _match(cmdline: Sequence[str], process_to_program: Mapping[str, str]) -> Optional[str]:
+	"Get the program of a command line, the last one that matches an argument."
+	program = None
+	for k, v in process_to_program.items():
+		if k in cmdline:
+			program = v
+	return program
+
+def _signal(send: Callable[[int, int], None], target: int, signum: int) -> None:
+	try:
+		send(target, signum)
+	except (PermissionError, ProcessLookupError) as ex:
+		LOGGER.warning("Failed to signal %d: %s", target, ex)
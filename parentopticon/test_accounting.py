@@ -0,0 +1,96 @@
+import datetime
+import unittest
+
+from parentopticon import accounting
+
+MOMENT = datetime.datetime(2020, 2, 2, 11, 0, 0)
+
+class ClockSkewTests(unittest.TestCase):
+	"Test accounting.ClockSkew"
+	def setUp(self):
+		self.skew = accounting.ClockSkew()
+		self.observed = MOMENT.timestamp()
+
+	def test_no_observation(self):
+		"Do we fall back to the received time without a client timestamp?"
+		result = self.skew.correct("testhost", None, MOMENT)
+		self.assertEqual(result, MOMENT)
+
+	def test_latency_removed(self):
+		"Do we ignore latency once we've seen a faster report?"
+		# Client clock is 10 minutes slow, first report took 5 seconds.
+		slow = self.observed - 600
+		self.skew.correct("testhost", slow, MOMENT + datetime.timedelta(seconds=5))
+		# Second report, 30 seconds later, took under a second.
+		result = self.skew.correct("testhost", slow + 30, MOMENT + datetime.timedelta(seconds=30.5))
+		self.assertEqual(result, MOMENT + datetime.timedelta(seconds=30.5))
+		# Third report is slow again, we should credit the observation time.
+		result = self.skew.correct("testhost", slow + 60, MOMENT + datetime.timedelta(seconds=70))
+		self.assertEqual(result, MOMENT + datetime.timedelta(seconds=60.5))
+
+	def test_never_later_than_received(self):
+		"Do we avoid placing observations in the future?"
+		result = self.skew.correct("testhost", self.observed + 3600, MOMENT)
+		self.assertEqual(result, MOMENT)
+
+	def test_clock_jump(self):
+		"Do we start over when the client clock jumps?"
+		self.skew.correct("testhost", self.observed, MOMENT)
+		# Client clock jumps back an hour.
+		received = MOMENT + datetime.timedelta(seconds=30)
+		result = self.skew.correct("testhost", self.observed + 30 - 3600, received)
+		self.assertEqual(result, received)
+
+	def test_hosts_independent(self):
+		"Do we track skew separately for each host?"
+		self.skew.correct("fast", self.observed + 600, MOMENT)
+		result = self.skew.correct("slow", self.observed - 600, MOMENT)
+		self.assertEqual(result, MOMENT)
+
+class SessionBoundaryTests(unittest.TestCase):
+	"Test the functions that decide where sessions start and end."
+	def test_continuous(self):
+		"Do we consider back-to-back observations continuous?"
+		later = MOMENT + datetime.timedelta(seconds=30)
+		self.assertTrue(accounting.is_continuous(MOMENT, later, 30))
+
+	def test_gap_server_side(self):
+		"Do we notice gaps between when we last saw a session?"
+		later = MOMENT + datetime.timedelta(hours=2)
+		self.assertFalse(accounting.is_continuous(MOMENT, later, 30))
+
+	def test_gap_client_side(self):
+		"Do we notice gaps the client tells us about?"
+		later = MOMENT + datetime.timedelta(seconds=30)
+		self.assertFalse(accounting.is_continuous(MOMENT, later, 3600))
+
+	def test_open_until(self):
+		"Do we stop counting open sessions that haven't been seen?"
+		now = MOMENT + datetime.timedelta(hours=1)
+		result = accounting.open_until(MOMENT, now, max_gap_seconds=60)
+		self.assertEqual(result, MOMENT + datetime.timedelta(seconds=60))
+
+	def test_open_until_recent(self):
+		"Do we count recently seen open sessions up to now?"
+		now = MOMENT + datetime.timedelta(seconds=10)
+		self.assertEqual(accounting.open_until(MOMENT, now), now)
+
+	def test_session_end_continuous(self):
+		"Do we split the difference when a program exits?"
+		later = MOMENT + datetime.timedelta(seconds=30)
+		result = accounting.session_end(MOMENT, later, 30)
+		self.assertEqual(result, MOMENT + datetime.timedelta(seconds=15))
+
+	def test_session_end_gap(self):
+		"Do we end at the last sighting after a gap?"
+		later = MOMENT + datetime.timedelta(hours=8)
+		self.assertEqual(accounting.session_end(MOMENT, later, 30), MOMENT)
+
+	def test_session_start(self):
+		"Do we start sessions between reports?"
+		result = accounting.session_start(MOMENT, 30)
+		self.assertEqual(result, MOMENT - datetime.timedelta(seconds=15))
+
+	def test_session_start_after_gap(self):
+		"Do we start sessions at the observation after a gap?"
+		self.assertEqual(accounting.session_start(MOMENT, 3600), MOMENT)
@@ -0,0 +1,215 @@
+import http.server
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import unittest
+
+from parentopticon import client, procfs
+
+# A game that dies of SIGINT, unlike a background job of a shell, and
+# prints the pid of the child it waits on, which dies of it too.
+GAME = [sys.executable, "-c", "\n".join((
+	"import signal, subprocess, sys",
+	"signal.signal(signal.SIGINT, signal.SIG_DFL)",
+	"child = subprocess.Popen(['sleep', '60'])",
+	"print(child.pid, flush=True)",
+	"child.wait()",
+)), "parentopticon-test-game"]
+
+class _Upstream(http.server.ThreadingHTTPServer):
+	"""A server that answers like an older real one and remembers the visits.
+
+	It answers /website, /snapshot, /program-by-process and /action, which
+	answers with whatever actions it is given, but has no /status.
+	"""
+	def __init__(self) -> None:
+		super().__init__(("127.0.0.1", 0), _UpstreamHandler)
+		self.actions = []
+		self.processes = {}
+		self.visits = []
+		self.visited = threading.Event()
+
+class _UpstreamHandler(http.server.BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+
+	def do_GET(self):
+		path = self.path.split("?", 1)[0]
+		if path == "/action":
+			self._send(200, json.dumps(self.server.actions).encode("utf-8"))
+		elif path == "/program-by-process":
+			self._send(200, json.dumps(self.server.processes).encode("utf-8"))
+		else:
+			self._send(404, b"Not found")
+
+	def do_POST(self):
+		body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+		if self.path.startswith("/website"):
+			self.server.visits.append(body)
+			self.server.visited.set()
+			self._send(499 if "github" in body["url"] else 204)
+		else:
+			self._send(204)
+
+	def _send(self, status, data=b""):
+		self.send_response(status)
+		self.send_header("Content-Length", str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def log_message(self, format, *args):
+		pass
+
+class LaunchVerdictTests(unittest.TestCase):
+	"Test client.Client.launch_verdict"
+	def setUp(self):
+		self.client = client.Client("http://localhost")
+
+	def _status(self, minutes_remaining=None, minutes_until_lock=None, age_seconds=0):
+		self.client.status = {
+			"groups": {"games": {
+				"minutes_remaining": minutes_remaining,
+				"minutes_remaining_today": minutes_remaining,
+				"minutes_until_lock": minutes_until_lock,
+			}},
+			"programs": {"Minecraft": "games"},
+		}
+		self.client.status_at = time.monotonic() - age_seconds
+
+	def test_unknown(self):
+		"Do we allow programs when we know nothing yet, or about them?"
+		self.assertIsNone(self.client.launch_verdict("Minecraft"))
+		self._status(minutes_remaining=0)
+		self.assertIsNone(self.client.launch_verdict("Calculator"))
+
+	def test_allowed(self):
+		"Do we allow programs with time left and no lock?"
+		self._status(minutes_remaining=10, minutes_until_lock=30)
+		self.assertIsNone(self.client.launch_verdict("Minecraft"))
+
+	def test_no_time(self):
+		"Do we refuse programs with no time left?"
+		self._status(minutes_remaining=0)
+		self.assertEqual(self.client.launch_verdict("Minecraft"), "There's no time left for games.")
+
+	def test_locked(self):
+		"Do we refuse programs whose group is locked, counting the age of the status?"
+		self._status(minutes_remaining=10, minutes_until_lock=0.25, age_seconds=20)
+		self.assertEqual(self.client.launch_verdict("Minecraft"), "games is locked right now.")
+
+class WebsiteVerdictTests(unittest.TestCase):
+	"Test client.Client.website_verdict"
+	def setUp(self):
+		self.upstream = _Upstream()
+		thread = threading.Thread(target=self.upstream.serve_forever, args=(0.01,))
+		thread.start()
+		self.addCleanup(thread.join)
+		self.addCleanup(self.upstream.server_close)
+		self.addCleanup(self.upstream.shutdown)
+		self.client = client.Client("http://127.0.0.1:{}".format(self.upstream.server_address[1]))
+
+	def test_asks(self):
+		"Do we ask the server about a site we know nothing about, filling in who we are?"
+		self.assertTrue(self.client.website_verdict({"url": "https://example.com/a"}))
+		self.assertFalse(self.client.website_verdict({"url": "https://github.com/a"}))
+		self.assertEqual(len(self.upstream.visits), 2)
+		self.assertEqual(self.upstream.visits[0]["hostname"], self.client.hostname)
+		self.assertEqual(self.upstream.visits[0]["username"], self.client.username)
+
+	def test_cached(self):
+		"Do we answer for a site we asked about, sending the visit in the background?"
+		self.client.website_verdict({"url": "https://github.com/a"})
+		self.upstream.visited.clear()
+		self.assertFalse(self.client.website_verdict({"url": "https://GitHub.com/b"}))
+		self.assertTrue(self.upstream.visited.wait(1))
+		self.assertEqual([visit["url"] for visit in self.upstream.visits], [
+			"https://github.com/a", "https://GitHub.com/b"])
+
+	def test_expired(self):
+		"Do we ask again once a verdict is old?"
+		self.client.website_verdicts["github.com"] = (True, time.monotonic() - client.WEBSITE_VERDICT_SECONDS)
+		self.assertFalse(self.client.website_verdict({"url": "https://github.com/a"}))
+		self.assertEqual(self.client.website_verdicts["github.com"][0], False)
+
+	def test_identity(self):
+		"Do we send visits as ours, whoever they claim to be from?"
+		self.client.website_verdict({"url": "https://example.com/a", "hostname": "other", "username": "root"})
+		self.assertEqual(self.upstream.visits[0]["hostname"], self.client.hostname)
+		self.assertEqual(self.upstream.visits[0]["username"], self.client.username)
+
+	def test_capped(self):
+		"Do we forget the least recently used sites once we know too many?"
+		now = time.monotonic()
+		for i in range(client.WEBSITE_VERDICTS_SIZE):
+			self.client.website_verdicts["site{}.com".format(i)] = (True, now)
+		self.assertTrue(self.client.website_verdict({"url": "https://site0.com/"}))
+		self.assertTrue(self.client.website_verdict({"url": "https://example.com/"}))
+		self.assertEqual(len(self.client.website_verdicts), client.WEBSITE_VERDICTS_SIZE)
+		self.assertIn("site0.com", self.client.website_verdicts)
+		self.assertNotIn("site1.com", self.client.website_verdicts)
+
+	def test_unreachable(self):
+		"Do we refuse sites we can't ask about?"
+		self.client.host = "http://127.0.0.1:1"
+		self.assertFalse(self.client.website_verdict({"url": "https://example.com/"}))
+		self.assertEqual(self.client.website_verdicts, {})
+
+class SnapAndEnforceTests(unittest.TestCase):
+	"Test client.Client.snap_and_enforce"
+	def setUp(self):
+		self.upstream = _Upstream()
+		thread = threading.Thread(target=self.upstream.serve_forever, args=(0.01,))
+		thread.start()
+		self.addCleanup(thread.join)
+		self.addCleanup(self.upstream.server_close)
+		self.addCleanup(self.upstream.shutdown)
+		self.client = client.Client("http://127.0.0.1:{}".format(self.upstream.server_address[1]))
+
+	def test_no_status(self):
+		"Do we still kill when the server has no status to give?"
+		process = subprocess.Popen(GAME, stdout=subprocess.PIPE, start_new_session=True)
+		self.addCleanup(process.wait)
+		self.addCleanup(process.stdout.close)
+		self.addCleanup(_kill_quietly, process.pid)
+		process.stdout.readline()
+		self.client.status = {"groups": {}, "programs": {}}
+		self.upstream.processes = {"parentopticon-test-game": "Game"}
+		self.upstream.actions = [{"type": "kill", "content": process.pid}]
+		self.client.snap_and_enforce(30)
+		self.assertEqual(process.wait(5), -signal.SIGINT)
+		self.assertEqual(self.client.status, {"groups": {}, "programs": {}})
+
+class DoTests(unittest.TestCase):
+	"Test client.do"
+	@unittest.skipUnless(procfs.available(), "Needs a procfs")
+	def test_kill_children(self):
+		"Does a kill without a snapshotter get the children too?"
+		process = subprocess.Popen(GAME, stdout=subprocess.PIPE, start_new_session=True)
+		self.addCleanup(process.wait)
+		self.addCleanup(process.stdout.close)
+		self.addCleanup(_kill_quietly, process.pid)
+		child = int(process.stdout.readline())
+		client.do(client.Action(client.ActionType.kill, process.pid), process_to_program={"parentopticon-test-game": "Game"})
+		self.assertEqual(process.wait(5), -signal.SIGINT)
+		deadline = time.time() + 5
+		while os.path.exists("/proc/{}".format(child)) and time.time() < deadline:
+			time.sleep(0.01)
+		self.assertFalse(os.path.exists("/proc/{}".format(child)))
+
+	def test_not_program(self):
+		"Is a pid that isn't a program left alone?"
+		process = subprocess.Popen(["sleep", "60"])
+		self.addCleanup(process.wait)
+		self.addCleanup(process.kill)
+		client.do(client.Action(client.ActionType.kill, process.pid), process_to_program={"parentopticon-test-game": "Game"})
+		with self.assertRaises(subprocess.TimeoutExpired):
+			process.wait(0.2)
+
+def _kill_quietly(pid: int) -> None:
+	try:
+		os.killpg(pid, signal.SIGKILL)
+	except (PermissionError, ProcessLookupError):
+		pass
@@ -58,7 +58,6 @@ class GetProgramSessionsCurrentTests(test_utilities.DBTestCase):
 			self.db,
 			end = datetime.datetime(2020, 2, 1, 10, 0, 0),
 			hostname = "testhost",
-			pids = "",
 			program = self.programs[0],
 			start = datetime.datetime(2020, 2, 1, 9, 10, 0),
 			username = "testuser",
@@ -68,7 +67,6 @@ class GetProgramSessionsCurrentTests(test_utilities.DBTestCase):
 			self.db,
 			end = datetime.datetime(2020, 1, 25, 10, 0, 0),
 			hostname = "testhost",
-			pids = "",
 			program = self.programs[1],
 			start = datetime.datetime(2020, 1, 25, 9, 0, 0),
 			username = "testuser",
@@ -78,7 +76,6 @@ class GetProgramSessionsCurrentTests(test_utilities.DBTestCase):
 			self.db,
 			end = datetime.datetime(2020, 2, 2, 10, 0, 0),
 			hostname = "testhost",
-			pids = "",
 			program = self.programs[1],
 			start = datetime.datetime(2020, 2, 2, 9, 0, 0),
 			username = "testuser",
@@ -0,0 +1,164 @@
+import http.client
+import json
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+from parentopticon import ipc
+
+EXTENSION_ORIGIN = "moz-extension://6f1b2c3d"
+
+class ServerTests(unittest.TestCase):
+	"Test ipc.Server and ipc.request"
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.addCleanup(self.directory.cleanup)
+		self.path = os.path.join(self.directory.name, "daemon.sock")
+		self.server = ipc.Server({
+			"echo": lambda message: {"echoed": message},
+			"fail": lambda message: 1 / 0,
+		}, self.path, poll_interval=0.01)
+		self.assertTrue(self.server.start())
+		self.addCleanup(self.server.stop)
+
+	def test_request(self):
+		"Does a method get the rest of the request and answer it?"
+		self.assertEqual(ipc.request("echo", self.path, program="Minecraft"), {"echoed": {"program": "Minecraft"}})
+
+	def test_many_requests(self):
+		"Can one connection carry several requests?"
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+			connection.connect(self.path)
+			connection.sendall(b'{"method": "echo", "n": 1}\n{"method": "ping"}\n')
+			with connection.makefile("rb") as stream:
+				self.assertEqual(stream.readline(), b'{"echoed": {"n": 1}}\n')
+				self.assertEqual(stream.readline(), b'{}\n')
+
+	def test_errors(self):
+		"Are unknown methods, failures and garbage answered with errors?"
+		with self.assertRaisesRegex(ipc.Error, "No method 'missing'"):
+			ipc.request("missing", self.path)
+		with self.assertRaisesRegex(ipc.Error, "division by zero"):
+			ipc.request("fail", self.path)
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+			connection.connect(self.path)
+			connection.sendall(b"nonsense\n")
+			with connection.makefile("rb") as stream:
+				self.assertIn(b"Not a request", stream.readline())
+
+	def test_permissions(self):
+		"Can only our user use the socket?"
+		self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+	def test_no_daemon(self):
+		"Do we get an error when no daemon is answering?"
+		self.server.stop()
+		self.assertFalse(os.path.exists(self.path))
+		with self.assertRaises(ipc.Error):
+			ipc.request("ping", self.path)
+
+	def test_garbage(self):
+		"Do we get an error when the daemon answers with something that isn't a response?"
+		self.server.stop()
+		for answer in (b'{"allow\n', b"[1]\n"):
+			with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+				listener.bind(self.path)
+				listener.listen(1)
+				thread = threading.Thread(target=_answer_once, args=(listener, answer))
+				thread.start()
+				with self.assertRaisesRegex(ipc.Error, "garbage"):
+					ipc.request("launch", self.path, program="Minecraft")
+				thread.join()
+			os.unlink(self.path)
+
+	def test_second_server(self):
+		"Does a second daemon leave the first one's socket alone?"
+		second = ipc.Server({}, self.path, poll_interval=0.01)
+		self.assertFalse(second.start())
+		self.assertEqual(ipc.request("ping", self.path), {})
+
+	def test_stale_socket(self):
+		"Do we replace a socket nothing answers on?"
+		self.server.stop()
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+			stale.bind(self.path)
+		server = ipc.Server({}, self.path, poll_interval=0.01)
+		self.assertTrue(server.start())
+		self.addCleanup(server.stop)
+		self.assertEqual(ipc.request("ping", self.path), {})
+
+class HTTPServerTests(unittest.TestCase):
+	"Test ipc.HTTPServer"
+	def setUp(self):
+		self.server = ipc.HTTPServer({
+			"echo": lambda message: {"echoed": message},
+			"fail": lambda message: 1 / 0,
+			"website": lambda message: {"allowed": "github" not in message["url"]},
+		}, 0, poll_interval=0.01)
+		self.assertTrue(self.server.start())
+		self.addCleanup(self.server.stop)
+		self.connection = http.client.HTTPConnection("127.0.0.1", self.server.port)
+		self.addCleanup(self.connection.close)
+
+	def _post(self, path, body, origin=EXTENSION_ORIGIN, content_type="application/json"):
+		headers = {"Content-Type": content_type}
+		if origin is not None:
+			headers["Origin"] = origin
+		self.connection.request("POST", path, body=body, headers=headers)
+		response = self.connection.getresponse()
+		return response.status, response.read()
+
+	def test_method(self):
+		"Does a method get the body and answer with JSON?"
+		status, body = self._post("/echo", json.dumps({"program": "Minecraft"}))
+		self.assertEqual(status, 200)
+		self.assertEqual(json.loads(body), {"echoed": {"program": "Minecraft"}})
+
+	def test_website(self):
+		"Is /website answered like the server answers it, on one connection?"
+		self.assertEqual(self._post("/website", json.dumps({"url": "https://example.com/"})), (204, b""))
+		self.assertEqual(self._post("/website", json.dumps({"url": "https://github.com/"})), (499, b""))
+
+	def test_errors(self):
+		"Are unknown methods, failures and garbage answered with errors?"
+		self.assertEqual(self._post("/missing", "{}")[0], 404)
+		self.assertEqual(self._post("/fail", "{}")[0], 500)
+		self.assertEqual(self._post("/echo", "nonsense")[0], 400)
+
+	def test_port_taken(self):
+		"Do we say so when the port is taken?"
+		second = ipc.HTTPServer({}, self.server.port, poll_interval=0.01)
+		self.assertFalse(second.start())
+
+	def test_not_extension(self):
+		"Are requests from web pages, or with no origin, refused, keeping the connection usable?"
+		body = json.dumps({"url": "https://example.com/"})
+		self.assertEqual(self._post("/website", body, origin=None)[0], 403)
+		self.assertEqual(self._post("/website", body, origin="https://example.com")[0], 403)
+		self.assertEqual(self._post("/website", body, origin="moz-extension://")[0], 403)
+		self.assertEqual(self._post("/website", body, origin="chrome-extension://abc")[0], 204)
+		self.assertEqual(self._post("/website", body)[0], 204)
+
+	def test_not_json(self):
+		"Are bodies web pages can send without asking first refused?"
+		body = json.dumps({"url": "https://example.com/"})
+		self.assertEqual(self._post("/website", body, content_type="text/plain")[0], 415)
+		self.assertEqual(self._post("/website", body, content_type="application/json; charset=utf-8")[0], 204)
+
+	def test_origins(self):
+		"Are only the configured origins answered when there are some?"
+		server = ipc.HTTPServer({"echo": lambda message: message}, 0, [EXTENSION_ORIGIN + "/"], poll_interval=0.01)
+		self.assertTrue(server.start())
+		self.addCleanup(server.stop)
+		self.connection = http.client.HTTPConnection("127.0.0.1", server.port)
+		self.addCleanup(self.connection.close)
+		self.assertEqual(self._post("/echo", "{}")[0], 200)
+		self.assertEqual(self._post("/echo", "{}", origin="moz-extension://other")[0], 403)
+
+def _answer_once(listener: socket.socket, answer: bytes) -> None:
+	connection, _ = listener.accept()
+	with connection:
+		connection.recv(4096)
+		connection.sendall(answer)
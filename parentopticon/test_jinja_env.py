@@ -0,0 +1,23 @@
+import os
+import tempfile
+import unittest
+
+from parentopticon import jinja_env
+
+class JinjaEnvTests(unittest.TestCase):
+	"Test creating and loading the template environment."
+	def test_precompiled(self):
+		"Do templates load from a precompiled directory?"
+		with tempfile.TemporaryDirectory() as precompiled, tempfile.TemporaryDirectory() as bytecode:
+			count = jinja_env.precompile(precompiled)
+			env = jinja_env.create(bytecode_cache=bytecode, precompiled=precompiled)
+			self.assertEqual(jinja_env.preload(env), count)
+			self.assertTrue(env.get_template("limit.html").filename.startswith(precompiled))
+			self.assertEqual(os.listdir(bytecode), [])
+
+	def test_bytecode_cache(self):
+		"Do we write compiled templates to the bytecode cache?"
+		with tempfile.TemporaryDirectory() as bytecode:
+			env = jinja_env.create(bytecode_cache=bytecode)
+			env.get_template("limit.html")
+			self.assertEqual(len(os.listdir(bytecode)), 1)
@@ -0,0 +1,55 @@
+import json
+import logging
+import sys
+import unittest
+from unittest import mock
+
+from parentopticon import log
+
+def make_record(name: str = "parentopticon.test", level: int = logging.INFO, msg: str = "hello %s", args=("there",)):
+	return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+class JSONFormatterTests(unittest.TestCase):
+	"Test log.JSONFormatter"
+	def test_format(self):
+		"Do we write one JSON object with the message?"
+		data = json.loads(log.JSONFormatter().format(make_record()))
+		self.assertEqual(data["message"], "hello there")
+		self.assertEqual(data["logger"], "parentopticon.test")
+		self.assertEqual(data["level"], "INFO")
+
+	def test_exception(self):
+		"Do queued exceptions keep their traceback apart from the message?"
+		try:
+			raise ValueError("bad")
+		except ValueError:
+			record = make_record(level=logging.ERROR)
+			record.exc_info = sys.exc_info()
+		prepared = log.QueueHandler(None).prepare(record)
+		data = json.loads(log.JSONFormatter().format(prepared))
+		self.assertEqual(data["message"], "hello there")
+		self.assertIn("ValueError: bad", data["exception"])
+
+class RateLimitFilterTests(unittest.TestCase):
+	"Test log.RateLimitFilter"
+	def test_limit(self):
+		"Do we drop records past the limit and count them?"
+		limit = log.RateLimitFilter(per_second=1, burst=2)
+		with mock.patch("time.monotonic", return_value=100):
+			kept = [limit.filter(make_record()) for _ in range(5)]
+			self.assertTrue(limit.filter(make_record(level=logging.WARNING)))
+			self.assertTrue(limit.filter(make_record(name="parentopticon.other")))
+		self.assertEqual(kept, [True, True, False, False, False])
+		with mock.patch("time.monotonic", return_value=101):
+			record = make_record()
+			self.assertTrue(limit.filter(record))
+		self.assertEqual(record.getMessage(), "hello there [3 earlier messages dropped]")
+
+class SampleFilterTests(unittest.TestCase):
+	"Test log.SampleFilter"
+	def test_sample(self):
+		"Do we sample debug records from the modules we are told to?"
+		sample = log.SampleFilter({"parentopticon.db": 0})
+		self.assertFalse(sample.filter(make_record(name="parentopticon.db.queries", level=logging.DEBUG)))
+		self.assertTrue(sample.filter(make_record(name="parentopticon.db.queries", level=logging.INFO)))
+		self.assertTrue(sample.filter(make_record(name="parentopticon.webserver", level=logging.DEBUG)))
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+from parentopticon import metrics
+
+class RegistryTests(unittest.TestCase):
+	"Test metrics.Registry"
+	def setUp(self):
+		self.registry = metrics.Registry()
+
+	def test_counter(self):
+		"Do counters render a sample for each set of labels?"
+		counter = self.registry.counter("requests_total", "Requests.", labels=("route",))
+		counter.inc(route="/a")
+		counter.inc(2, route="/b")
+		counter.inc(route="/a")
+		self.assertEqual(self.registry.render(), "\n".join((
+			"# HELP requests_total Requests.",
+			"# TYPE requests_total counter",
+			'requests_total{route="/a"} 2',
+			'requests_total{route="/b"} 2',
+		)) + "\n")
+
+	def test_histogram(self):
+		"Do histograms render cumulative buckets, the sum and the count?"
+		histogram = self.registry.histogram("size", "Sizes.", buckets=(1, 10))
+		for value in (0.5, 5, 50):
+			histogram.observe(value)
+		lines = self.registry.render().splitlines()[2:]
+		self.assertEqual(lines, [
+			'size_bucket{le="1"} 1',
+			'size_bucket{le="10"} 2',
+			'size_bucket{le="+Inf"} 3',
+			"size_sum 55.5",
+			"size_count 3",
+		])
+
+	def test_labels(self):
+		"Do we refuse the wrong labels and escape label values?"
+		counter = self.registry.counter("things_total", "Things.", labels=("name",))
+		with self.assertRaises(ValueError):
+			counter.inc(other="x")
+		counter.inc(name='say "hi"')
+		self.assertIn('things_total{name="say \\"hi\\""} 1', self.registry.render())
+
+	def test_collector(self):
+		"Do collectors read their values when rendered?"
+		values = {("status", "hit"): 1}
+		self.registry.collector("lookups_total", "Lookups.", lambda: values,
+			labels=("cache", "result"), type_="counter")
+		values[("status", "hit")] = 3
+		self.assertIn('lookups_total{cache="status",result="hit"} 3', self.registry.render())
+
+	def test_write(self):
+		"Can we write the metrics to a stats file?"
+		self.registry.counter("loops_total", "Loops.").inc()
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, "daemon.prom")
+			self.registry.write(path)
+			with open(path) as source:
+				self.assertEqual(source.read(), self.registry.render())
+			self.assertEqual(os.listdir(directory), ["daemon.prom"])
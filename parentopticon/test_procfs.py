@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from parentopticon import procfs
+
+def _stat(pid: int, comm: str, start_time: int, ppid: int = 1) -> str:
+	"Make the text of /proc/<pid>/stat, the process leads its own group."
+	return "{} ({}) S {} {} {} 0 -1 4194304 100 0 0 0 1 2 0 0 20 0 1 0 {} 1000 50\n".format(
+		pid, comm, ppid, pid, pid, start_time)
+
+class ScannerTests(unittest.TestCase):
+	"Test procfs.Scanner"
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.addCleanup(self.directory.cleanup)
+		self.root = self.directory.name
+		os.mkdir(os.path.join(self.root, "self"))
+		self.scanner = procfs.Scanner(root=self.root)
+
+	def _process(self, pid: int, cmdline: bytes, start_time: int = 100, comm: str = "comm", name: str = None,
+		ppid: int = 1) -> None:
+		path = os.path.join(self.root, name or str(pid))
+		os.makedirs(path, exist_ok=True)
+		with open(os.path.join(path, "cmdline"), "wb") as output:
+			output.write(cmdline)
+		with open(os.path.join(path, "comm"), "w") as output:
+			output.write(comm + "\n")
+		with open(os.path.join(path, "stat"), "w") as output:
+			output.write(_stat(pid, comm, start_time, ppid))
+
+	def test_scan(self):
+		"Do we get the command line, parent, group and start time of each process?"
+		self._process(10, b"/usr/bin/python3\0-m\0http.server\0", start_time=123)
+		self._process(11, b"minecraft\0", start_time=456, comm="a) b (c", ppid=10)
+		processes = sorted(self.scanner.scan(), key=lambda process: process.pid)
+		self.assertEqual(processes, [
+			procfs.Process(cmdline=("/usr/bin/python3", "-m", "http.server"), pgid=10, pid=10, ppid=1, start_time=123),
+			procfs.Process(cmdline=("minecraft",), pgid=11, pid=11, ppid=10, start_time=456),
+		])
+
+	def test_comm_fallback(self):
+		"Do processes without a command line get their comm instead?"
+		self._process(10, b"", comm="zombie")
+		self.assertEqual(self.scanner.scan()[0].cmdline, ("zombie",))
+
+	def test_other_users(self):
+		"Are processes of other users skipped?"
+		self._process(10, b"steam\0")
+		self.scanner.uid += 1
+		self.assertEqual(self.scanner.scan(), [])
+
+	def test_long_cmdline(self):
+		"Are command lines longer than the buffer read whole?"
+		arguments = [b"x" * 1000] * 10
+		self._process(10, b"\0".join(arguments) + b"\0")
+		self.assertEqual(self.scanner.scan()[0].cmdline, tuple(a.decode() for a in arguments))
+
+	def test_cached(self):
+		"Is the command line of a process only read once?"
+		self._process(10, b"steam\0")
+		self.scanner.scan()
+		self._process(10, b"changed\0")
+		self.assertEqual(self.scanner.scan()[0].cmdline, ("steam",))
+
+	def test_exec(self):
+		"Is the command line read again when the process execs another program?"
+		self._process(10, b"bash\0", comm="bash")
+		self.scanner.scan()
+		self._process(10, b"minecraft\0", comm="sleep")
+		self.assertEqual(self.scanner.scan()[0].cmdline, ("minecraft",))
+
+	def test_refresh(self):
+		"Is the command line read again after a while when the comm didn't change?"
+		self._process(10, b"steam\0")
+		self.scanner.scan()
+		self._process(10, b"minecraft\0")
+		scans = [self.scanner.scan()[0].cmdline for _ in range(procfs.CMDLINE_REFRESH_SCANS)]
+		self.assertEqual(scans[-1], ("minecraft",))
+
+	def _replace(self, pid: int, cmdline: bytes, start_time: int) -> None:
+		"Give /proc/<pid> a new inode, as the kernel does for a new process."
+		self._process(pid, cmdline, start_time=start_time, name="new")
+		shutil.rmtree(os.path.join(self.root, str(pid)))
+		os.rename(os.path.join(self.root, "new"), os.path.join(self.root, str(pid)))
+
+	def test_same_inode(self):
+		"Is nothing read again while /proc/<pid> is the same inode?"
+		self._process(10, b"steam\0", start_time=100)
+		self.scanner.scan()
+		with open(os.path.join(self.root, "10", "stat"), "w") as output:
+			output.write(_stat(10, "comm", 200))
+		self.assertEqual(self.scanner.scan()[0].start_time, 100)
+
+	def test_new_inode(self):
+		"Is the command line kept when only the inode changed?"
+		self._process(10, b"steam\0", start_time=100)
+		self.scanner.scan()
+		self._replace(10, b"changed\0", start_time=100)
+		self.assertEqual(self.scanner.scan()[0].cmdline, ("steam",))
+
+	def test_reparented(self):
+		"Does a process keep the parent it had when first seen?"
+		self._process(11, b"java\0", ppid=10)
+		self.scanner.scan()
+		self._replace(11, b"java\0", start_time=100)
+		self.assertEqual(self.scanner.scan()[0].ppid, 10)
+
+	def test_pid_reused(self):
+		"Is the command line read again when a pid gets a new process?"
+		self._process(10, b"steam\0", start_time=100)
+		self.scanner.scan()
+		self._replace(10, b"minecraft\0", start_time=200)
+		self.assertEqual(self.scanner.scan()[0], procfs.Process(
+			cmdline=("minecraft",), pgid=10, pid=10, ppid=1, start_time=200))
+
+	def test_exited(self):
+		"Do exited processes drop out of the results and the cache?"
+		self._process(10, b"steam\0")
+		self.scanner.scan()
+		shutil.rmtree(os.path.join(self.root, "10"))
+		self.assertEqual(self.scanner.scan(), [])
+		self.assertEqual(self.scanner._known, {})
+
+	def test_available(self):
+		"Can we tell whether there's a procfs?"
+		self.assertFalse(procfs.available(self.root))
+		self._process(10, b"steam\0")
+		with open(os.path.join(self.root, "self", "stat"), "w") as output:
+			output.write(_stat(10, "comm", 100))
+		self.assertTrue(procfs.available(self.root))
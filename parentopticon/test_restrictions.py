@@ -0,0 +1,29 @@
+import datetime
+import unittest
+
+from parentopticon import restrictions
+
+class WindowSetTests(unittest.TestCase):
+	"Test restrictions.WindowSet"
+	def setUp(self):
+		self.window_set = restrictions.WindowSet([
+			restrictions.Window(datetime.time(13), datetime.time(20)),
+			restrictions.Window(datetime.time(8), datetime.time(11)),
+			restrictions.Window(datetime.time(10), datetime.time(12)),
+		])
+
+	def test_locked(self):
+		"Are we locked between windows?"
+		self.assertTrue(self.window_set.is_locked(datetime.time(7)))
+		self.assertTrue(self.window_set.is_locked(datetime.time(12, 30)))
+		self.assertTrue(self.window_set.is_locked(datetime.time(20)))
+
+	def test_unlocked(self):
+		"Are we unlocked within overlapping windows?"
+		self.assertFalse(self.window_set.is_locked(datetime.time(8)))
+		self.assertFalse(self.window_set.is_locked(datetime.time(11, 30)))
+		self.assertFalse(self.window_set.is_locked(datetime.time(19, 59)))
+
+	def test_empty(self):
+		"Are we always locked without windows?"
+		self.assertTrue(restrictions.WindowSet([]).is_locked(datetime.time(12)))
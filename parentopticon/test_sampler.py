@@ -0,0 +1,74 @@
+import os
+import signal
+import tempfile
+import threading
+import time
+import unittest
+
+from parentopticon import sampler
+
+def _spin(stop: threading.Event) -> None:
+	while not stop.is_set():
+		pass
+
+class SamplerTests(unittest.TestCase):
+	"Test sampler.Sampler"
+	def setUp(self):
+		self.stop = threading.Event()
+		self.thread = threading.Thread(target=_spin, args=(self.stop,))
+		self.thread.start()
+		self.sampler = sampler.Sampler(thread_id=self.thread.ident, interval=0.001)
+
+	def tearDown(self):
+		self.sampler.stop()
+		self.stop.set()
+		self.thread.join()
+
+	def test_sample(self):
+		"Does a sample record the thread's stack from the root down?"
+		self.sampler.sample()
+		(stack, count), = self.sampler.samples.items()
+		self.assertEqual(count, 1)
+		self.assertTrue(stack.startswith("_bootstrap (threading.py:"))
+		self.assertIn(";_spin (test_sampler.py:10)", stack)
+
+	def test_sample_missing_thread(self):
+		"Does sampling a thread that ended record nothing?"
+		self.sampler.thread_id = -1
+		self.sampler.sample()
+		self.assertEqual(self.sampler.samples, {})
+
+	def test_start_stop(self):
+		"Does the background thread sample until it is stopped?"
+		self.sampler.start()
+		self.assertTrue(self.sampler.running)
+		time.sleep(0.05)
+		self.sampler.stop()
+		self.assertFalse(self.sampler.running)
+		count = sum(self.sampler.samples.values())
+		self.assertGreater(count, 0)
+		time.sleep(0.01)
+		self.assertEqual(sum(self.sampler.samples.values()), count)
+
+	def test_write(self):
+		"Are samples written as collapsed stacks?"
+		self.sampler.samples["a;b"] = 2
+		self.sampler.samples["a;c"] = 1
+		with tempfile.TemporaryDirectory() as directory:
+			path = sampler.write(self.sampler, directory)
+			with open(path) as source:
+				self.assertEqual(source.read(), "a;b 2\na;c 1\n")
+		self.assertEqual(self.sampler.samples, {})
+
+	def test_toggle(self):
+		"Does the signal start sampling and then write the samples?"
+		previous = signal.getsignal(signal.SIGUSR2)
+		self.addCleanup(signal.signal, signal.SIGUSR2, previous)
+		with tempfile.TemporaryDirectory() as directory:
+			sampler.install_toggle(self.sampler, directory)
+			os.kill(os.getpid(), signal.SIGUSR2)
+			self.assertTrue(self.sampler.running)
+			time.sleep(0.05)
+			os.kill(os.getpid(), signal.SIGUSR2)
+			self.assertFalse(self.sampler.running)
+			self.assertEqual(len(os.listdir(directory)), 1)
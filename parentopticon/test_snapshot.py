@@ -0,0 +1,212 @@
+import os
+import shutil
+import signal
+import subprocess
+import time
+import unittest
+
+from parentopticon import procfs, snapshot
+
+class FakeScanner:
+	"Lists whatever processes it is given."
+	def __init__(self):
+		self.processes = []
+
+	def scan(self):
+		return list(self.processes)
+
+class SnapshotterTests(unittest.TestCase):
+	"Test snapshot.Snapshotter"
+	def setUp(self):
+		self.scanner = FakeScanner()
+		self.snapshotter = snapshot.Snapshotter(self.scanner)
+		self.process_to_program = {"minecraft": "Minecraft", "steam": "Steam"}
+
+	def _running(self, *processes):
+		"Set the running processes from (pid, start time, command line, parent pid)."
+		self.scanner.processes = [procfs.Process(
+			cmdline=process[2],
+			pgid=process[0],
+			pid=process[0],
+			ppid=process[3] if len(process) > 3 else 1,
+			start_time=process[1],
+		) for process in processes]
+
+	def test_take(self):
+		"Are processes matched on any of their arguments?"
+		self._running(
+			(10, 1, ("java", "-jar", "minecraft")),
+			(11, 1, ("steam",)),
+			(12, 1, ("bash",)),
+		)
+		self.assertEqual(self.snapshotter.take(self.process_to_program), {10: "Minecraft", 11: "Steam"})
+
+	def test_cached(self):
+		"Is a process only matched the first time it is seen?"
+		self._running((10, 1, ("steam",)))
+		self.snapshotter.take(self.process_to_program)
+		node = self.snapshotter._nodes[10]
+		self.assertEqual(self.snapshotter.take(self.process_to_program), {10: "Steam"})
+		self.assertIs(self.snapshotter._nodes[10], node)
+
+	def test_exec(self):
+		"Is a process matched again when it execs another program?"
+		self._running((10, 1, ("bash", "-c", "exec minecraft")))
+		self.snapshotter.take(self.process_to_program)
+		self._running((10, 1, ("minecraft",)))
+		self.assertEqual(self.snapshotter.take(self.process_to_program), {10: "Minecraft"})
+
+	def test_pid_reused(self):
+		"Is a pid matched again when it has a new process?"
+		self._running((10, 1, ("steam",)))
+		self.snapshotter.take(self.process_to_program)
+		self._running((10, 2, ("bash",)))
+		self.assertEqual(self.snapshotter.take(self.process_to_program), {})
+
+	def test_exited(self):
+		"Are exited processes forgotten?"
+		self._running((10, 1, ("steam",)))
+		self.snapshotter.take(self.process_to_program)
+		self._running()
+		self.assertEqual(self.snapshotter.take(self.process_to_program), {})
+		self.assertEqual(self.snapshotter._nodes, {})
+
+	def test_programs_changed(self):
+		"Is everything matched again when the programs to look for change?"
+		self._running((10, 1, ("bash",)))
+		self.snapshotter.take(self.process_to_program)
+		self.assertEqual(self.snapshotter.take({"bash": "Shell"}), {10: "Shell"})
+
+	def test_children(self):
+		"Do processes that don't match belong to the program of their parent?"
+		self._running(
+			(10, 1, ("parentopticon-launch", "minecraft", "java")),
+			(11, 2, ("java", "-jar", "launcher.jar"), 10),
+			(12, 3, ("java", "-jar", "client.jar"), 11),
+			(13, 3, ("steam",), 11),
+			(14, 3, ("bash",)),
+		)
+		self.assertEqual(self.snapshotter.take(self.process_to_program), {
+			10: "Minecraft", 11: "Minecraft", 12: "Minecraft", 13: "Steam"})
+
+	def test_children_listed_first(self):
+		"Are children attributed when they are listed before their parent?"
+		self._running(
+			(5, 2, ("java",), 300),
+			(300, 1, ("minecraft",)),
+		)
+		self.assertEqual(self.snapshotter.take(self.process_to_program), {5: "Minecraft", 300: "Minecraft"})
+
+	def test_parent_reused(self):
+		"Do children ignore a parent pid that now has a newer process?"
+		self._running(
+			(10, 5, ("minecraft",)),
+			(11, 2, ("java",), 10),
+		)
+		self.assertEqual(self.snapshotter.take(self.process_to_program), {10: "Minecraft"})
+
+	def test_parent_exited(self):
+		"Do children keep their program after their parent exits?"
+		self._running(
+			(10, 1, ("minecraft",)),
+			(11, 2, ("java",), 10),
+		)
+		self.snapshotter.take(self.process_to_program)
+		self._running((11, 2, ("java",), 10))
+		self.assertEqual(self.snapshotter.take(self.process_to_program), {11: "Minecraft"})
+
+	def test_family(self):
+		"Do we get a process and everything under it?"
+		self._running(
+			(10, 1, ("minecraft",)),
+			(11, 2, ("java",), 10),
+			(12, 3, ("java",), 11),
+			(13, 3, ("bash",), 1),
+		)
+		self.snapshotter.take(self.process_to_program)
+		self.assertEqual(self.snapshotter.family(10), {10, 11, 12})
+		self.assertEqual(self.snapshotter.family(12), {12})
+
+class KillTests(unittest.TestCase):
+	"Test snapshot.Snapshotter.kill on real processes"
+	def _start(self, new_session: bool) -> subprocess.Popen:
+		# The shell and its two children are all named by the command.
+		process = subprocess.Popen(["sh", "-c", "sleep 60 & sleep 60 & wait", "parentopticon-test-game"],
+			start_new_session=new_session)
+		self.addCleanup(process.wait)
+		self.addCleanup(_kill_quietly, process.pid)
+		snapshotter = snapshot.Snapshotter(procfs.Scanner())
+		deadline = time.time() + 5
+		while time.time() < deadline:
+			pids = snapshotter.take({"parentopticon-test-game": "Game"})
+			if len(pids) == 3:
+				return process, snapshotter, set(pids)
+			time.sleep(0.01)
+		self.fail("The test processes didn't start")
+
+	def _wait_gone(self, pids):
+		deadline = time.time() + 5
+		while time.time() < deadline:
+			alive = {pid for pid in pids if _running(pid)}
+			if not alive:
+				return
+			time.sleep(0.01)
+		self.fail("Still running: {}".format(alive))
+
+	@unittest.skipUnless(procfs.available(), "Needs a procfs")
+	def test_own_group(self):
+		"Is a program in its own process group killed with its children?"
+		process, snapshotter, pids = self._start(new_session=True)
+		snapshotter.kill([process.pid], signal.SIGTERM)
+		self._wait_gone(pids)
+
+	@unittest.skipUnless(procfs.available(), "Needs a procfs")
+	def test_shared_group(self):
+		"Is each process killed on its own when it shares the daemon's group?"
+		process, snapshotter, pids = self._start(new_session=False)
+		snapshotter.kill([process.pid], signal.SIGTERM)
+		self._wait_gone(pids)
+		self.assertTrue(_running(os.getpid()))
+
+	@unittest.skipUnless(procfs.available(), "Needs a procfs")
+	def test_not_program(self):
+		"Is a pid that isn't a program left alone, with its group?"
+		process = subprocess.Popen(["sleep", "60"], start_new_session=True)
+		self.addCleanup(process.wait)
+		self.addCleanup(_kill_quietly, process.pid)
+		snapshotter = snapshot.Snapshotter(procfs.Scanner())
+		snapshotter.take({"parentopticon-test-game": "Game"})
+		snapshotter.kill([process.pid], signal.SIGTERM)
+		with self.assertRaises(subprocess.TimeoutExpired):
+			process.wait(0.2)
+
+class ExecTests(unittest.TestCase):
+	"Test snapshot.Snapshotter on a real process that execs"
+	@unittest.skipUnless(procfs.available() and shutil.which("bash"), "Needs a procfs and bash")
+	def test_exec(self):
+		"Is a wrapper that execs into a program matched under the same pid?"
+		process = subprocess.Popen(["bash", "-c", "sleep 0.2; exec -a parentopticon-test-game sleep 60"])
+		self.addCleanup(process.wait)
+		self.addCleanup(process.kill)
+		snapshotter = snapshot.Snapshotter(procfs.Scanner())
+		self.assertNotIn(process.pid, snapshotter.take({"parentopticon-test-game": "Game"}))
+		deadline = time.time() + 5
+		while time.time() < deadline:
+			if snapshotter.take({"parentopticon-test-game": "Game"}).get(process.pid) == "Game":
+				return
+			time.sleep(0.01)
+		self.fail("The exec wasn't noticed")
+
+def _kill_quietly(pid: int) -> None:
+	try:
+		os.killpg(pid, signal.SIGKILL)
+	except (PermissionError, ProcessLookupError):
+		pass
+
+def _running(pid: int) -> bool:
+	"Whether a pid is running, zombies aren't."
+	try:
+		with open("/proc/{}/stat".format(pid)) as source:
+			return source.read().rpartition(")")[2].split()[0] != "Z"
+	except FileNotFoundError:
+		return False
@@ -0,0 +1,80 @@
+import datetime
+import unittest
+
+from parentopticon import window_week
+
+# 2020-02-03 is a Monday.
+MONDAY = datetime.date(2020, 2, 3)
+
+def at(day: int, hour: int, minute: int = 0) -> datetime.datetime:
+	"Get a moment some days after MONDAY."
+	return datetime.datetime.combine(MONDAY + datetime.timedelta(days=day), datetime.time(hour, minute))
+
+class ParseSpansTests(unittest.TestCase):
+	"Test window_week.parse_spans and format_spans"
+	def test_parse(self):
+		"Can we parse several spans?"
+		result = window_week.parse_spans("0800-1130,13-2000")
+		self.assertEqual(result, [(480, 690), (780, 1200)])
+
+	def test_parse_empty(self):
+		"Do we get no spans from an empty string?"
+		self.assertEqual(window_week.parse_spans(""), [])
+
+	def test_parse_backwards(self):
+		"Do we reject spans that end before they start?"
+		with self.assertRaises(ValueError):
+			window_week.parse_spans("2000-0800")
+
+	def test_round_trip(self):
+		"Can we format spans back to what we parsed?"
+		spans = window_week.parse_spans("0800-1130,1300-2400")
+		self.assertEqual(window_week.format_spans(spans), "0800-1130,1300-2400")
+
+class ScheduleTests(unittest.TestCase):
+	"Test window_week.Schedule"
+	def setUp(self):
+		weekday = [(15 * 60, 20 * 60)]
+		weekend = [(8 * 60, 24 * 60)]
+		self.schedule = window_week.Schedule("school", {
+			0: weekday,
+			1: weekday,
+			2: weekday,
+			3: weekday,
+			4: weekday + [(20 * 60, 24 * 60)],
+			5: [(0, 24 * 60)],
+			6: weekend,
+		})
+
+	def test_locked(self):
+		"Are we locked outside of the spans?"
+		self.assertTrue(self.schedule.is_locked(at(0, 9)))
+		self.assertTrue(self.schedule.is_locked(at(0, 20)))
+		self.assertFalse(self.schedule.is_locked(at(0, 15)))
+
+	def test_minutes_until_lock(self):
+		"Can we find the minutes until the span ends?"
+		self.assertEqual(self.schedule.minutes_until_lock(at(2, 19, 30)), 30)
+		self.assertEqual(self.schedule.minutes_until_lock(at(2, 21)), 0)
+
+	def test_merged_across_days(self):
+		"Do touching spans across midnight merge?"
+		# Friday 15:00 through the end of Sunday.
+		self.assertEqual(self.schedule.minutes_until_lock(at(4, 23)), 60 + 24 * 60 + 0)
+
+	def test_across_weeks(self):
+		"Do we carry an open span into the next week?"
+		schedule = window_week.Schedule("always", {day: [(0, 24 * 60)] for day in range(7)})
+		self.assertEqual(schedule.minutes_until_lock(at(6, 23)), 60 + 7 * 24 * 60)
+
+	def test_override(self):
+		"Do overrides replace a single date's spans?"
+		schedule = window_week.Schedule("school", self.schedule.spans, {
+			MONDAY: [(9 * 60, 10 * 60)],
+			MONDAY + datetime.timedelta(days=1): [],
+		})
+		self.assertFalse(schedule.is_locked(at(0, 9)))
+		self.assertTrue(schedule.is_locked(at(0, 15)))
+		self.assertTrue(schedule.is_locked(at(1, 15)))
+		# The following week is back to normal.
+		self.assertFalse(schedule.is_locked(at(7, 15)))
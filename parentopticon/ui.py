@@ -3,3 +3,7 @@ import subprocess
 def show_alert(title: str, content: str) -> None:
 	"""Show an alert message using the desktop notifier."""
 	subprocess.call(["notify-send", title, content])
+
+def show_denied(program: str, reason: str) -> None:
+	"""Tell the user a program wasn't allowed to start."""
+	show_alert("{} can't start".format(program), reason)
@@ -1,7 +1,13 @@
 import argparse
+import asyncio
 import datetime
+import functools
 import logging
+import signal
+import threading
+import time
 import typing
+import urllib.parse
 
 import flask
 import flask_login
@@ -11,29 +17,153 @@ import toml
 from sanic import Sanic
 from sanic.response import empty, html, json, redirect, text
 
-from parentopticon import db, jinja_env, log, version
-from parentopticon.db import connection, queries, tables
+from parentopticon import accounting, db, jinja_env, log, metrics, sampler, version, window_week
+from parentopticon.db import cache, connection, migrations, profiler, queries, retention, search, shared, tables
 
 LOGGER = logging.getLogger(__name__)
+CLOCK_SKEW = accounting.ClockSkew()
 
 flask_app = flask.Flask("parentopticon")
 login_manager = flask_login.LoginManager()
 
-app = Sanic()
+app = Sanic("parentopticon")
 app.static("/static", "./static")
-app.static("/favicon.ico", "static/img/parentopticon.ico")
+app.static("/favicon.ico", "static/img/parentopticon.ico", name="favicon")
+
+# Pages rendered only from reference data, by path and reference version.
+RESPONSE_CACHE = cache.ResponseCache()
+
+REQUEST_SECONDS = metrics.REGISTRY.histogram("parentopticon_request_seconds",
+	"Time spent handling requests.", labels=("method", "route", "status"))
+SNAPSHOT_BYTES = metrics.REGISTRY.histogram("parentopticon_snapshot_bytes",
+	"Size of snapshot bodies.", buckets=(128, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536))
+SNAPSHOT_PROGRAMS = metrics.REGISTRY.histogram("parentopticon_snapshot_programs",
+	"Running programs in each snapshot.", buckets=(0, 1, 2, 5, 10, 20, 50, 100))
+metrics.REGISTRY.collector("parentopticon_response_cache_lookups_total",
+	"Lookups in the cache of pages rendered from reference data by whether they hit.",
+	lambda: {("hit",): RESPONSE_CACHE.hits, ("miss",): RESPONSE_CACHE.misses},
+	labels=("result",), type_="counter")
+
+@app.middleware("request")
+async def start_timer(request):
+	request.ctx.started = time.perf_counter()
+
+@app.middleware("request")
+async def sync_caches(request):
+	"Drop cached values other workers wrote, once for the whole request."
+	queries.sync_caches(app.ctx.db_connection)
+
+@app.middleware("response")
+async def record_timer(request, response):
+	started = getattr(request.ctx, "started", None)
+	if started is None:
+		return
+	REQUEST_SECONDS.observe(time.perf_counter() - started,
+		method=request.method,
+		# The route pattern rather than the path, so IDs don't make new series.
+		route="/" + request.route.path if request.route else "unmatched",
+		status=response.status,
+	)
+
+@app.listener("main_process_start")
+async def prepare_database(app, loop):
+	"Bring the DB up to date once, before any worker uses it."
+	db_connection = connection.Connection()
+	db_connection.connect(app.config.DATABASE)
+	db_connection.backend.share(db_connection.connection)
+	migrations.migrate(db_connection)
+
+@app.listener("before_server_start")
+async def connect_database(app, loop):
+	"Give each worker its own connection and templates."
+	app.ctx.db_connection = connection.Connection()
+	app.ctx.db_connection.connect(app.config.DATABASE)
+	profile = app.config.get("PROFILE", {})
+	if profile.get("enabled"):
+		app.ctx.db_connection.profiler = profiler.Profiler(
+			explain=profile.get("explain", False),
+			slow_seconds=profile.get("slow_ms", 100) / 1000,
+		)
+	templates = app.config.get("TEMPLATES", {})
+	app.ctx.jinja_env = jinja_env.create(
+		auto_reload=False,
+		bytecode_cache=templates.get("bytecode_cache"),
+		precompiled=templates.get("precompiled"),
+	)
+	# The templates are shared with the Flask pages, which have a login.
+	app.ctx.jinja_env.globals["current_user"] = flask_login.AnonymousUserMixin()
+	app.ctx.jinja_env.globals["get_flashed_messages"] = lambda **kwargs: []
+	LOGGER.info("Preloaded %d templates.", jinja_env.preload(app.ctx.jinja_env))
+	# Listeners run on the event loop's thread, which is the one worth sampling.
+	app.ctx.sampler = sampler.Sampler(thread_id=threading.get_ident())
+	sampling = app.config.get("SAMPLER", {})
+	sampler.install_toggle(app.ctx.sampler, sampling.get("directory", log.data_path("profiles")))
+	if sampling.get("enabled"):
+		app.ctx.sampler.start()
+
+@app.listener("after_server_stop")
+async def write_samples(app, loop):
+	"Write out the stack samples of a worker that was still sampling."
+	if app.ctx.sampler.running:
+		sampler.write(app.ctx.sampler, app.config.get("SAMPLER", {}).get("directory", log.data_path("profiles")))
+
+@app.listener("after_server_start")
+async def start_retention(app, loop):
+	"Apply the retention policy in the background."
+	policy = retention.policy_from_config(app.config.get("RETENTION"))
+	app.add_task(_retention_loop(policy))
+
+async def _retention_loop(policy: retention.Policy) -> None:
+	loop = asyncio.get_running_loop()
+	while True:
+		try:
+			# Every worker runs this loop, only one of them applies the policy each interval.
+			if shared.claim(app.ctx.db_connection, "retention", policy.interval_seconds):
+				# It can take a while on a big DB, so it runs off the event loop.
+				await loop.run_in_executor(None, _apply_retention, app.config.DATABASE, policy)
+		except Exception:
+			LOGGER.exception("Failed to apply the retention policy")
+		await asyncio.sleep(policy.interval_seconds)
+
+def _apply_retention(database: str, policy: retention.Policy) -> None:
+	"Apply the retention policy on a connection of its own, for a thread other than the event loop's."
+	db_connection = connection.Connection()
+	db_connection.connect(database)
+	try:
+		retention.apply(db_connection, policy)
+	finally:
+		db_connection.connection.close()
+
+def _max_gap_seconds() -> int:
+	"Get the longest gap between snapshots that counts as continuous usage."
+	return app.config.get("MAX_SESSION_GAP_SECONDS", accounting.MAX_GAP_SECONDS)
+
+def _cached_by_reference(handler):
+	"Serve a page from the cache until the reference data changes."
+	@functools.wraps(handler)
+	async def wrapper(request, *args, **kwargs):
+		version = queries.reference(app.ctx.db_connection).version
+		key = request.path + "?" + request.query_string
+		body = RESPONSE_CACHE.get(key, version)
+		if body is None:
+			response = await handler(request, *args, **kwargs)
+			if response.status != 200:
+				return response
+			body = response.body
+			RESPONSE_CACHE.put(key, version, body)
+		return html(body)
+	return wrapper
 
 def _render(filename: str, **kwargs):
-	template = app.jinja_env.get_template(filename)
-	content = template.render(now=datetime.datetime.now(), **kwargs)
-	return html(content)
+	template = app.ctx.jinja_env.get_template(filename)
+	return html(template.render(**kwargs))
 
 
 @app.route("/action", methods=["GET"])
 async def action_list(request):
 	hostname = request.args["hostname"][0]
 	username = request.args["username"][0]
-	actions = queries.actions_for_username(app.db_connection, hostname, username)
+	actions = queries.actions_for_username(app.ctx.db_connection, hostname, username, _max_gap_seconds())
 	return json([{
 		"content": action.content,
 		"type": action.type,
@@ -41,29 +171,55 @@ async def action_list(request):
 
 @app.route("/config", methods=["GET"])
 async def config_get(request):
-	programs = list(tables.Program.list(app.db_connection))
-	program_groups = list(tables.ProgramGroup.list(app.db_connection))
+	programs = list(tables.Program.list(app.ctx.db_connection))
+	program_groups = list(tables.ProgramGroup.list(app.ctx.db_connection))
 	program_sessions = sorted(
-		tables.ProgramSession.list(app.db_connection),
+		tables.ProgramSession.list(app.ctx.db_connection),
 		key=lambda s: s.start,
 		reverse=True,
 	)
-	website_visits = sorted(
-		tables.WebsiteVisit.list(app.db_connection),
-		key=lambda s: s.at,
-		reverse=True,
-	)
+	website_visits = queries.website_visit_list(app.ctx.db_connection)
 	return _render("config/index.html",
 		programs=programs,
 		program_groups=program_groups,
 		program_sessions=program_sessions,
+		session_pids=queries.program_session_pids_by_session(app.ctx.db_connection),
 		website_visits=website_visits,
 	)
 
+@app.route("/config/debug/queries", methods=["GET"])
+async def config_debug_queries_get(request):
+	"Show the statements that took the most time in this worker."
+	sort = request.args.get("sort", "total_seconds")
+	if sort not in profiler.SORTS:
+		sort = "total_seconds"
+	n = request.args.get("n", "50")
+	n = int(n) if n.isdigit() else 50
+	query_profiler = app.ctx.db_connection.profiler
+	return _render("config/debug-queries.html",
+		enabled=query_profiler is not None,
+		sort=sort,
+		sorts=profiler.SORTS,
+		stats=query_profiler.top(n, sort) if query_profiler else [],
+	)
+
+@app.route("/config/website/search", methods=["GET"])
+async def config_website_search_get(request):
+	text = request.args.get("q", "")
+	page = request.args.get("page", "0")
+	page = int(page) if page.isdigit() else 0
+	matches = search.search(app.ctx.db_connection, text, page=page)
+	return _render("config/website-search.html",
+		matches=matches,
+		page=page,
+		per_page=search.PER_PAGE,
+		text=text,
+	)
+
 @app.route("/config/one-time-message", methods=["GET"])
 async def config_one_time_messages_get(request):
-	usernames = queries.usernames(app.db_connection)
-	one_time_messages = tables.OneTimeMessage.list(app.db_connection)
+	usernames = queries.usernames(app.ctx.db_connection)
+	one_time_messages = tables.OneTimeMessage.list(app.ctx.db_connection)
 	return _render("config/one-time-messages.html",
 		one_time_messages = one_time_messages,
 		usernames=usernames
@@ -73,7 +229,7 @@ async def config_one_time_messages_get(request):
 async def config_one_time_message_post(request):
 	content = request.form["content"][0]
 	username = request.form["username"][0]
-	program_id = tables.OneTimeMessage.insert(app.db_connection,
+	program_id = tables.OneTimeMessage.insert(app.ctx.db_connection,
 		content = content,
 		hostname = None,
 		created = datetime.datetime.now(),
@@ -83,12 +239,13 @@ async def config_one_time_message_post(request):
 	return redirect("one-time-message")
 
 @app.route("/config/program/<program_id:int>", methods=["GET"])
+@_cached_by_reference
 async def config_program_get(request, program_id: int):
-	program = tables.Program.get(app.db_connection, program_id)
+	program = tables.Program.get(app.ctx.db_connection, program_id)
 	if not program:
 		return redirect("program")
-	program_groups = list(tables.ProgramGroup.list(app.db_connection))
-	program_processes = list(tables.ProgramProcess.list(app.db_connection, program=program_id))
+	program_groups = list(tables.ProgramGroup.list(app.ctx.db_connection))
+	program_processes = list(tables.ProgramProcess.list(app.ctx.db_connection, program=program_id))
 	return _render("config/program.html",
 		program_groups=program_groups,
 		program=program,
@@ -96,9 +253,10 @@ async def config_program_get(request, program_id: int):
 	)
 
 @app.route("/config/program", methods=["GET"])
+@_cached_by_reference
 async def config_programs_get(request):
-	programs = list(tables.Program.list(app.db_connection))
-	program_groups = list(tables.ProgramGroup.list(app.db_connection))
+	programs = list(tables.Program.list(app.ctx.db_connection))
+	program_groups = list(tables.ProgramGroup.list(app.ctx.db_connection))
 	return _render("config/programs.html",
 		programs = programs,
 		program_groups = program_groups,
@@ -108,7 +266,7 @@ async def config_programs_get(request):
 async def config_programs_post(request):
 	name = request.form["name"][0]
 	program_group = int(request.form["program_group"][0])
-	program_id = tables.Program.insert(app.db_connection,
+	program_id = tables.Program.insert(app.ctx.db_connection,
 		name = name,
 		program_group = program_group,
 	)
@@ -117,10 +275,10 @@ async def config_programs_post(request):
 
 @app.route("/config/program-group/<program_group_id:int>", methods=["GET"])
 async def config_program_group_get(request, program_group_id: int):
-	pg = tables.ProgramGroup.get(app.db_connection, program_group_id)
+	pg = tables.ProgramGroup.get(app.ctx.db_connection, program_group_id)
 	if not pg:
 		return redirect("..")
-	user_to_usage = queries.user_to_usage(app.db_connection, program_group=pg)
+	user_to_usage = queries.user_to_usage(app.ctx.db_connection, program_group=pg, max_gap_seconds=_max_gap_seconds())
 	return _render("config/program-group.html",
 		program_group=pg,
 		user_to_usage=user_to_usage,
@@ -138,13 +296,14 @@ async def config_program_group_put(request, program_group_id: int):
 		"minutes_sunday": request.form["minutes_sunday"][0],
 		"minutes_weekly": request.form["minutes_weekly"][0],
 		"minutes_monthly": request.form["minutes_monthly"][0],
+		"window_week": request.form.get("window_week") or None,
 	}
 	LOGGER.info("Updating program-group %d to %s", program_group_id, values)
-	pg = tables.ProgramGroup.get(app.db_connection, program_group_id)
+	pg = tables.ProgramGroup.get(app.ctx.db_connection, program_group_id)
 	if not pg:
 		return redirect("..")
 	tables.ProgramGroup.update(
-		app.db_connection,
+		app.ctx.db_connection,
 		program_group_id,
 		**values,
 	)
@@ -162,7 +321,8 @@ async def config_program_groups_post(request):
 	minutes_sunday = int(request.form["minutes_sunday"][0])
 	minutes_weekly = int(request.form["minutes_weekly"][0])
 	minutes_monthly = int(request.form["minutes_monthly"][0])
-	program_group_id = tables.ProgramGroup.insert(app.db_connection,
+	window_week_name = request.form.get("window_week") or None
+	program_group_id = tables.ProgramGroup.insert(app.ctx.db_connection,
 		name = name,
 		minutes_monday = minutes_monday,
 		minutes_tuesday = minutes_tuesday,
@@ -173,6 +333,7 @@ async def config_program_groups_post(request):
 		minutes_sunday = minutes_sunday,
 		minutes_weekly = minutes_weekly,
 		minutes_monthly = minutes_monthly,
+		window_week = window_week_name,
 	)
 	return redirect("program-group/{}".format(program_group_id))
 
@@ -185,7 +346,7 @@ async def config_program_groups_get(request):
 async def config_program_process_post(request):
 	name = request.form["name"][0]
 	program = int(request.form["program"][0])
-	program_process_id = tables.ProgramProcess.insert(app.db_connection,
+	program_process_id = tables.ProgramProcess.insert(app.ctx.db_connection,
 		name = name,
 		program = program,
 	)
@@ -197,19 +358,29 @@ async def denied_get(request):
 	url = request.args.get("url", "unknown")
 	return text("You've attempted to access '{}', which is denied.".format(url))
 
+@app.route("/metrics", methods=["GET"])
+async def metrics_get(request):
+	"Get the metrics of the worker that handles the request."
+	return text(metrics.REGISTRY.render(), content_type="text/plain; version=0.0.4")
+
 @app.route("/program-by-process", methods=["GET"])
-async def config_programs_get(request):
+async def program_by_process_get(request):
 	# hostname = request.args["hostname"]
 	# username = request.args["username"]
-	process_by_program = queries.list_program_by_process(app.db_connection)
-	return json(process_by_program)
+	# The version is the ETag so clients can skip unchanged downloads.
+	data = queries.reference(app.ctx.db_connection)
+	etag = '"{}"'.format(data.version)
+	if request.headers.get("If-None-Match") == etag:
+		return empty(status=304, headers={"ETag": etag})
+	return json(data.program_by_process, headers={"ETag": etag})
 
 @app.route("/program-group/<program_group_id:int>", methods=["GET"])
 async def program_group_get(request, program_group_id: int):
-	program_group = tables.ProgramGroup.get(app.db_connection, program_group_id)
+	program_group = tables.ProgramGroup.get(app.ctx.db_connection, program_group_id)
 	if not program_group:
 		redirect("../..")
-	user_to_usage = queries.user_to_usage(app.db_connection, program_group=program_group)
+	user_to_usage = queries.user_to_usage(app.ctx.db_connection, program_group=program_group,
+		max_gap_seconds=_max_gap_seconds())
 	return _render("program-group.html",
 		program_group=program_group,
 		user_to_usage=user_to_usage,
@@ -217,7 +388,7 @@ async def program_group_get(request, program_group_id: int):
 
 @app.route("/")
 async def root(request):
-	user_to_status = queries.user_to_status(app.db_connection)
+	user_to_status = queries.user_to_status(app.ctx.db_connection, _max_gap_seconds())
 	return _render("index.html",
 		user_to_status=user_to_status,
 	)
@@ -226,20 +397,46 @@ async def root(request):
 @app.route("/snapshot", methods=["POST"])
 async def snapshot_post(request):
 	"Handle a client POSTing its currently running programs"
-	LOGGER.info("got a snapshot POST: %s", request.json)
+	LOGGER.debug("got a snapshot POST: %s", request.json)
+	received = datetime.datetime.now()
 	elapsed_seconds = request.json.get("elapsed_seconds", 0)
 	hostname = request.json["hostname"]
 	username = request.json["username"]
 	pid_to_program = request.json["programs"]
-	queries.snapshot_store(app.db_connection, hostname, username, elapsed_seconds, pid_to_program)
+	SNAPSHOT_BYTES.observe(len(request.body))
+	SNAPSHOT_PROGRAMS.observe(len(pid_to_program))
+	moment = CLOCK_SKEW.correct(hostname, request.json.get("observed"), received)
+	queries.snapshot_store(app.ctx.db_connection, hostname, username, elapsed_seconds, pid_to_program,
+		moment=moment,
+		max_gap_seconds=_max_gap_seconds(),
+	)
 	return empty()
 
+@app.route("/status", methods=["GET"])
+async def status_get(request):
+	"Get a user's status in each program group and the group of each program, for the daemon to answer from."
+	username = request.args["username"][0]
+	data = queries.reference(app.ctx.db_connection)
+	statuses = queries.status_for_username(app.ctx.db_connection, username, _max_gap_seconds())
+	group_names = {program_group.id: program_group.name for program_group in data.program_groups}
+	return json({
+		"groups": {name: {
+			"minutes_remaining": status.minutes_remaining,
+			"minutes_remaining_today": status.minutes_remaining_today,
+			"minutes_until_lock": status.minutes_until_lock,
+		} for name, status in statuses.items()},
+		"programs": {
+			program.name: group_names[program.program_group]
+			for program in data.programs if program.program_group in group_names
+		},
+	})
+
 @app.route("/user/<username>", methods=["GET"])
 async def user(request, username: str):
-	programs = list(tables.Program.list(app.db_connection))
+	programs = list(tables.Program.list(app.ctx.db_connection))
 	program_id_to_name = {program.id: program.name for program in programs}
 	sessions = queries.program_session_list_since(
-		connection=app.db_connection,
+		connection=app.ctx.db_connection,
 		moment=queries.today_start(),
 		programs=None,
 		username=username,
@@ -258,45 +455,55 @@ async def user(request, username: str):
 
 @app.route("/website", methods=["POST"])
 async def website_post(request):
-	"Handle a client POSTing a website it visits"
-	tables.WebsiteVisit.insert(
-		app.db_connection,
+	"""Handle a client POSTing a website it visits.
+
+	The verdict is for the whole site, daemons keep it for a while and
+	answer other visits to the site themselves.
+	"""
+	queries.website_visit_store(
+		app.ctx.db_connection,
 		at=datetime.datetime.now(),
 		hostname=request.json["hostname"],
 		incognito=request.json["incognito"],
 		url=request.json["url"],
 		username=request.json["username"],
 	)
-	if "github" in request.json["url"]:
+	if "github" in (urllib.parse.urlsplit(request.json["url"]).hostname or ""):
 		return text("Parentopticon says no", status=499)
 	return empty()
 
 @app.route("/window", methods=["POST"])
 async def window_post(request):
 	name = request.form["name"][0]
-	monday = request.form["monday"][0]
-	tuesday = request.form["tuesday"][0]
-	wednesday = request.form["wednesday"][0]
-	thursday = request.form["thursday"][0]
-	friday = request.form["friday"][0]
-	saturday = request.form["saturday"][0]
-	sunday = request.form["sunday"][0]
-	window_id = app.db_connection.window_week_create(
+	days = {}
+	try:
+		for index, day in enumerate(("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")):
+			days[index] = window_week.parse_spans(request.form.get(day, ""))
+	except ValueError as ex:
+		return text("Bad window for {}: {}".format(day, ex), status=400)
+	queries.window_week_create(app.ctx.db_connection, name, days)
+	return redirect("window/{}".format(name))
+
+@app.route("/window/<name>", methods=["GET"])
+async def window_get(request, name: str):
+	window = queries.window_week_get(app.ctx.db_connection, name)
+	return _render("window.html", window=window)
+
+@app.route("/window/<name>/override", methods=["POST"])
+async def window_override_post(request, name: str):
+	try:
+		effective = datetime.datetime.strptime(request.form["effective"][0], "%Y-%m-%d").date()
+		spans = window_week.parse_spans(request.form.get("spans", ""))
+	except ValueError as ex:
+		return text("Bad override: {}".format(ex), status=400)
+	queries.window_week_override_create(app.ctx.db_connection,
 		name = name,
+		effective = effective,
+		spans = spans,
+		creator = request.form.get("creator", "parent"),
+		message = request.form.get("message", ""),
 	)
-	for index, day in enumerate(("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")):
-		content = request.form[day][0]
-		for part in content.split(","):
-			start_str, _, end_str = part.partition("-")
-			start = int(start_str)
-			end = int(end_str)
-			app.db_connection.window_week_day_span_create(index, end, start, window_id)
-	return redirect("window/{}".format(window_id))
-
-@app.route("/window/<window_id:int>", methods=["GET"])
-async def window_get(request, window_id: int):
-	window = app.db_connection.window_week_get(window_id)
-	return _render("window.html", window=window)
+	return redirect("../{}".format(name))
 
 @flask_app.route("/")
 def root():
@@ -358,7 +565,14 @@ def run() -> None:
 
 	log.setup(level=logging.DEBUG if args.verbose else logging.INFO)
 	configuration = toml.load(args.config)
+	app.config.MAX_SESSION_GAP_SECONDS = configuration.get(
+		"max_session_gap_seconds", accounting.MAX_GAP_SECONDS)
+	app.config.RETENTION = configuration.get("retention", {})
 	connection.create(configuration["db"])
+	db_connection = connection.Connection()
+	# A SQLite path, or a postgresql:// URI to share one server between many machines.
+	db_connection.connect(configuration.get("database", connection.DEFAULT_PATH))
+	migrations.migrate(db_connection)
 	try:
 		LOGGER.info("Webserver starting.")
 		login_manager.init_app(flask_app)
@@ -367,3 +581,39 @@ def run() -> None:
 	except KeyboardInterrupt:
 		LOGGER.info("shutting down due to SIGINT")
 
+
+def serve() -> None:
+	"Serve the Sanic app from a number of worker processes."
+	parser = argparse.ArgumentParser()
+	parser.add_argument("-c", "--config", default="/etc/parentopticon.toml", help="The config file to load.")
+	parser.add_argument("-H", "--host", default="0.0.0.0", help="The port/host to bind to.")
+	parser.add_argument("-p", "--port", type=int, default=13598, help="The port to run on.")
+	parser.add_argument("-w", "--workers", type=int, default=1, help="The number of worker processes.")
+	parser.add_argument("--profile", action="store_true",
+		help="Sample the stacks of each worker from the start, SIGUSR2 to a worker toggles it too.")
+	parser.add_argument("--profile-dir", default=log.data_path("profiles"),
+		help="The directory to write collapsed stack samples to.")
+	parser.add_argument("--verbose", action="store_true", help="Use verbose logging.")
+	args = parser.parse_args()
+
+	configuration = toml.load(args.config)
+	log_configuration = configuration.get("log", {})
+	log.setup(
+		level=logging.DEBUG if args.verbose else logging.INFO,
+		json_lines=log_configuration.get("json", False),
+		rate_limit=log_configuration.get("rate_limit"),
+		sample=log_configuration.get("sample"),
+	)
+	app.config.DATABASE = configuration.get("database", connection.DEFAULT_PATH)
+	app.config.MAX_SESSION_GAP_SECONDS = configuration.get(
+		"max_session_gap_seconds", accounting.MAX_GAP_SECONDS)
+	app.config.RETENTION = configuration.get("retention", {})
+	app.config.PROFILE = configuration.get("profile", {})
+	app.config.TEMPLATES = configuration.get("templates", {})
+	app.config.SAMPLER = {"directory": args.profile_dir, "enabled": args.profile}
+	# Only the workers sample, so a stray SIGUSR2 mustn't kill the main process.
+	signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+	# Workers inherit the config above rather than re-reading it.
+	Sanic.start_method = "fork"
+	LOGGER.info("Webserver starting with %d workers.", args.workers)
+	app.run(host=args.host, port=args.port, workers=args.workers, access_log=False)
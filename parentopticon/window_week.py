@@ -0,0 +1,142 @@
+"""
+Module for deciding when window weeks are locked.
+
+A window week is a set of spans of each day of the week during which its
+programs may run. Outside of those spans the programs are locked. An
+override replaces the spans of a window week for one particular date.
+
+Each calendar week is compiled into a sorted list of non-overlapping
+minute-of-week intervals so that lookups are a binary search.
+"""
+import bisect
+import datetime
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+# A span of minutes since midnight, start inclusive and end exclusive.
+Span = Tuple[int, int]
+
+class CompiledWeek:
+	"The open intervals of a single calendar week, in minutes since Monday."
+	def __init__(self, monday: datetime.date, intervals: Iterable[Span]) -> None:
+		self.monday = monday
+		merged = _merge(intervals)
+		self.starts = [start for start, _ in merged]
+		self.ends = [end for _, end in merged]
+
+	def minutes_until_lock(self, minute: int) -> int:
+		"Get the minutes from a minute of the week until the week locks."
+		i = bisect.bisect_right(self.starts, minute) - 1
+		if i < 0 or minute >= self.ends[i]:
+			return 0
+		return self.ends[i] - minute
+
+	@property
+	def open_at_start(self) -> bool:
+		"Whether the week is open from the first minute of Monday."
+		return bool(self.starts) and self.starts[0] == 0
+
+class Schedule:
+	"""A window week and its overrides, compiled one week at a time.
+
+	Args:
+		name: The name of the window week.
+		spans: The open spans for each weekday, Monday is 0.
+		overrides: The open spans for particular dates. A date with no spans
+			is locked all day.
+	"""
+	def __init__(self,
+		name: str,
+		spans: Mapping[int, Iterable[Span]],
+		overrides: Optional[Mapping[datetime.date, Iterable[Span]]] = None) -> None:
+		self.name = name
+		self.spans = {day: list(day_spans) for day, day_spans in spans.items()}
+		self.overrides = {day: list(day_spans) for day, day_spans in (overrides or {}).items()}
+		self._weeks: Dict[datetime.date, CompiledWeek] = {}
+
+	def is_locked(self, moment: datetime.datetime) -> bool:
+		"Check if programs in the window week are locked at a moment."
+		week, minute = self._locate(moment)
+		return week.minutes_until_lock(minute) == 0
+
+	def minutes_until_lock(self, moment: datetime.datetime) -> int:
+		"Get the minutes until the window week locks, 0 if already locked."
+		week, minute = self._locate(moment)
+		minutes = week.minutes_until_lock(minute)
+		if minutes and minute + minutes == MINUTES_PER_WEEK:
+			# Open through the end of the week, it may carry on into the next.
+			next_week = self.week(week.monday + datetime.timedelta(days=7))
+			minutes += next_week.minutes_until_lock(0)
+		return minutes
+
+	def week(self, day: datetime.date) -> CompiledWeek:
+		"Get the compiled calendar week that contains a day."
+		monday = day - datetime.timedelta(days=day.weekday())
+		compiled = self._weeks.get(monday)
+		if compiled is None:
+			compiled = self._compile(monday)
+			self._weeks[monday] = compiled
+		return compiled
+
+	def _compile(self, monday: datetime.date) -> CompiledWeek:
+		intervals = []
+		for weekday in range(7):
+			day = monday + datetime.timedelta(days=weekday)
+			day_spans = self.overrides.get(day, self.spans.get(weekday, []))
+			offset = weekday * MINUTES_PER_DAY
+			intervals.extend((offset + start, offset + end) for start, end in day_spans)
+		return CompiledWeek(monday, intervals)
+
+	def _locate(self, moment: datetime.datetime) -> Tuple[CompiledWeek, int]:
+		week = self.week(moment.date())
+		minute = moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+		return week, minute
+
+def format_spans(spans: Iterable[Span]) -> str:
+	"Turn spans into a string like '0800-1130,1300-2000'."
+	return ",".join("{}-{}".format(_format_minute(start), _format_minute(end)) for start, end in spans)
+
+def parse_spans(content: str) -> List[Span]:
+	"""Parse a string like '0800-1130,1300-2000' into spans.
+
+	Times are HHMM or HH, and '2400' is the end of the day.
+	"""
+	spans = []
+	for part in content.split(","):
+		part = part.strip()
+		if not part:
+			continue
+		start, _, end = part.partition("-")
+		span = (_parse_minute(start), _parse_minute(end))
+		if span[0] >= span[1]:
+			raise ValueError("Span '{}' ends before it starts".format(part))
+		spans.append(span)
+	return spans
+
+def _format_minute(minute: int) -> str:
+	return "{:02d}{:02d}".format(minute // 60, minute % 60)
+
+def _merge(intervals: Iterable[Span]) -> List[Span]:
+	"Sort intervals and merge any that overlap or touch."
+	merged = []
+	for start, end in sorted(intervals):
+		if merged and start <= merged[-1][1]:
+			merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+		else:
+			merged.append((start, end))
+	return merged
+
+def _parse_minute(content: str) -> int:
+	"Parse a time like 0735 into minutes since midnight."
+	content = content.strip()
+	if len(content) <= 2:
+		hour, minute = int(content), 0
+	elif len(content) == 4:
+		hour, minute = int(content[:2]), int(content[2:])
+	else:
+		raise ValueError("Can't parse '{}' as a time".format(content))
+	if minute >= 60 or hour * 60 + minute > MINUTES_PER_DAY:
+		raise ValueError("'{}' is not a time of day".format(content))
+	return hour * 60 + minute